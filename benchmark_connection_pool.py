@@ -0,0 +1,113 @@
+import argparse
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.request
+from urllib.parse import quote
+from constants import *
+from connection_pool import ConnectionPool
+from stand_in_server import start_stand_in_server
+
+########################################################################################################################
+# Downloads the same pages one after another from a local https stand-in server (see stand_in_server.py) three ways:   #
+# with urllib.request.urlopen, which opens a new connection for every page, and with a ConnectionPool with and without #
+# gzip, and prints the time each request took. The stand-in adds --connect-latency to setting up every connection and  #
+# --latency to every response, like the round trips to the real website. Needs the openssl command line tool to make   #
+# a self-signed certificate.                                                                                           #
+#     python benchmark_connection_pool.py --requests 200 --connect-latency 0.05 --latency 0.01                         #
+########################################################################################################################
+
+
+def make_certificate(directory):
+    """
+    Makes a self-signed certificate for 127.0.0.1
+    :return: PEM file holding the certificate and its private key
+    """
+    certificate_file = os.path.join(directory, "certificate.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", key_file, "-out", certificate_file],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(key_file) as key, open(certificate_file, "a") as certificate:
+        certificate.write(key.read())
+    return certificate_file
+
+
+def make_pages(directory, page_count, page_size):
+    """
+    Writes page_count recorded pages of about page_size bytes of table rows, which compress about as well as the real
+    website's pages
+    :return: list of their paths
+    """
+    paths = []
+    for page in range(page_count):
+        path = "/swimmer/{}".format(1000 + page)
+        row = "<tr><td class='event'>{}</td><td class='time'>{:.2f}</td></tr>\n"
+        rows = [row.format(event, 20 + (page * 7 + event) % 400 / 3) for event in range(page_size // 60)]
+        with open(os.path.join(directory, quote(path, safe="")), "w") as page_file:
+            page_file.write("<html><body><table>\n" + "".join(rows) + "</table></body></html>")
+        paths.append(path)
+    return paths
+
+
+def time_requests(download, urls):
+    """
+    :return: (list of seconds each request took, bytes of pages downloaded)
+    """
+    latencies = []
+    page_bytes = 0
+    for url in urls:
+        start = time.perf_counter()
+        page_bytes += len(download(url))
+        latencies.append(time.perf_counter() - start)
+    return latencies, page_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time requests with and without keep-alive connections over https")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=50, help="different pages the requests are spread over")
+    parser.add_argument("--page-size", type=int, default=40000, help="bytes in each page")
+    parser.add_argument("--connect-latency", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        certificate = make_certificate(scratch)
+        paths = make_pages(scratch, args.pages, args.page_size)
+        server = start_stand_in_server(scratch, 0, latency=args.latency, connect_latency=args.connect_latency,
+                                       certificate=certificate)
+        site_root = "https://127.0.0.1:{}".format(server.server_address[1])
+        urls = [site_root + paths[request % len(paths)] for request in range(args.requests)]
+        ssl_context = ssl.create_default_context(cafile=certificate)
+
+        pools = [ConnectionPool(accept_encoding=None, ssl_context=ssl_context),
+                 ConnectionPool(accept_encoding="gzip", ssl_context=ssl_context)]
+        clients = [("urlopen", lambda url: urllib.request.urlopen(url, timeout=FETCH_TIMEOUT,
+                                                                  context=ssl_context).read(), None),
+                   ("pool", pools[0].request, pools[0]),
+                   ("pool + gzip", pools[1].request, pools[1])]
+        print("{} requests for {} pages of {} bytes, {:.0f} ms to connect, {:.0f} ms to answer".format(
+            args.requests, args.pages, args.page_size, args.connect_latency * 1000, args.latency * 1000))
+        print("{:>12} {:>10} {:>10} {:>12} {:>12}".format("client", "mean", "median", "connections", "received"))
+        baseline = None
+        for name, download, pool in clients:
+            latencies, page_bytes = time_requests(download, urls)
+            mean = statistics.mean(latencies)
+            baseline = baseline or mean
+            # urlopen makes a connection and reads the whole uncompressed page for every request
+            connections = pool.counters[1] if pool else len(urls)
+            received = pool.counters[2] if pool else page_bytes
+            print("{:>12} {:8.1f}ms {:8.1f}ms {:>12} {:>10.1f}MB   {:.1f}x".format(
+                name, mean * 1000, statistics.median(latencies) * 1000, connections, received / 1024 ** 2,
+                baseline / mean))
+            if pool:
+                pool.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from constants import *
+import fetch
+from scheduler import RequestScheduler
+import crawler
+import crawl_workers
+import get_swim_data
+from stand_in_server import start_stand_in_server
+
+########################################################################################################################
+# Times the sequential scraper (get_swim_data.get_swim_data) against the asynchronous one (crawler.crawl) on the same  #
+# recorded pages, served by stand_in_server.py so nothing touches the real website. --latency adds a delay to every    #
+# response so the stand-in behaves more like a far away server. --workers also times crawl_workers.crawl_with_workers  #
+# with each of the given numbers of worker processes. Requests are held to the scheduler's default rate, as they are   #
+# on the website, unless --requests-per-second says otherwise (0 for no limit). At that rate the asynchronous scraper  #
+# and the workers only beat get_swim_data where waiting on the server and not the rate limit is what holds it back, so #
+# to see a speedup give the stand-in some latency, e.g.                                                                #
+#     python benchmark_crawler.py --directory ./recorded_pages --latency 0.3 --workers 3                               #
+# and to see how fast they go with no rate limit at all                                                                #
+#     python benchmark_crawler.py --directory ./recorded_pages --latency 0.05 --requests-per-second 0 --workers 1 2 4  #
+########################################################################################################################
+
+
+def count_swims(database_file_name):
+    connection = sqlite3.connect(database_file_name)
+    swim_count = connection.execute("SELECT count(*) FROM Swims").fetchone()[0]
+    connection.close()
+    return swim_count
+
+
+def time_scraper(name, scrape, database_file_name):
+    """
+    :param name: what to call the scraper in the printout
+    :param scrape: function that runs the scraper into database_file_name
+    :return: seconds the scraper took
+    """
+    start = time.time()
+    scrape()
+    elapsed = time.time() - start
+    print("{:>12}: {:8.2f} seconds, {} swims".format(name, elapsed, count_swims(database_file_name)))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sequential and asynchronous scrapers offline")
+    parser.add_argument("--directory", default=STAND_IN_PAGE_DIRECTORY, help="directory of recorded pages")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of delay added to every response")
+    parser.add_argument("--max-requests-per-host", type=int, default=CRAWLER_MAX_REQUESTS_PER_HOST)
+    parser.add_argument("--requests-per-second", type=float, default=SCHEDULER_REQUESTS_PER_SECOND,
+                        help="rate limit of the request scheduler, the one used on the website by default. 0 doesn't "
+                             "rate limit the stand-in")
+    parser.add_argument("--workers", type=int, nargs="*", default=[],
+                        help="numbers of worker processes to time crawl_workers.py with")
+    parser.add_argument("--year-start", type=int, default=DEFAULT_YEAR_START)
+    parser.add_argument("--year-end", type=int, default=DEFAULT_YEAR_END)
+    args = parser.parse_args()
+
+    server = start_stand_in_server(args.directory, 0, latency=args.latency)
+    fetch.use_site_root("http://127.0.0.1:{}".format(server.server_address[1]))
+    # both scrapers have to actually download every page for the comparison to mean anything, and nothing is archived
+    fetch.use_response_cache(None)
+    fetch.use_page_archive(None)
+    fetch.use_scheduler(RequestScheduler(args.requests_per_second or None))
+    with tempfile.TemporaryDirectory() as scratch:
+        sequential_file = os.path.join(scratch, "sequential.db")
+        asynchronous_file = os.path.join(scratch, "asynchronous.db")
+        # get_swim_data changes the lists it is given, so each scraper gets its own copies
+        sequential = time_scraper("sequential", lambda: get_swim_data.get_swim_data(
+            list(DEFAULT_TEAMS_TO_PULL), list(DEFAULT_GENDER), args.year_start, args.year_end,
+            list(DEFAULT_EVENTS_TO_PULL), sequential_file), sequential_file)
+        asynchronous = time_scraper("asynchronous", lambda: crawler.crawl(
+            list(DEFAULT_TEAMS_TO_PULL), list(DEFAULT_GENDER), args.year_start, args.year_end,
+            list(DEFAULT_EVENTS_TO_PULL), asynchronous_file, args.max_requests_per_host), asynchronous_file)
+        worker_times = []
+        for workers in args.workers:
+            workers_file = os.path.join(scratch, "workers_{}.db".format(workers))
+            elapsed = time_scraper("{} workers".format(workers), lambda: crawl_workers.crawl_with_workers(
+                list(DEFAULT_TEAMS_TO_PULL), list(DEFAULT_GENDER), args.year_start, args.year_end,
+                list(DEFAULT_EVENTS_TO_PULL), workers_file, workers), workers_file)
+            worker_times.append((workers, elapsed))
+    server.shutdown()
+    print("speedup: {:.1f}x".format(sequential / asynchronous))
+    for workers, elapsed in worker_times:
+        print("speedup with {} workers: {:.1f}x".format(workers, sequential / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import contextlib
+import io
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import unquote
+from constants import *
+import extraction
+from fetch import match_endpoint
+from fixture_pages import write_fixture_pages
+from get_swim_data import parse_swimmer_events, parse_roster, parse_team_results, parse_meet_event_ids, \
+    parse_relay_teams, parse_splash_splits
+from team_directory import parse_team_name
+
+########################################################################################################################
+# Times every extraction backend (see extraction.py) on the html pages recorded by stand_in_server.py, running the     #
+# same parser each scraper would run on each page. Prints pages parsed per second, the most memory in use at once      #
+# while parsing, and how many pages came out different from the "html.parser" backend (which should be none). Without  #
+# --directory it runs on the synthetic pages written by fixture_pages.py, so the results can be reproduced anywhere.   #
+#     python benchmark_extraction.py                                                                                   #
+#     python benchmark_extraction.py --directory ./recorded_pages --repeat 5                                           #
+########################################################################################################################
+
+
+def first_team_id(source):
+    """
+    :return: the first team linked to on a meet event page, which is whose relay teams get parsed
+    """
+    match = re.search(rb'href="/team/(\d+)"', source)
+    return match.group(1).decode() if match else "0"
+
+
+# {URL template name: function(source) that parses a page built from it}
+PARSERS = {"SWIMMER_URL": parse_swimmer_events,
+           "ROSTER_URL": parse_roster,
+           "RESULTS_URL": parse_team_results,
+           "MEET_URL": parse_meet_event_ids,
+           "MEET_EVENT_URL": lambda source: parse_relay_teams(source, first_team_id(source)),
+           "SPLASH_SPLITS_URL": parse_splash_splits,
+           "TEAM_URL": parse_team_name}
+
+
+def recorded_pages(page_directory):
+    """
+    :return: list of (endpoint, source) for every recorded page that one of PARSERS can parse
+    """
+    pages = []
+    for file_name in sorted(os.listdir(page_directory)):
+        endpoint = match_endpoint(unquote(file_name))[0]
+        if endpoint in PARSERS:
+            with open(os.path.join(page_directory, file_name), "rb") as page_file:
+                pages.append((endpoint, page_file.read()))
+    return pages
+
+
+def parse_all(pages):
+    # parse_team_results prints a line for every meet, which would drown out the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [PARSERS[endpoint](source) for endpoint, source in pages]
+
+
+def time_backend(backend, pages, repeat):
+    """
+    :return: (pages per second, peak bytes allocated, list of what was parsed from each page)
+    """
+    extraction.use_backend(backend)
+    tracemalloc.start()
+    parsed = parse_all(pages)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse_all(pages)
+    elapsed = time.perf_counter() - start
+    return len(pages) * repeat / elapsed, peak, parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the extraction backends on recorded pages")
+    parser.add_argument("--directory", help="directory of recorded pages (e.g. {}). Left out, the synthetic pages "
+                                            "from fixture_pages.py are used".format(STAND_IN_PAGE_DIRECTORY))
+    parser.add_argument("--repeat", type=int, default=3, help="times every page is parsed with each backend")
+    args = parser.parse_args()
+
+    if args.directory is None:
+        with tempfile.TemporaryDirectory() as page_directory:
+            write_fixture_pages(page_directory)
+            pages = recorded_pages(page_directory)
+    else:
+        pages = recorded_pages(args.directory)
+    print("{} pages, {:.1f} MB".format(len(pages), sum(len(source) for endpoint, source in pages) / 1024 ** 2))
+    expected = None
+    for backend in extraction.BACKENDS:
+        pages_per_second, peak, parsed = time_backend(backend, pages, args.repeat)
+        if expected is None:
+            expected = parsed
+        differences = sum(result != expected_result for result, expected_result in zip(parsed, expected))
+        print("{:>12}: {:9.1f} pages/second, {:8.2f} MB peak, {} pages parsed differently".format(
+            backend, pages_per_second, peak / 1024 ** 2, differences))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from constants import *
+from helperfunctions import sqlsafe
+from ingest import BulkIngestor, prepare_swims_table
+from migrations import migrate
+
+########################################################################################################################
+# Times writing a synthetic load of swims (and the swimmers they belong to) the old way, with one formatted execute    #
+# per row and a CHECK_* select before every swimmer, against ingest.BulkIngestor. Both are timed on a Swims table with #
+# only its uniqueness key (the user-006 schema) and on a fully migrated one, which also has the indexes of migration 2 #
+# (SwimsEventDate, SwimsTeamDate, and SwimsMeet), so what those indexes cost at ingest time is reported too.           #
+#     python benchmark_ingest.py --rows 1000000                                                                        #
+########################################################################################################################
+
+
+def synthetic_rows(row_count, swimmer_count):
+    """
+    :return: (swimmers, swims) where swimmers are (name, gender, swimmer_id, team_id) tuples and swims are tuples of the
+    values formatted into INSERT_SWIM_COMMAND. Every swimmer swims once a day, so no two swims share a natural key
+    """
+    random.seed(0)
+    events = [event for event in DEFAULT_EVENTS_TO_PULL if event[0] not in "MF"]
+    swimmers = [("Swimmer O'{}".format(swimmer_id), "F", swimmer_id, 184 + swimmer_id % 20)
+                for swimmer_id in range(1, swimmer_count + 1)]
+    swims = []
+    for row in range(row_count):
+        name, gender, swimmer_id, team_id = swimmers[row % swimmer_count]
+        swims.append((swimmer_id, team_id, round(random.uniform(20, 1000), 2), 0, 100000 + row % 500, gender,
+                      random.choice(events), 1538179200 + 86400 * (row // swimmer_count), 0, 1))
+    return swimmers, swims
+
+
+def create_tables(connection, indexed):
+    """
+    :param indexed: if True, migrate the database all the way, which adds the Swims indexes of migration 2. Otherwise
+    Swims only gets its uniqueness key and SyncState, which BulkIngestor keeps up to date
+    """
+    connection.execute(CREATE_SWIMMER_TABLE.format("Swimmers"))
+    if indexed:
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(connection)
+    else:
+        connection.execute(CREATE_SWIMS_TABLE)
+        prepare_swims_table(connection.cursor())
+        connection.commit()
+
+
+def row_by_row(connection, swimmers, swims):
+    cursor = connection.cursor()
+    for swimmer in swimmers:
+        if cursor.execute(CHECK_SWIMMER_TABLE.format("Swimmers", swimmer[2])).fetchone() is None:
+            cursor.execute(ADD_TO_SWIMMER_TABLE.format("Swimmers", sqlsafe(swimmer[0]), *swimmer[1:]))
+    for swim in swims:
+        cursor.execute(INSERT_SWIM_COMMAND.format(*swim))
+    connection.commit()
+
+
+def bulk(connection, swimmers, swims):
+    ingestor = BulkIngestor(connection)
+    for swimmer in swimmers:
+        ingestor.add_swimmer(*swimmer)
+    for swim in swims:
+        ingestor.add_swim(*swim)
+        ingestor.commit_if_due()
+    ingestor.commit()
+
+
+def time_ingest(name, ingest, database_file_name, swimmers, swims, indexed):
+    connection = sqlite3.connect(database_file_name)
+    create_tables(connection, indexed)
+    start = time.time()
+    ingest(connection, swimmers, swims)
+    elapsed = time.time() - start
+    stored = connection.execute("SELECT count(*) FROM Swims").fetchone()[0]
+    connection.close()
+    print("{:>12}: {:8.2f} seconds, {:10.0f} rows/second ({} swims stored)".format(name, elapsed,
+                                                                                  len(swims) / elapsed, stored))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row by row inserts with bulk ingestion")
+    parser.add_argument("--rows", type=int, default=1000000, help="number of synthetic swims to write")
+    parser.add_argument("--swimmers", type=int, default=10000, help="number of synthetic swimmers")
+    args = parser.parse_args()
+
+    swimmers, swims = synthetic_rows(args.rows, args.swimmers)
+    elapsed = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for indexed in (False, True):
+            print("Swims {} the migration 2 indexes".format("with" if indexed else "without"))
+            for name, ingest in [("row by row", row_by_row), ("bulk", bulk)]:
+                database_file_name = os.path.join(scratch, "{}_{}.db".format(ingest.__name__, indexed))
+                elapsed[name, indexed] = time_ingest(name, ingest, database_file_name, swimmers, swims, indexed)
+            print("speedup: {:.1f}x".format(elapsed["row by row", indexed] / elapsed["bulk", indexed]))
+    print("the migration 2 indexes make row by row ingest {:.1f}x and bulk ingest {:.1f}x slower".format(
+        elapsed["row by row", True] / elapsed["row by row", False], elapsed["bulk", True] / elapsed["bulk", False]))
+
+
+if __name__ == "__main__":
+    main()
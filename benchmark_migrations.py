@@ -0,0 +1,154 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+from constants import *
+from helperfunctions import convert_to_time
+from get_swim_data import scale_season_times, find_taper_swims
+from migrations import migrate, SCHEMA_VERSION
+
+########################################################################################################################
+# Times the queries that run on every pull and every analysis on a synthetic database made with the schema from before #
+# migrations.py (no keys or indexes on Swims, untyped Meets), then upgrades a copy of it with migrations.migrate and   #
+# times the same queries again. Also checks that every query gives the same result before and after.                   #
+#     python benchmark_migrations.py --teams 40 --seasons 4                                                            #
+########################################################################################################################
+
+LEGACY_CREATE_MEET_TABLE = "CREATE TABLE Meets (meet_id INTEGER, meet_name TEXT, meet_date TEXT, " \
+                           "meet_submitted INTEGER);"
+EVENTS = ["150Y", "1100Y", "1200Y", "1500Y", "2100Y", "2200Y", "3100Y", "4100Y"]
+
+
+def legacy_database(database_file_name, team_count, season_count, meet_count, roster_size):
+    """
+    Makes a database the way get_swim_data.py did before migrations.py, where every team swims meet_count meets a
+    season for season_count seasons starting in DEFAULT_YEAR_START, and every swimmer swims 3 events at each meet
+    :return: (number of swims, list of meet ids, list of (swimmer, event) pairs)
+    """
+    random.seed(0)
+    connection = sqlite3.connect(database_file_name)
+    connection.execute(CREATE_SWIMS_TABLE)
+    connection.execute(LEGACY_CREATE_MEET_TABLE)
+    swims = []
+    meets = []
+    for season in range(season_count):
+        season_start = convert_to_time(DEFAULT_YEAR_START + season, SEASON_LINE_MONTH, SEASON_LINE_DAY)
+        for team_id in range(1, team_count + 1):
+            for meet in range(meet_count):
+                meet_id = 100000 + len(meets)
+                date = season_start + 86400 * (1 + 7 * meet)
+                meets.append((meet_id, "Meet {}".format(meet_id), str(date), 1))
+                for swimmer in range(roster_size):
+                    swimmer_id = (team_id * roster_size + swimmer) * 10 + season
+                    for event in random.sample(EVENTS, 3):
+                        swims.append((swimmer_id, team_id, round(random.uniform(20, 600), 2), 0, meet_id,
+                                      "F" + event, date, 0, 1))
+    connection.executemany("INSERT INTO Swims VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?);", swims)
+    connection.executemany("INSERT INTO Meets VALUES(?, ?, ?, ?);", meets)
+    connection.commit()
+    connection.close()
+    return len(swims), [meet[0] for meet in meets], sorted({(swim[0], swim[5]) for swim in swims})
+
+
+def hot_queries(year_start, year_end, team_ids, meet_ids, swimmer_events):
+    """
+    :return: list of (name, function(cursor) returning what the query found) in the order they are run
+    """
+    def scaling(cursor):
+        scale_season_times(cursor, year_start, year_end, EVENTS, ["F"])
+        return np.array([row[0] for row in cursor.execute("SELECT scaled FROM Swims ORDER BY rowid;")])
+
+    def taper(cursor):
+        find_taper_swims(cursor, year_start, year_end, team_ids)
+        return cursor.execute("SELECT taper FROM Swims ORDER BY rowid;").fetchall()
+
+    def lineups(cursor):
+        return [sorted(cursor.execute("SELECT swimmer, event FROM Swims WHERE meet_id=?;", (meet_id,)))
+                for meet_id in meet_ids]
+
+    def athletes(cursor):
+        return sorted(cursor.execute("SELECT swimmer, event, min(time), count(*) FROM Swims GROUP BY swimmer, event;"))
+
+    def swimmer_history(cursor):
+        return [cursor.execute("SELECT date, time FROM Swims WHERE swimmer=? AND event=? ORDER BY date, time;",
+                               swimmer_event).fetchall() for swimmer_event in swimmer_events]
+
+    def meet_dates(cursor):
+        return [cursor.execute("SELECT CAST(meet_date AS REAL) FROM Meets WHERE meet_id=?;", (meet_id,)).fetchone()
+                for meet_id in meet_ids]
+
+    return [("scale seasons", scaling), ("find tapers", taper), ("meet lineups", lineups),
+            ("athlete stats", athletes), ("swimmer history", swimmer_history), ("meet dates", meet_dates)]
+
+
+def same_result(old_result, new_result):
+    # averages come out slightly differently depending on the order sqlite adds the times up in
+    if isinstance(old_result, np.ndarray):
+        return np.allclose(old_result, new_result, rtol=0, atol=1e-9)
+    return old_result == new_result
+
+
+def time_queries(database_file_name, queries):
+    """
+    :return: list of (seconds, result) for every query, in order
+    """
+    connection = sqlite3.connect(database_file_name)
+    cursor = connection.cursor()
+    timings = []
+    for name, query in queries:
+        start = time.perf_counter()
+        # the scaling and taper functions print a line for every season and event
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = query(cursor)
+        timings.append((time.perf_counter() - start, result))
+        connection.commit()
+    connection.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot queries before and after migrating the schema")
+    parser.add_argument("--teams", type=int, default=40)
+    parser.add_argument("--seasons", type=int, default=4)
+    parser.add_argument("--meets", type=int, default=15, help="meets each team swims a season")
+    parser.add_argument("--roster", type=int, default=30, help="swimmers on each team")
+    parser.add_argument("--sample", type=int, default=2000, help="meets and swimmers looked up one at a time")
+    args = parser.parse_args()
+
+    year_start = DEFAULT_YEAR_START
+    year_end = DEFAULT_YEAR_START + args.seasons
+    with tempfile.TemporaryDirectory() as scratch:
+        legacy_file = os.path.join(scratch, "legacy.db")
+        migrated_file = os.path.join(scratch, "migrated.db")
+        swim_count, meet_ids, swimmer_events = legacy_database(legacy_file, args.teams, args.seasons, args.meets,
+                                                               args.roster)
+        shutil.copy(legacy_file, migrated_file)
+        print("{} swims, {} meets, {} teams, {} seasons".format(swim_count, len(meet_ids), args.teams, args.seasons))
+
+        connection = sqlite3.connect(migrated_file)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(connection)
+        print("migrating to schema version {}: {:.2f} seconds".format(SCHEMA_VERSION, time.perf_counter() - start))
+        connection.close()
+
+        random.seed(1)
+        queries = hot_queries(year_start, year_end, list(range(1, args.teams + 1)),
+                              random.sample(meet_ids, min(args.sample, len(meet_ids))),
+                              random.sample(swimmer_events, min(args.sample, len(swimmer_events))))
+        before = time_queries(legacy_file, queries)
+        after = time_queries(migrated_file, queries)
+    print("{:>16} {:>10} {:>10} {:>8}".format("query", "before", "after", "speedup"))
+    for (name, query), (old, old_result), (new, new_result) in zip(queries, before, after):
+        differs = "" if same_result(old_result, new_result) else "  RESULTS DIFFER"
+        print("{:>16} {:9.3f}s {:9.3f}s {:7.1f}x{}".format(name, old, new, old / new, differs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from constants import *
+import process_swim_data
+from scoring_engine import ScoringEngine, score_matrix, matrix_workers
+
+########################################################################################################################
+# Times the steps of process_swim_data.py against the way they were done before they were vectorized, on a synthetic   #
+# dataset shaped like the one get_data reads from the database (--swimmers swimmers spread over --teams teams, each    #
+# with a few events they swim at several meets), and checks that both give the same result.                            #
+#     python benchmark_process_swim_data.py --swimmers 10000 --teams 40                                                #
+########################################################################################################################
+
+# (event, rough time in seconds) of the individual events, and the legs of the relays (L is the leadoff)
+INDIVIDUAL_EVENTS = [("150Y", 24), ("1100Y", 52), ("1200Y", 113), ("1500Y", 305), ("11650Y", 1040), ("2100Y", 58),
+                     ("2200Y", 126), ("3100Y", 65), ("3200Y", 141), ("4100Y", 56), ("4200Y", 127), ("5200Y", 128)]
+RELAY_LEGS = [("LF200Y", 24), ("1F200Y", 23), ("LM200Y", 27), ("2M200Y", 29), ("3M200Y", 25), ("4M200Y", 22)]
+
+
+def synthetic_data(swimmer_count, team_count, meet_count, seed=0):
+    """
+    :param swimmer_count: swimmers in the dataset, half of them men and half women
+    :param team_count: teams the swimmers are spread over
+    :param meet_count: meets every team swims in a season
+    :return: swims, swimmers, teams, event_list in the same form process_swim_data.get_data returns them
+    """
+    rng = np.random.default_rng(seed)
+    events = INDIVIDUAL_EVENTS + RELAY_LEGS
+    teams = pd.DataFrame({"team_name": ["Team {}".format(team_id) for team_id in range(1, team_count + 1)]},
+                         index=pd.Index(range(1, team_count + 1), name="team_id"))
+    swimmer_ids = np.arange(1001, 1001 + swimmer_count)
+    genders = np.where(np.arange(swimmer_count) % 2 == 0, "F", "M")
+    swimmers = pd.DataFrame({"athlete_name": ["Swimmer {}".format(swimmer_id) for swimmer_id in swimmer_ids],
+                             "gender": genders, "team_id": np.arange(swimmer_count) % team_count + 1},
+                            index=pd.Index(swimmer_ids, name="swimmer_id"))
+    rows = []
+    for index, swimmer_id in enumerate(swimmer_ids):
+        team_id = index % team_count + 1
+        ability = rng.normal(1.0, 0.05)
+        # every swimmer has a few events, swum at most of their team's meets
+        for event_index in rng.choice(len(events), 4, replace=False):
+            event, base_time = events[event_index]
+            meets = rng.choice(meet_count, rng.integers(1, meet_count + 1), replace=False)
+            for meet in meets:
+                meet_id = 100000 + team_id * meet_count + int(meet)
+                swim_time = round(base_time * ability * rng.normal(1.0, 0.02), 2)
+                rows.append((swimmer_id, team_id, swim_time, 0.0, meet_id, genders[index] + event,
+                             1546300800 + 7 * 24 * 60 * 60 * int(meet), 2, 0))
+    swims = pd.DataFrame(rows, columns=["swimmer", "team", "time", "scaled", "meet_id", "event", "date", "taper",
+                                        "snapshot"])
+    event_list = list(swims["event"].unique())
+    return swims, swimmers, teams, event_list
+
+
+def legacy_get_athlete_data(swims, swimmers, teams, event_list):
+    """
+    process_swim_data.get_athlete_data as it was before it was vectorized
+    """
+    grouped_dataset = swims.groupby(["swimmer", "event"])
+    swimmer_event_pairs_used = grouped_dataset.groups.keys()
+    team_data = []
+    for swimmer, swimmer_data in swimmers.iterrows():
+        team = teams.loc[swimmer_data["team_id"]]["team_name"]
+        for event in event_list:
+            if (swimmer, event) not in swimmer_event_pairs_used:
+                team_data.append({"swimmer_id": swimmer, "event": event, "team": team, "minimum_time": None,
+                                  "average_time": None, "median_time": None})
+            else:
+                individual_event_data = grouped_dataset.get_group((swimmer, event))
+                team_data.append({"swimmer_id": swimmer, "event": event, "team": team,
+                                  "minimum_time": individual_event_data["time"].min(),
+                                  "average_time": individual_event_data["time"].mean(),
+                                  "median_time": individual_event_data["time"].median()})
+    return pd.DataFrame(team_data, columns=["swimmer_id", "event", "team", "minimum_time", "average_time",
+                                            "median_time"])
+
+
+def legacy_get_predicted_performance_matrix(team_data, preference):
+    """
+    process_swim_data.get_predicted_performance_matrix as it was before it was a pivot
+    """
+    athlete_prediction_dictionary = {}
+    for athlete, athlete_data in team_data.groupby("swimmer_id"):
+        individual_data = athlete_data.loc[:, ["event", preference]].T
+        individual_data.columns = individual_data.iloc[0]
+        individual_data = individual_data.drop(individual_data.index[0])
+        athlete_prediction_dictionary[athlete] = individual_data.to_dict("records")[0]
+    return pd.DataFrame.from_dict(athlete_prediction_dictionary, orient="index")
+
+
+def time_call(function, *args):
+    """
+    :return: (what function returned, seconds it took)
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def compare(name, legacy, current):
+    """
+    Prints how long the legacy and current versions of a step took
+    :param legacy: (result, seconds) of the old version
+    :param current: (result, seconds) of the new one
+    """
+    print("{:>20}: {:9.3f} s before {:9.4f} s now   {:8.1f}x".format(name, legacy[1], current[1],
+                                                                      legacy[1] / current[1]))
+
+
+def benchmark_athlete_data(swims, swimmers, teams, event_list):
+    """
+    :return: what process_swim_data.get_athlete_data returned, for the steps after it
+    """
+    legacy = time_call(legacy_get_athlete_data, swims, swimmers, teams, event_list)
+    current = time_call(process_swim_data.get_athlete_data, swims, swimmers, teams, event_list)
+    # grouped means are summed with compensated summation rather than numpy's pairwise sum, so they can differ from a
+    # single group's mean in the last bit. Everything else has to be exactly the same
+    pd.testing.assert_frame_equal(current[0].drop(columns="average_time"),
+                                  legacy[0].drop(columns="average_time"), check_exact=True)
+    pd.testing.assert_series_equal(current[0]["average_time"], legacy[0]["average_time"], check_exact=False,
+                                   rtol=1e-12)
+    compare("get_athlete_data", legacy, current)
+    return current[0]
+
+
+def benchmark_performance_matrix(team_data):
+    """
+    Times get_predicted_performance_matrix for every preference, and get_predicted_performance_array for all of them
+    at once, against the legacy matrix for each preference
+    """
+    legacy_matrices = []
+    legacy_seconds = current_seconds = 0
+    for preference in process_swim_data.PREDICTION_PREFERENCES:
+        legacy = time_call(legacy_get_predicted_performance_matrix, team_data, preference)
+        current = time_call(process_swim_data.get_predicted_performance_matrix, team_data, preference)
+        pd.testing.assert_frame_equal(current[0], legacy[0], check_exact=True)
+        legacy_matrices.append(legacy[0])
+        legacy_seconds += legacy[1]
+        current_seconds += current[1]
+    compare("performance matrix", (None, legacy_seconds), (None, current_seconds))
+    current = time_call(process_swim_data.get_predicted_performance_array, team_data)
+    performances, swimmer_ids, events = current[0]
+    for matrix, legacy_matrix in zip(performances, legacy_matrices):
+        pd.testing.assert_frame_equal(pd.DataFrame(matrix, index=swimmer_ids, columns=events), legacy_matrix,
+                                      check_exact=True, check_index_type=False, check_column_type=False)
+    compare("performance array", (None, legacy_seconds), current)
+
+
+def benchmark_lineups(swims, swimmers, teams, event_list, team_count):
+    """
+    Times get_team_lineups for every meet of the first team_count teams against calling get_team_lineup for each meet
+    """
+    team_ids = list(teams.index[:team_count])
+    meet_ids = sorted(swims.loc[swims["team"].isin(team_ids), "meet_id"].unique())
+    team_swimmers = swimmers[swimmers["team_id"].isin(team_ids)]
+    start = time.perf_counter()
+    legacy_lineups = [process_swim_data.get_team_lineup(swims, swimmers, teams, event_list, meet_id).loc[
+                          team_swimmers.index] for meet_id in meet_ids]
+    legacy_seconds = time.perf_counter() - start
+    current = time_call(process_swim_data.get_team_lineups, swims, swimmers, event_list, meet_ids, team_ids)
+    lineups, swimmer_ids, events = current[0]
+    for lineup, legacy_lineup in zip(lineups, legacy_lineups):
+        pd.testing.assert_frame_equal(pd.DataFrame(lineup.astype(int), index=swimmer_ids, columns=events),
+                                      legacy_lineup, check_names=False, check_index_type=False,
+                                      check_column_type=False)
+    compare("{} lineups".format(len(meet_ids)), (None, legacy_seconds), current)
+
+
+def benchmark_scoring(team_data, swimmers, matchups, seed=0):
+    """
+    Scores random dual meets between the first two teams with calculate_pred_score and ScoringEngine, checks that they
+    give the same scores, and prints how long a single meet takes to score with each, both the first time and again
+    with lineups ScoringEngine.score_meet has already lowered
+    :param matchups: number of random pairs of lineups to score
+    """
+    rng = np.random.default_rng(seed)
+    performances = process_swim_data.get_predicted_performance_matrix(team_data, "average_time")
+    # rounding to tenths makes ties, including between the two teams
+    performances = performances.round(1)
+    team_ids = swimmers["team_id"].unique()[:2]
+    team_performances = [process_swim_data.filter_by_team(performances, swimmers, team_id) for team_id in team_ids]
+    engine = ScoringEngine(performances.columns)
+    legacy_seconds = lower_seconds = score_seconds = again_seconds = 0
+    for matchup in range(matchups):
+        lineups = [pd.DataFrame((rng.random(team.shape) < 0.15).astype(int), index=team.index, columns=team.columns)
+                   for team in team_performances]
+        teams = list(zip(team_performances, lineups))
+        if matchup % 10 == 0:
+            # a team against itself, which ties every event
+            teams[1] = teams[0]
+        legacy = time_call(process_swim_data.calculate_pred_score, *teams[0], *teams[1])
+        lowered = time_call(lambda: [engine.lower(*team) for team in teams])
+        current = time_call(engine.score, *lowered[0])
+        np.testing.assert_allclose(current[0], legacy[0], rtol=1e-12)
+        # the first score_meet lowers both lineups, the second one finds them already lowered
+        engine.score_meet(*teams)
+        again = time_call(engine.score_meet, *teams)
+        np.testing.assert_allclose(again[0], legacy[0], rtol=1e-12)
+        legacy_seconds += legacy[1]
+        lower_seconds += lowered[1]
+        score_seconds += current[1]
+        again_seconds += again[1]
+    print("{:>20}: {:9.1f} us before {:9.1f} us now   {:8.1f}x  ({:.1f} us of it lowering the lineups)".format(
+        "score a dual meet", legacy_seconds / matchups * 1e6, (lower_seconds + score_seconds) / matchups * 1e6,
+        legacy_seconds / (lower_seconds + score_seconds), lower_seconds / matchups * 1e6))
+    print("{:>20}: {:9.1f} us before {:9.1f} us now   {:8.1f}x  (lineups already lowered)".format(
+        "score it again", legacy_seconds / matchups * 1e6, again_seconds / matchups * 1e6,
+        legacy_seconds / again_seconds))
+
+
+def random_lineups(team_performances, lineup_count, rng):
+    """
+    :return: numpy array of bools of shape (lineup_count, swimmers, events) with random lineups for the team
+    """
+    return rng.random((lineup_count,) + team_performances.shape) < 0.15
+
+
+def benchmark_score_matrix(team_data, swimmers, lineup_count, workers, seed=0):
+    """
+    Checks score_matrix against pred_score_matrix on a few random lineups of the first two teams, and a three team
+    matrix against calculate_pred_score, then times pred_score_matrix and score_matrix on lineup_count lineups a team
+    :param workers: list of numbers of processes to time score_matrix with, besides 1. Numbers score_matrix would
+    bring down to one it has timed already (see scoring_engine.matrix_workers) are skipped
+    """
+    rng = np.random.default_rng(seed)
+    performances = process_swim_data.get_predicted_performance_matrix(team_data, "average_time").round(1)
+    team_performances = [process_swim_data.filter_by_team(performances, swimmers, team_id)
+                         for team_id in swimmers["team_id"].unique()[:3]]
+    lineups = [random_lineups(team, lineup_count, rng) for team in team_performances]
+    frames = [[pd.DataFrame(lineup.astype(int), index=team.index, columns=team.columns) for lineup in team_lineups]
+              for team, team_lineups in zip(team_performances, lineups)]
+
+    checked = min(lineup_count, 8)
+    legacy = process_swim_data.pred_score_matrix(team_performances[:2], [frames[0][:checked], frames[1][:checked]])
+    current = score_matrix(team_performances[:2], [frames[0][:checked], lineups[1][:checked]])
+    np.testing.assert_allclose(current, np.array(legacy, dtype=float), rtol=1e-12)
+    # in a three team meet every team's score is the sum of its scores in the dual meets against the other two
+    current = score_matrix(team_performances, [team_lineups[:checked] for team_lineups in lineups])
+    for combination in rng.integers(checked, size=(10, 3)):
+        expected = np.zeros(3)
+        for team_a, team_b in [(0, 1), (0, 2), (1, 2)]:
+            expected[[team_a, team_b]] += process_swim_data.calculate_pred_score(
+                team_performances[team_a], frames[team_a][combination[team_a]],
+                team_performances[team_b], frames[team_b][combination[team_b]])
+        np.testing.assert_allclose(current[tuple(combination)], expected, rtol=1e-12)
+
+    # pred_score_matrix takes too long to run on every lineup, so its time is worked out from a smaller matrix
+    sample = min(lineup_count, 20)
+    legacy = time_call(process_swim_data.pred_score_matrix, team_performances[:2],
+                       [frames[0][:sample], frames[1][:sample]])
+    legacy_seconds = legacy[1] * (lineup_count / sample) ** 2
+    timed = set()
+    for worker_count in [1] + workers:
+        used = matrix_workers([lineup_count, lineup_count], worker_count)
+        if used in timed:
+            print("{:>20}: skipped, score_matrix would use {} worker{} for {} meets".format(
+                "{} workers".format(worker_count), used, "s" if used > 1 else "", lineup_count ** 2))
+            continue
+        timed.add(used)
+        current = time_call(score_matrix, team_performances[:2], lineups[:2], "Six Lane", worker_count)
+        compare("{}x{} {} worker{}".format(lineup_count, lineup_count, used, "s" if used > 1 else ""),
+                (None, legacy_seconds), current)
+    current = time_call(score_matrix, team_performances, lineups)
+    print("{:>20}: {:9.4f} s for {} three team meets".format("3 team tensor", current[1], lineup_count ** 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the vectorized steps of process_swim_data.py")
+    parser.add_argument("--swimmers", type=int, default=10000)
+    parser.add_argument("--teams", type=int, default=40)
+    parser.add_argument("--meets", type=int, default=12, help="meets every team swims")
+    parser.add_argument("--lineup-teams", type=int, default=2, help="teams to find the lineups of every meet for")
+    parser.add_argument("--matchups", type=int, default=200, help="random dual meets to score")
+    parser.add_argument("--lineups", type=int, default=200, help="random lineups a team for the score matrices")
+    parser.add_argument("--workers", type=int, nargs="*", default=[],
+                        help="numbers of processes to time the score matrix with, besides 1. score_matrix starts at "
+                             "most one a core, and none for small matrices")
+    args = parser.parse_args()
+
+    swims, swimmers, teams, event_list = synthetic_data(args.swimmers, args.teams, args.meets)
+    print("{} swims by {} swimmers on {} teams in {} events".format(len(swims), len(swimmers), len(teams),
+                                                                   len(event_list)))
+    team_data = benchmark_athlete_data(swims, swimmers, teams, event_list)
+    benchmark_performance_matrix(team_data)
+    benchmark_lineups(swims, swimmers, teams, event_list, args.lineup_teams)
+    benchmark_scoring(team_data, swimmers, args.matchups)
+    benchmark_score_matrix(team_data, swimmers, args.lineups, args.workers)
+
+
+if __name__ == "__main__":
+    main()
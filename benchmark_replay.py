@@ -0,0 +1,118 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from constants import *
+import fetch
+from page_archive import PageArchive
+from scheduler import RequestScheduler
+from crawl_metrics import get_metrics
+import crawler
+import crawl_workers
+import get_swim_data
+from stand_in_server import start_stand_in_server
+
+########################################################################################################################
+# Runs a whole pull (by default Bucknell and Lehigh for DEFAULT_YEAR_START) against a page archive (see                #
+# page_archive.py) instead of the website, so the time it takes only depends on the code: downloading, parsing, and    #
+# writing the database, with the network taken out. Prints the wall time, requests a second, and rows written a second #
+# of every run. --record records the archive first, from the real website or, with --directory, from recorded pages    #
+# served by the stand-in server.                                                                                       #
+#     python benchmark_replay.py --archive bucknell_lehigh.db --record --directory ./recorded_pages                    #
+#     python benchmark_replay.py --archive bucknell_lehigh.db --scraper asynchronous --repeat 5                        #
+########################################################################################################################
+
+TABLES = ["Teams", "Swimmers", "Swims", "Meets", "MeetRelays"]
+
+
+def count_rows(database_file_name):
+    """
+    :return: number of rows in every table a pull fills
+    """
+    connection = sqlite3.connect(database_file_name)
+    row_count = sum(connection.execute("SELECT count(*) FROM {}".format(table)).fetchone()[0] for table in TABLES)
+    connection.close()
+    return row_count
+
+
+def run_pull(scraper, database_file_name, args):
+    """
+    Runs a pull of the benchmark's teams, genders, and seasons into database_file_name
+    :param scraper: "sequential" (get_swim_data.py), "asynchronous" (crawler.py), or "workers" (crawl_workers.py)
+    """
+    # get_swim_data changes the lists it is given, so every run gets its own copies
+    pull = (list(DEFAULT_TEAMS_TO_PULL), list(args.genders), args.year_start, args.year_end,
+            list(DEFAULT_EVENTS_TO_PULL), database_file_name)
+    if scraper == "sequential":
+        get_swim_data.get_swim_data(*pull)
+    elif scraper == "asynchronous":
+        crawler.crawl(*pull)
+    else:
+        crawl_workers.crawl_with_workers(*pull, workers=args.workers)
+
+
+def record(args):
+    """
+    Runs the pull once with every page it fetches recorded in the archive
+    """
+    server = None
+    if args.directory:
+        server = start_stand_in_server(args.directory, 0)
+        fetch.use_site_root("http://127.0.0.1:{}".format(server.server_address[1]))
+        # the stand-in doesn't need to be treated gently
+        fetch.use_scheduler(RequestScheduler(None))
+    archive = PageArchive(args.archive)
+    fetch.use_page_archive(archive, "record")
+    with tempfile.TemporaryDirectory() as scratch:
+        run_pull("sequential", os.path.join(scratch, "recorded.db"), args)
+    fetch.use_page_archive(None)
+    fetch.use_site_root(None)
+    if server is not None:
+        server.shutdown()
+    print("recorded {} pages ({:.1f} MB, {:.1f} MB compressed) in {}".format(
+        archive.counters[0], archive.counters[1] / 1024 ** 2, archive.counters[2] / 1024 ** 2, args.archive))
+    archive.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a whole pull replayed from a page archive")
+    parser.add_argument("--archive", default=PAGE_ARCHIVE_FILE_NAME)
+    parser.add_argument("--record", action="store_true", help="record the archive before replaying it")
+    parser.add_argument("--directory", default=None,
+                        help="record from the stand-in server serving this directory instead of the real website")
+    parser.add_argument("--scraper", choices=["sequential", "asynchronous", "workers"], default="sequential")
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS, help="worker processes for --scraper workers")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--genders", nargs="+", default=DEFAULT_GENDER)
+    parser.add_argument("--year-start", type=int, default=DEFAULT_YEAR_START)
+    parser.add_argument("--year-end", type=int, default=DEFAULT_YEAR_END)
+    args = parser.parse_args()
+
+    if args.record:
+        record(args)
+    archive = PageArchive(args.archive)
+    fetch.use_page_archive(archive, "replay")
+    runs = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for run in range(args.repeat):
+            database_file_name = os.path.join(scratch, "replay_{}.db".format(run))
+            start = time.time()
+            run_pull(args.scraper, database_file_name, args)
+            elapsed = time.time() - start
+            # every pull records its requests in its own crawl metrics, which the workers' are added to
+            requests = sum(endpoint["requests"] for endpoint in get_metrics().summary()["endpoints"].values())
+            runs.append((elapsed, requests, count_rows(database_file_name)))
+    archive.close()
+    print("{} replayed from {}".format(args.scraper, args.archive))
+    print("{:>5} {:>10} {:>10} {:>12} {:>8} {:>10}".format("run", "seconds", "requests", "requests/s", "rows",
+                                                           "rows/s"))
+    for run, (elapsed, requests, rows) in enumerate(runs, 1):
+        print("{:>5} {:>10.2f} {:>10} {:>12.1f} {:>8} {:>10.1f}".format(run, elapsed, requests, requests / elapsed,
+                                                                        rows, rows / elapsed))
+    print("median: {:.2f} seconds".format(statistics.median(run[0] for run in runs)))
+
+
+if __name__ == "__main__":
+    main()
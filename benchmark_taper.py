@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from constants import *
+from helperfunctions import convert_to_time
+from get_swim_data import find_taper_swims
+
+########################################################################################################################
+# Times the old taper classification loop (a count and an average query for every day every team swam, then an UPDATE #
+# per day) against get_swim_data.find_taper_swims on the same synthetic multi-season database, and checks that both   #
+# fill out the taper column the same way.                                                                              #
+#     python benchmark_taper.py --teams 10 --seasons 4                                                                 #
+########################################################################################################################
+
+
+def legacy_find_taper_swims(cursor, year_start, year_end, teams_to_pull):
+    """
+    find_taper_swims as it was before it was vectorized
+    """
+    for simple_year in range(year_start, year_end):
+        season_start_timestamp = convert_to_time(int(simple_year), SEASON_LINE_MONTH, SEASON_LINE_DAY)
+        season_end_timestamp = convert_to_time(int(simple_year) + 1, SEASON_LINE_MONTH, SEASON_LINE_DAY)
+        for team_id in teams_to_pull:
+            cursor.execute("SELECT date FROM Swims WHERE team={} AND date>{} AND date<{}".format(team_id,
+                                                                                                 season_start_timestamp,
+                                                                                                 season_end_timestamp))
+            dates = list(set(cursor.fetchall()))
+            meet_scores = []
+            average_score = 0
+            for date in dates:
+                cursor.execute("SELECT count(*) FROM Swims WHERE team={} AND date={}".format(team_id, date[0]))
+                if cursor.fetchone()[0] != 7:
+                    cursor.execute("SELECT avg(scaled) FROM Swims WHERE team={} AND date={}".format(team_id, date[0]))
+                    meet_tuple = (cursor.fetchone()[0], date[0])
+                    average_score += meet_tuple[0]
+                    meet_scores.append(meet_tuple)
+            average_score /= len(dates)
+            for date in meet_scores:
+                if date[0] < average_score:
+                    cursor.execute("UPDATE Swims SET taper=1 WHERE team={} AND date={}".format(team_id, date[1]))
+                else:
+                    cursor.execute("UPDATE Swims SET taper=2 WHERE team={} AND date={}".format(team_id, date[1]))
+    cursor.execute("UPDATE Swims SET taper=3 WHERE scaled>3")
+
+
+def synthetic_database(database_file_name, team_count, season_count, meet_count, swims_per_meet):
+    """
+    Fills a Swims table with team_count teams that each swim meet_count meets a season for season_count seasons
+    starting in DEFAULT_YEAR_START. Some days have exactly 7 swims, which the classification leaves out
+    """
+    random.seed(0)
+    connection = sqlite3.connect(database_file_name)
+    connection.execute(CREATE_SWIMS_TABLE)
+    rows = []
+    for season in range(season_count):
+        season_start = convert_to_time(DEFAULT_YEAR_START + season, SEASON_LINE_MONTH, SEASON_LINE_DAY)
+        for team_id in range(1, team_count + 1):
+            for meet in range(meet_count):
+                date = season_start + 86400 * (1 + 7 * meet)
+                swim_count = 7 if random.random() < 0.05 else random.randint(swims_per_meet // 2, swims_per_meet)
+                # taper meets come at the end of the season and are faster
+                speed = -0.5 if meet >= meet_count - 3 else 0.2
+                for swim in range(swim_count):
+                    rows.append((random.randint(1, 100000), team_id, 60.0, random.gauss(speed, 1.2),
+                                 100000 + meet, "F150Y", date, 0, 1))
+    connection.executemany("INSERT INTO Swims VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?);", rows)
+    connection.commit()
+    connection.close()
+    return len(rows)
+
+
+def time_classification(name, classify, database_file_name, year_start, year_end, team_ids):
+    connection = sqlite3.connect(database_file_name)
+    start = time.time()
+    classify(connection.cursor(), year_start, year_end, team_ids)
+    connection.commit()
+    elapsed = time.time() - start
+    tapers = connection.execute("SELECT taper FROM Swims ORDER BY rowid;").fetchall()
+    connection.close()
+    print("{:>12}: {:8.2f} seconds".format(name, elapsed))
+    return elapsed, tapers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the old taper loop with the vectorized classification")
+    parser.add_argument("--teams", type=int, default=10)
+    parser.add_argument("--seasons", type=int, default=4)
+    parser.add_argument("--meets", type=int, default=20, help="meets each team swims a season")
+    parser.add_argument("--swims-per-meet", type=int, default=120)
+    args = parser.parse_args()
+
+    year_start = DEFAULT_YEAR_START
+    year_end = DEFAULT_YEAR_START + args.seasons
+    team_ids = list(range(1, args.teams + 1))
+    with tempfile.TemporaryDirectory() as scratch:
+        legacy_file = os.path.join(scratch, "legacy.db")
+        vectorized_file = os.path.join(scratch, "vectorized.db")
+        swim_count = synthetic_database(legacy_file, args.teams, args.seasons, args.meets, args.swims_per_meet)
+        shutil.copy(legacy_file, vectorized_file)
+        print("{} swims, {} teams, {} seasons".format(swim_count, args.teams, args.seasons))
+        old, old_tapers = time_classification("loop", legacy_find_taper_swims, legacy_file, year_start, year_end,
+                                              team_ids)
+        new, new_tapers = time_classification("vectorized", find_taper_swims, vectorized_file, year_start, year_end,
+                                              team_ids)
+    differences = sum(old_taper != new_taper for old_taper, new_taper in zip(old_tapers, new_tapers))
+    print("speedup: {:.1f}x, {} swims classified differently".format(old / new, differences))
+
+
+if __name__ == "__main__":
+    main()
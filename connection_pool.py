@@ -0,0 +1,160 @@
+import gzip
+import http.client
+import io
+import ssl
+import threading
+import urllib.request
+import zlib
+from urllib.error import HTTPError
+from urllib.parse import urlsplit, urljoin
+from constants import *
+
+########################################################################################################################
+# urllib.request.urlopen opens a new connection (and for https does a new TLS handshake) for every page, then throws   #
+# it away. ConnectionPool keeps connections open after a page has been read and sends the next request to the same     #
+# host down one of them instead, so a pull pays for the handshakes once per connection rather than once per page. Up   #
+# to CONNECTION_POOL_SIZE idle connections are kept per host. Pages are asked for gzip or deflate compressed           #
+# (CONNECTION_POOL_ACCEPT_ENCODING) and decompressed here, so callers always get the plain page. Errors come out as    #
+# the same HTTPError urlopen raises, and redirects are followed like urlopen follows them.                             #
+########################################################################################################################
+
+REDIRECT_STATUS_CODES = {301, 302, 303, 307, 308}
+# what a connection that sat idle for too long looks like once the server has closed its end
+STALE_CONNECTION_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, http.client.BadStatusLine)
+
+
+def decode_body(body, content_encoding):
+    """
+    :param body: body of a response, as it came over the wire
+    :param content_encoding: the response's Content-Encoding header, or None
+    :return: the body decompressed
+    """
+    content_encoding = (content_encoding or "identity").strip().lower()
+    if content_encoding in ("gzip", "x-gzip"):
+        return gzip.decompress(body)
+    if content_encoding == "deflate":
+        # deflate is meant to have a zlib header, but some servers send the raw stream
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class ConnectionPool:
+    def __init__(self, size=CONNECTION_POOL_SIZE, accept_encoding=CONNECTION_POOL_ACCEPT_ENCODING, ssl_context=None,
+                 timeout=FETCH_TIMEOUT):
+        """
+        :param size: most idle connections kept open to a single host. More than this can be open at once while
+        requests are going, the extras are closed once they're done
+        :param accept_encoding: value of the Accept-Encoding header, or None to ask for pages uncompressed
+        :param ssl_context: ssl.SSLContext for https connections. None uses the system's trusted certificates
+        :param timeout: seconds to wait on a connection before giving up on it
+        """
+        self.size = size
+        self.ssl_context = ssl_context if ssl_context is not None else ssl.create_default_context()
+        self.timeout = timeout
+        self.headers = {"User-Agent": "Python-urllib/" + urllib.request.__version__, "Connection": "keep-alive"}
+        if accept_encoding:
+            self.headers["Accept-Encoding"] = accept_encoding
+        # {(scheme, host): list of idle connections, the most recently used last}
+        self.idle = {}
+        self.lock = threading.Lock()
+        # [requests sent, connections opened, bytes received, bytes after decompressing]
+        self.counters = [0, 0, 0, 0]
+
+    def count(self, requests=0, connections=0, received=0, decoded=0):
+        with self.lock:
+            self.counters[0] += requests
+            self.counters[1] += connections
+            self.counters[2] += received
+            self.counters[3] += decoded
+
+    def connect(self, scheme, host):
+        self.count(connections=1)
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, timeout=self.timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def take(self, key):
+        """
+        :return: an idle connection to the host, or None if there aren't any
+        """
+        with self.lock:
+            connections = self.idle.get(key)
+            return connections.pop() if connections else None
+
+    def give_back(self, key, connection):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.size:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def send(self, url):
+        """
+        Sends a single GET, on an idle connection if there is one
+        :return: (status, reason, headers, body) of the response, with the body decompressed
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        connection = self.take(key)
+        reused = connection is not None
+        if not reused:
+            connection = self.connect(*key)
+        try:
+            connection.request("GET", path, headers=self.headers)
+            response = connection.getresponse()
+            body = response.read()
+        except STALE_CONNECTION_ERRORS:
+            connection.close()
+            if reused:
+                # the server closed it while it sat in the pool, which isn't the page's fault
+                return self.send(url)
+            raise
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self.give_back(key, connection)
+        page = decode_body(body, response.getheader("Content-Encoding"))
+        self.count(requests=1, received=len(body), decoded=len(page))
+        return response.status, response.reason, response.headers, page
+
+    def request(self, url):
+        """
+        :param url: http or https url of a page
+        :return: body of the page, in bytes
+        raises HTTPError (like urllib.request.urlopen) if the server answers with an error
+        """
+        for redirect in range(CONNECTION_POOL_MAX_REDIRECTS + 1):
+            status, reason, headers, body = self.send(url)
+            if status in REDIRECT_STATUS_CODES and headers.get("Location"):
+                url = urljoin(url, headers["Location"])
+                continue
+            if status >= 400:
+                raise HTTPError(url, status, reason, headers, io.BytesIO(body))
+            return body
+        raise HTTPError(url, status, "too many redirects", headers, io.BytesIO(body))
+
+    def close(self):
+        """
+        Closes every idle connection
+        """
+        with self.lock:
+            connections = [connection for host_connections in self.idle.values() for connection in host_connections]
+            self.idle = {}
+        for connection in connections:
+            connection.close()
+
+    def report(self):
+        """
+        Prints how many requests went down how many connections, and how much compression saved
+        """
+        requests, connections, received, decoded = self.counters
+        print("{} requests over {} connections, {:.1f} MB received for {:.1f} MB of pages".format(
+            requests, connections, received / 1024 ** 2, decoded / 1024 ** 2))
@@ -10,7 +10,8 @@ SEASON_LINE_DAY = 15
 # Constants for get_team_data                            #
 ##########################################################
 
-# URL's for pulling data from
+# URL's for pulling data from. Every one of them starts with SITE_ROOT (fetch.py relies on this)
+SITE_ROOT = "https://www.collegeswimming.com"
 SWIMMER_URL = "https://www.collegeswimming.com/swimmer/{}"
 SWIMMER_EVENT_URL = "https://www.collegeswimming.com/swimmer/{}/times/byeventid/{}"
 ROSTER_URL = "https://www.collegeswimming.com/team/{}/roster/?page=1&gender={}&season={}"
@@ -18,11 +19,15 @@ RESULTS_URL = "https://www.collegeswimming.com/team/{}/results/?page=1&name=&mee
 MEET_URL = "https://www.collegeswimming.com/results/{}/?gender={}"
 MEET_EVENT_URL = "https://www.collegeswimming.com/results/{}/event/{}/"
 SPLASH_SPLITS_URL = "https://www.collegeswimming.com/times/{}/splashsplits/"
+TEAM_URL = "https://www.collegeswimming.com/team/{}"
+# seconds to wait on a page before giving up on it
+FETCH_TIMEOUT = 60
 
 # Missing data in createXYZTable is filled in by data put into insertXYZCommand using .format()
 # Constants for creating and inserting to a table of swim times
 CREATE_SWIMS_TABLE = "CREATE TABLE IF NOT EXISTS Swims (swimmer INTEGER, team INTEGER, time REAL, scaled REAL, meet_id INTEGER, event TEXT, date INTEGER, taper INTEGER, snapshot INTEGER);"
-INSERT_SWIM_COMMAND = "INSERT INTO Swims VALUES({}, {}, {}, {}, {}, '{}{}', {}, {}, {});"
+INSERT_SWIM_COMMAND = "INSERT INTO Swims (swimmer, team, time, scaled, meet_id, event, date, taper, snapshot) " \
+                      "VALUES({}, {}, {}, {}, {}, '{}{}', {}, {}, {});"
 # Constants for creating and inserting to a table of snapshots NOTE: this seems more like a poorly implemented log...
 CREATE_SNAPSHOT_TABLE_COMMAND = "CREATE TABLE IF NOT EXISTS Snapshots (snapshot INTEGER, date TEXT, teams TEXT, events TEXT);"
 INSERT_SNAPSHOT_COMMAND = "INSERT INTO Snapshots VALUES({}, '{}', '{}', '{}');"
@@ -35,11 +40,79 @@ CREATE_SWIMMER_TABLE = "CREATE TABLE IF NOT EXISTS {} (name TEXT, gender TEXT, s
 CHECK_SWIMMER_TABLE = "SELECT swimmer_id FROM {} WHERE swimmer_id={} LIMIT 1;"
 ADD_TO_SWIMMER_TABLE = "INSERT INTO {} VALUES('{}', '{}', {}, {});"
 # Constants for creating and maintaining table of meets
-CREATE_MEET_TABLE = "CREATE TABLE IF NOT EXISTS Meets (meet_id INTEGER, meet_name TEXT, meet_date TEXT, meet_submitted INTEGER);"
+CREATE_MEET_TABLE = "CREATE TABLE IF NOT EXISTS Meets (meet_id INTEGER PRIMARY KEY, meet_name TEXT, " \
+                    "meet_date INTEGER, meet_submitted INTEGER);"
 CHECK_MEET_TABLE = "SELECT meet_id FROM Meets WHERE meet_id={};"
 INSERT_MEET_COMMAND = "INSERT INTO Meets VALUES({}, {}, {}, {});"
+# Constants for the table of which teams' relays have been pulled from which meets, so a meet's results are only gone
+# through once for every team and relay event being pulled
+CREATE_MEET_RELAYS_TABLE = "CREATE TABLE IF NOT EXISTS MeetRelays (meet_id INTEGER, gender TEXT, team_id INTEGER, " \
+                           "event TEXT, PRIMARY KEY (meet_id, gender, team_id, event));"
 
 #INSERT INTO Meets VALUES({}, {}, {}, {}) ON CONFLICT(meet_id) DO UPDATE SET age=excluded.age;
+# Parameterized commands used by ingest.py to write many rows at once with executemany. Values are bound by sqlite, so
+# names don't need to go through sqlsafe, and existing teams/swimmers are skipped by the insert itself.
+BULK_INSERT_SWIM_COMMAND = "INSERT INTO Swims VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING;"
+BULK_ADD_TO_TEAM_TABLE = "INSERT INTO Teams VALUES(?, ?) ON CONFLICT(team_id) DO NOTHING;"
+BULK_ADD_TO_SWIMMER_TABLE = "INSERT INTO Swimmers VALUES(?, ?, ?, ?) ON CONFLICT(swimmer_id) DO NOTHING;"
+BULK_ADD_TO_MEET_TABLE = "INSERT INTO Meets VALUES(?, ?, ?, ?) ON CONFLICT(meet_id) DO UPDATE SET " \
+                         "meet_name=excluded.meet_name, meet_date=excluded.meet_date, " \
+                         "meet_submitted=excluded.meet_submitted;"
+BULK_ADD_TO_MEET_RELAYS_TABLE = "INSERT INTO MeetRelays VALUES(?, ?, ?, ?) ON CONFLICT DO NOTHING;"
+# A swim is identified by who swam it, in what event, at which meet, on what day, how fast, and how many swims with all
+# of those the same came before it in the swimmer's event history (occurrence, so a prelim and a final in the same time
+# are two swims). This unique index makes putting the same swim in twice (like when a season is pulled again) do
+# nothing. Databases made before the index existed get occurrence numbered within each pull (snapshot), since one pull
+# never stores the same swim twice, and only the copies left over from pulling a swim again are deleted
+ADD_SWIMS_OCCURRENCE_COLUMN = "ALTER TABLE Swims ADD COLUMN occurrence INTEGER NOT NULL DEFAULT 0;"
+NUMBER_SWIM_OCCURRENCES = "CREATE TEMP TABLE SwimOccurrences AS SELECT * FROM (SELECT rowid AS swim_rowid, " \
+                          "row_number() OVER (PARTITION BY swimmer, event, meet_id, date, time, snapshot " \
+                          "ORDER BY rowid) - 1 AS occurrence FROM Swims) WHERE occurrence > 0;"
+SET_SWIM_OCCURRENCES = "UPDATE Swims SET occurrence=(SELECT occurrence FROM SwimOccurrences " \
+                       "WHERE swim_rowid=Swims.rowid) WHERE rowid IN (SELECT swim_rowid FROM SwimOccurrences);"
+CREATE_SWIMS_NATURAL_KEY = "CREATE UNIQUE INDEX IF NOT EXISTS SwimsNaturalKey ON Swims " \
+                           "(swimmer, event, meet_id, date, time, occurrence);"
+DELETE_DUPLICATE_SWIMS = "DELETE FROM Swims WHERE rowid NOT IN " \
+                         "(SELECT min(rowid) FROM Swims GROUP BY swimmer, event, meet_id, date, time, occurrence);"
+# the copies DELETE_DUPLICATE_SWIMS deletes are kept in the DuplicateSwims table first, so nothing stored is ever lost
+CREATE_DUPLICATE_SWIMS_TABLE = "CREATE TABLE IF NOT EXISTS DuplicateSwims AS SELECT * FROM Swims WHERE 0;"
+BACK_UP_DUPLICATE_SWIMS = "INSERT INTO DuplicateSwims SELECT * FROM Swims WHERE rowid NOT IN " \
+                          "(SELECT min(rowid) FROM Swims GROUP BY swimmer, event, meet_id, date, time, occurrence);"
+# Temporary table of the average time and standard deviation of every event in every season, used to scale times
+CREATE_SCALE_STATS_TABLE = "CREATE TEMP TABLE IF NOT EXISTS ScaleStats (event TEXT, season_start INTEGER, " \
+                           "season_end INTEGER, average REAL, variance REAL, sd REAL, " \
+                           "PRIMARY KEY (event, season_start));"
+# Temporary table of the taper value (see the README) of every day a team swam, used to fill out the taper column
+CREATE_TAPER_DAYS_TABLE = "CREATE TEMP TABLE IF NOT EXISTS TaperDays (team INTEGER, date INTEGER, taper INTEGER, " \
+                          "PRIMARY KEY (team, date));"
+# Constants for the table holding the date of the latest swim stored for each swimmer and event (incremental pulls)
+CREATE_SYNC_STATE_TABLE = "CREATE TABLE IF NOT EXISTS SyncState (swimmer INTEGER, event TEXT, last_date INTEGER, " \
+                          "PRIMARY KEY (swimmer, event));"
+FILL_SYNC_STATE_COMMAND = "INSERT OR REPLACE INTO SyncState SELECT swimmer, event, max(date) FROM Swims " \
+                          "GROUP BY swimmer, event;"
+UPDATE_SYNC_STATE_COMMAND = "INSERT INTO SyncState VALUES(?, ?, ?) ON CONFLICT(swimmer, event) " \
+                            "DO UPDATE SET last_date=max(last_date, excluded.last_date);"
+# Constants for the table of crawl units, which lets an interrupted pull pick up where it left off (crawl_frontier.py).
+# lease_owner and lease_expires say which worker process (crawl_workers.py) has claimed a unit and until when
+CREATE_CRAWL_UNITS_TABLE = "CREATE TABLE IF NOT EXISTS CrawlUnits (unit_id INTEGER PRIMARY KEY, kind TEXT NOT NULL, " \
+                           "team_id INTEGER NOT NULL, season INTEGER NOT NULL, gender TEXT NOT NULL, " \
+                           "swimmer_id INTEGER NOT NULL DEFAULT 0, event TEXT NOT NULL DEFAULT '', " \
+                           "state TEXT NOT NULL, updated REAL, lease_owner TEXT, lease_expires REAL, " \
+                           "UNIQUE (kind, team_id, season, gender, swimmer_id, event));"
+# finding the next unit to crawl (or claim) is a lookup instead of a scan past every unit that's already done
+CREATE_CRAWL_UNITS_STATE_INDEX = "CREATE INDEX IF NOT EXISTS CrawlUnitsState ON CrawlUnits (state, unit_id);"
+# Indexes on Swims for the queries that run on every pull and every analysis: scaling reads (event, date, time), taper
+# classification looks swims up by (team, date), and lineups pick out a meet's swims. scaled and taper are left out of
+# the indexes since every pull rewrites them. Grouping by swimmer and event is covered by SwimsNaturalKey, which starts
+# with those columns
+CREATE_SWIMS_EVENT_DATE_INDEX = "CREATE INDEX IF NOT EXISTS SwimsEventDate ON Swims (event, date, time);"
+CREATE_SWIMS_TEAM_DATE_INDEX = "CREATE INDEX IF NOT EXISTS SwimsTeamDate ON Swims (team, date);"
+CREATE_SWIMS_MEET_INDEX = "CREATE INDEX IF NOT EXISTS SwimsMeet ON Swims (meet_id, swimmer);"
+# Meets used to be made without a key and with meet_date as TEXT. Those tables are copied into the typed one above,
+# keeping the last row written for every meet
+COPY_UNTYPED_MEETS_COMMAND = "INSERT INTO Meets SELECT meet_id, meet_name, CAST(CAST(meet_date AS REAL) AS INTEGER), " \
+                             "meet_submitted FROM UntypedMeets WHERE rowid IN " \
+                             "(SELECT max(rowid) FROM UntypedMeets WHERE meet_id IS NOT NULL GROUP BY meet_id);"
 
 
 
@@ -56,6 +129,144 @@ DEFAULT_TEAMS_TO_PULL = ["Bucknell University", "Lehigh University"]
 DEFAULT_YEAR_START = 2018
 DEFAULT_YEAR_END = 2019
 
+########################################################################################################################
+#                                      SETTINGS FOR DATABASE WRITES IN ingest.py                                       #
+########################################################################################################################
+# rows buffered before they are written with one executemany
+INGEST_BATCH_SIZE = 50000
+# rows written before commit_if_due commits. Every commit syncs the file to disk, so a transaction holds many batches
+INGEST_COMMIT_ROWS = 100000
+# page cache (in KiB) of a connection an ingestor writes through, so the Swims index pages stay in memory between
+# batches instead of being read back from disk for every one
+INGEST_CACHE_KIB = 65536
+# buffered rows are written and committed at least this often (in seconds) so a crash never loses much work
+INGEST_COMMIT_SECONDS = 30
+
+########################################################################################################################
+#                                  SETTINGS FOR THE ASYNCHRONOUS CRAWLER IN crawler.py                                 #
+########################################################################################################################
+# Most requests that can be waiting on a single host at once. Keep this low enough to be polite to collegeswimming.com
+CRAWLER_MAX_REQUESTS_PER_HOST = 8
+# Directory of recorded pages served by stand_in_server.py, and the port it listens on
+STAND_IN_PAGE_DIRECTORY = "./recorded_pages"
+STAND_IN_PORT = 8000
+
+########################################################################################################################
+#                                SETTINGS FOR THE WORKER PROCESSES IN crawl_workers.py                                 #
+########################################################################################################################
+# Processes crawling units at the same time. Parsing pages keeps a process busy, so up to one per core helps. The
+# request rate (SCHEDULER_REQUESTS_PER_SECOND) is shared between them, so adding workers doesn't send more requests
+CRAWL_WORKERS = 4
+# seconds a worker holds a unit it has claimed without renewing its lease. It renews it every third of this while it
+# works, so the unit only goes to another worker if this one died
+CRAWL_WORKER_LEASE_SECONDS = 120
+# seconds an idle worker waits before looking for a unit to claim again
+CRAWL_WORKER_IDLE_SECONDS = 0.2
+# most results the writer saves in one transaction. Workers can't claim units while a transaction is open
+CRAWL_WORKER_WRITE_BATCH = 200
+
+########################################################################################################################
+#                                 SETTINGS FOR THE REQUEST SCHEDULER IN scheduler.py                                   #
+########################################################################################################################
+# Requests a second sent to a single host, and how many can go out back to back after a quiet spell. A 429 or 503 from
+# the host halves its rate (down to SCHEDULER_MIN_REQUESTS_PER_SECOND), and every page that loads wins back
+# 1/SCHEDULER_RECOVERY_REQUESTS of the full rate (a tenth of that close to where the host last pushed back)
+SCHEDULER_REQUESTS_PER_SECOND = 5.0
+SCHEDULER_BURST = 10
+SCHEDULER_MIN_REQUESTS_PER_SECOND = 0.2
+SCHEDULER_RECOVERY_REQUESTS = 50
+# tries per request before it is given up on for now, seconds waited after the first failed try (doubled after every
+# one after that, with some randomness), and the longest the scheduler will wait between tries, even if a Retry-After
+# asks for longer
+SCHEDULER_TRIES = 4
+SCHEDULER_BACKOFF = 1.0
+SCHEDULER_MAX_WAIT = 300
+# crawl units whose requests were given up on are tried again after this many seconds (doubled every time), at most
+# SCHEDULER_RETRY_ROUNDS times before the pull finishes without them
+SCHEDULER_RETRY_DELAY = 30
+SCHEDULER_RETRY_ROUNDS = 3
+
+########################################################################################################################
+#                                SETTINGS FOR THE CONNECTION POOL IN connection_pool.py                                #
+########################################################################################################################
+# Most idle keep-alive connections kept open to a single host. Match it to CRAWLER_MAX_REQUESTS_PER_HOST (and the worker
+# counts) so every worker that's downloading can find a connection that's already open
+CONNECTION_POOL_SIZE = 8
+# Accept-Encoding sent with every request. Pages come back compressed and are decompressed in connection_pool.py, so
+# less has to come over the network. None asks for them uncompressed
+CONNECTION_POOL_ACCEPT_ENCODING = "gzip, deflate"
+# redirects followed before a request is given up on
+CONNECTION_POOL_MAX_REDIRECTS = 5
+
+########################################################################################################################
+#                                  SETTINGS FOR THE CRAWL METRICS IN crawl_metrics.py                                  #
+########################################################################################################################
+# Upper bounds (in seconds) of the buckets request latencies are counted in, for every URL template
+METRICS_LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+# Where every pull saves its metrics as JSON and in the Prometheus text format. None skips saving that file
+METRICS_JSON_FILE_NAME = "./crawl_metrics.json"
+METRICS_PROMETHEUS_FILE_NAME = "./crawl_metrics.prom"
+# Seconds between redraws of the progress bar
+METRICS_PROGRESS_INTERVAL = 1.0
+
+########################################################################################################################
+#                                   SETTINGS FOR PAGE PARSING IN extraction.py                                         #
+########################################################################################################################
+# How downloaded pages are parsed: "html.parser" (whole page), "strained" (only the parts the parsers need), or "lxml"
+# (same as "strained" but faster, needs lxml installed). Falls back to "strained" if the backend isn't available
+EXTRACTION_BACKEND = "strained"
+
+########################################################################################################################
+#                                SETTINGS FOR THE TEAM DIRECTORY IN team_directory.py                                  #
+########################################################################################################################
+# sqlite file holding the TeamDirectory table of every team id and name on collegeswimming.com
+TEAM_DIRECTORY_FILE_NAME = "./team_directory.db"
+# There shouldn't be any schools on collegeswimming.com with a bigger id number than this
+MAX_TEAM_ID = 9826
+# team pages downloaded at the same time while building the directory
+TEAM_DIRECTORY_WORKERS = 8
+# results written to the directory between commits, so an interrupted build loses at most this many pages
+TEAM_DIRECTORY_CHECKPOINT = 100
+
+########################################################################################################################
+#                                 SETTINGS FOR THE RESPONSE CACHE IN response_cache.py                                 #
+########################################################################################################################
+# Every downloaded page is kept on disk so running a pull again doesn't download it again
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_DIRECTORY = "./response_cache"
+# once the cache is bigger than this, the least recently used pages are thrown out
+RESPONSE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Seconds each kind of page stays fresh. None means it never goes stale. Rosters and meet lists for seasons that are
+# over never go stale no matter what is set here, and neither do swimmers' times, meet pages, and relay results once
+# the season they were pulled for is over (if they were stored after it ended).
+RESPONSE_CACHE_TTL = {"SWIMMER_URL": 24 * 60 * 60,
+                      "SWIMMER_EVENT_URL": 24 * 60 * 60,
+                      "ROSTER_URL": 7 * 24 * 60 * 60,
+                      "RESULTS_URL": 24 * 60 * 60,
+                      "MEET_URL": 24 * 60 * 60,
+                      "MEET_EVENT_URL": 7 * 24 * 60 * 60,
+                      "SPLASH_SPLITS_URL": None,
+                      "TEAM_URL": 30 * 24 * 60 * 60,
+                      "OTHER": 24 * 60 * 60}
+
+########################################################################################################################
+#                                   SETTINGS FOR THE PAGE ARCHIVE IN page_archive.py                                   #
+########################################################################################################################
+# Set to True to keep every fetched page in the archive, so the database can be rebuilt from it (reparse.py) if a
+# parser was wrong. Off by default because it costs disk: pages are stored compressed (html shrinks about 5-15x), but a
+# new copy is added every time a page comes back different, and pages that came back with an error are kept too. The
+# two-team season on the pages from fixture_pages.py (16 MB of pages) makes a 1.7 MB archive, and pulls of many teams
+# over many seasons run into gigabytes
+PAGE_ARCHIVE_ENABLED = False
+# sqlite file pages are archived in and replayed from (see fetch.use_page_archive)
+PAGE_ARCHIVE_FILE_NAME = "./page_archive.db"
+# zlib level pages are compressed with, from 1 (fastest) to 9 (smallest)
+PAGE_ARCHIVE_COMPRESSION_LEVEL = 6
+# once the compressed pages add up to more than this, copies that a newer copy of the same page has replaced are thrown
+# out first, then the pages fetched longest ago, until the archive is a tenth under it. The file itself doesn't shrink,
+# the space is reused for new pages
+PAGE_ARCHIVE_MAX_BYTES = 2 * 1024 ** 3
+
 ########################################################################################################################
 #                                 SCORING RULES FOR process_swim_data CAN BE CHANGED HERE                              #
 ########################################################################################################################
@@ -70,4 +281,20 @@ SCORER_LIMIT = {"Six Lane": [3,2], "Five Lane": [2,1]}
 #                                "Five": {"Individual": [5, 3, 1], "Relay": [7, 0], "Limit": [2, 1]}},
 #                       "Double Dual": {"Nine": {"Individual": [9, 4, 3, 2, 1], "Relay": [11, 4, 2], "Limit": [3,2]},
 #                                       "Eight": {"Individual": [9, 4, 3, 2, 1], "Relay": [11, 4, 2], "Limit": [3,2]}},
-#                       "Triangular": ""}
\ No newline at end of file
+#                       "Triangular": ""}
+
+########################################################################################################################
+#                              SETTINGS FOR BUILDING SCORE MATRICES IN scoring_engine.py                               #
+########################################################################################################################
+# Most processes score_matrix splits the lineups between, capped at the number of cores. 1 scores everything in the
+# calling process
+SCORE_MATRIX_WORKERS = 4
+# meets score_matrix scores for every process it starts. Starting a process and sending it the lineups takes about 0.4
+# seconds, as long as scoring about 3500 meets, so matrices of fewer than twice this many meets are scored in the
+# calling process
+SCORE_MATRIX_MEETS_PER_WORKER = 20000
+# meets scored together in one batch of array operations. Bigger batches spend less time per meet outside of numpy,
+# but the arrays of a batch take up memory for every meet in it
+SCORE_MATRIX_BATCH_SIZE = 1024
+# lowered lineups a ScoringEngine keeps for score_meet, so scoring the same lineups again skips lowering them
+SCORING_ENGINE_CACHED_LINEUPS = 256
\ No newline at end of file
@@ -0,0 +1,211 @@
+import heapq
+import time
+from constants import *
+
+########################################################################################################################
+# A pull is broken up into crawl units that are kept in the CrawlUnits table of the database being built, so if a pull #
+# dies partway through (an HTTP error, the laptop going to sleep, ...) running it again skips everything that already  #
+# finished. The kinds of units are:                                                                                    #
+#     roster  - (team_id, season, gender) download the roster, add the team and swimmers, and add a swimmer unit for   #
+#               every swimmer on it                                                                                    #
+#     swimmer - (team_id, season, gender, swimmer_id) download the swimmer's page and add an event unit for every      #
+#               requested event they swam                                                                              #
+#     event   - (team_id, season, gender, swimmer_id, event) download the swimmer's times in that event                #
+#     relays  - (team_id, season, gender) download the relay legs swum by the team. Every meet's results are gone      #
+#               through once for all teams with a relays unit in the same season and gender (see relay_team_ids), so   #
+#               meets already gone through by another team's unit are skipped                                          #
+# Each unit's state is one of pending, in_progress, done, or failed. A unit's rows, its state change to done, and the  #
+# units it adds are all committed together, so a unit is either completely in the database or not at all.              #
+# A unit whose requests kept failing (scheduler.RequestDeferred) is marked failed and put in a DeferredRetryQueue,     #
+# which hands it back to be crawled again after SCHEDULER_RETRY_DELAY seconds, doubling each time it fails again.      #
+# Worker processes (crawl_workers.py) take units with claim_unit, which leases a unit to one worker for a while. A     #
+# worker keeps renewing the lease while it works, and a unit whose lease ran out (its worker died) can be claimed by   #
+# another worker.                                                                                                      #
+########################################################################################################################
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+UNIT_COLUMNS = "unit_id, kind, team_id, season, gender, swimmer_id, event"
+
+
+def prepare_frontier(cursor):
+    """
+    Creates the CrawlUnits table if needed. Units that were in progress (or failed) when the last run stopped are put
+    back in the queue.
+    :param cursor: cursor of the open sqlite database
+    :return: number of units that were put back in the queue
+    """
+    cursor.execute(CREATE_CRAWL_UNITS_TABLE)
+    cursor.execute(CREATE_CRAWL_UNITS_STATE_INDEX)
+    cursor.execute("UPDATE CrawlUnits SET state=?, updated=? WHERE state IN (?, ?);",
+                   (PENDING, time.time(), IN_PROGRESS, FAILED))
+    return cursor.rowcount
+
+
+def add_unit(cursor, kind, team_id, season, gender, swimmer_id=0, event=""):
+    """
+    Adds a unit to the queue, unless that unit is already in the table (in which case it is left as is)
+    :return unit: the new unit as a (unit_id, kind, team_id, season, gender, swimmer_id, event) tuple, or None if it was
+    already in the table
+    """
+    cursor.execute("INSERT OR IGNORE INTO CrawlUnits (kind, team_id, season, gender, swimmer_id, event, state, "
+                   "updated) VALUES(?, ?, ?, ?, ?, ?, ?, ?);",
+                   (kind, team_id, season, gender, int(swimmer_id), event, PENDING, time.time()))
+    if cursor.rowcount == 0:
+        return None
+    return (cursor.lastrowid, kind, team_id, season, gender, int(swimmer_id), event)
+
+
+def seed_pull(cursor, team_ids, seasons, genders, pull_relays):
+    """
+    Adds the top level units of a pull: a roster unit (and relays unit) for every team, season, and gender
+    :param team_ids: list of integer team ids
+    :param seasons: list of collegeswimming.com season ids
+    :param genders: list of characters M, F
+    :param pull_relays: whether to add relays units
+    """
+    for season in seasons:
+        for team_id in team_ids:
+            for gender in genders:
+                add_unit(cursor, "roster", team_id, season, gender)
+                if pull_relays:
+                    add_unit(cursor, "relays", team_id, season, gender)
+
+
+def relay_team_ids(cursor, season, gender):
+    """
+    :return: ids of every team with a relays unit for the season and gender, whose relays are pulled together
+    """
+    return [row[0] for row in cursor.execute("SELECT DISTINCT team_id FROM CrawlUnits WHERE kind='relays' AND season=? "
+                                             "AND gender=? ORDER BY team_id;", (season, gender))]
+
+
+def pending_units(cursor):
+    """
+    :return: every unit waiting to be crawled, oldest first
+    """
+    return cursor.execute("SELECT {} FROM CrawlUnits WHERE state=? ORDER BY unit_id;".format(UNIT_COLUMNS),
+                          (PENDING,)).fetchall()
+
+
+def next_pending_unit(cursor):
+    """
+    :return: the oldest unit waiting to be crawled, or None if there aren't any
+    """
+    return cursor.execute("SELECT {} FROM CrawlUnits WHERE state=? ORDER BY unit_id LIMIT 1;".format(UNIT_COLUMNS),
+                          (PENDING,)).fetchone()
+
+
+def claim_unit(cursor, owner, lease_seconds):
+    """
+    Takes the oldest pending unit, or failing that a unit whose lease has run out, and leases it to owner. A relays
+    unit isn't taken while another one of the same season and gender is leased, so the meets they share are only gone
+    through once
+    :param owner: name of the worker claiming the unit
+    :param lease_seconds: seconds until the lease runs out if it isn't renewed
+    :return unit: the claimed unit, or None if there wasn't one to claim
+    """
+    now = time.time()
+    claimable = "NOT (kind='relays' AND EXISTS (SELECT 1 FROM CrawlUnits AS leased WHERE leased.kind='relays' AND " \
+                "leased.state=:in_progress AND leased.season=CrawlUnits.season AND leased.gender=CrawlUnits.gender " \
+                "AND leased.lease_expires>=:now))"
+    # a single statement, so two workers can never claim the same unit
+    return cursor.execute("UPDATE CrawlUnits SET state=:in_progress, lease_owner=:owner, lease_expires=:expires, "
+                          "updated=:now WHERE unit_id=(SELECT unit_id FROM (SELECT unit_id FROM CrawlUnits WHERE "
+                          "state=:pending AND {0} ORDER BY unit_id LIMIT 1) UNION ALL SELECT unit_id FROM (SELECT "
+                          "unit_id FROM CrawlUnits WHERE state=:in_progress AND lease_expires<:now AND {0} ORDER BY "
+                          "unit_id LIMIT 1) LIMIT 1) RETURNING {1};".format(claimable, UNIT_COLUMNS),
+                          {"in_progress": IN_PROGRESS, "pending": PENDING, "owner": owner, "now": now,
+                           "expires": now + lease_seconds}).fetchone()
+
+
+def renew_lease(cursor, unit_id, owner, lease_seconds):
+    """
+    :return: True if owner still held the lease on the unit, which now runs lease_seconds from now
+    """
+    cursor.execute("UPDATE CrawlUnits SET lease_expires=? WHERE unit_id=? AND state=? AND lease_owner=?;",
+                   (time.time() + lease_seconds, unit_id, IN_PROGRESS, owner))
+    return cursor.rowcount == 1
+
+
+def lease_owner(cursor, unit_id):
+    """
+    :return: the worker holding the unit's lease, or None if the unit isn't leased (e.g. it's done already)
+    """
+    row = cursor.execute("SELECT lease_owner FROM CrawlUnits WHERE unit_id=? AND state=?;",
+                         (unit_id, IN_PROGRESS)).fetchone()
+    return row[0] if row is not None else None
+
+
+def set_unit_state(cursor, unit_id, state):
+    cursor.execute("UPDATE CrawlUnits SET state=?, updated=? WHERE unit_id=?;", (state, time.time(), unit_id))
+
+
+def count_units(cursor):
+    """
+    :return: (number of units that are done, number of units in the table)
+    """
+    return cursor.execute("SELECT coalesce(sum(state=?), 0), count(*) FROM CrawlUnits;", (DONE,)).fetchone()
+
+
+def clear_pull(cursor, team_ids, seasons, genders):
+    """
+    Removes the units of a pull once it has completely finished, so the next pull of the same teams starts over
+    """
+    for season in seasons:
+        for team_id in team_ids:
+            for gender in genders:
+                cursor.execute("DELETE FROM CrawlUnits WHERE team_id=? AND season=? AND gender=?;",
+                               (team_id, season, gender))
+
+
+class DeferredRetryQueue:
+    """
+    Units that failed because their requests kept failing, waiting to be tried again later in the same pull
+    """
+    def __init__(self, delay=SCHEDULER_RETRY_DELAY, rounds=SCHEDULER_RETRY_ROUNDS):
+        """
+        :param delay: seconds a unit waits the first time it is deferred, doubled every time after that
+        :param rounds: times a single unit can be deferred. After that it stays failed until the pull is run again
+        """
+        self.delay = delay
+        self.rounds = rounds
+        # heap of (time the unit can be tried again, unit_id, unit)
+        self.waiting = []
+        # {unit_id: times the unit has been deferred}
+        self.deferrals = {}
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def defer(self, unit):
+        """
+        :param unit: (unit_id, kind, team_id, season, gender, swimmer_id, event) tuple of the unit that failed
+        :return: True if the unit will be tried again, False if it has already been deferred the most times it can be
+        """
+        deferrals = self.deferrals.get(unit[0], 0)
+        if deferrals >= self.rounds:
+            return False
+        self.deferrals[unit[0]] = deferrals + 1
+        heapq.heappush(self.waiting, (time.monotonic() + self.delay * 2 ** deferrals, unit[0], unit))
+        return True
+
+    def seconds_until_ready(self):
+        """
+        :return: seconds until the next unit can be tried again, or None if no units are waiting
+        """
+        if not self.waiting:
+            return None
+        return max(0.0, self.waiting[0][0] - time.monotonic())
+
+    def pop_ready(self):
+        """
+        :return: list of every unit that can be tried again now, taken out of the queue
+        """
+        ready = []
+        while self.waiting and self.waiting[0][0] <= time.monotonic():
+            ready.append(heapq.heappop(self.waiting)[2])
+        return ready
@@ -0,0 +1,368 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from constants import *
+from helperfunctions import loading_bar
+
+########################################################################################################################
+# Counts what a pull spends its time on, broken down by the URL template each page was built from (ROSTER_URL,         #
+# SWIMMER_EVENT_URL, ...): requests and their status codes, a histogram of how long each request took, bytes           #
+# downloaded, pages served from the response cache, and time spent parsing pages, along with the rows written to each  #
+# table and the time spent writing them. fetch.download, fetch.fetch_url, the page parsers (through timed_parser), and #
+# ingest.BulkIngestor record into whatever get_metrics returns, and the scrapers start a new CrawlMetrics for every    #
+# pull. At the end of a pull report prints a table of it, and write saves it as JSON (METRICS_JSON_FILE_NAME) and in   #
+# the Prometheus text format (METRICS_PROMETHEUS_FILE_NAME, for node_exporter's textfile collector).                   #
+#                                                                                                                      #
+# ProgressDisplay is the progress bar the scrapers show while they work, redrawn in place at most every                #
+# METRICS_PROGRESS_INTERVAL seconds with the request rate and an estimate of the time left.                            #
+########################################################################################################################
+
+
+def histogram_quantile(quantile, buckets, counts):
+    """
+    Estimates a quantile from a histogram the way Prometheus does, assuming values are spread evenly in each bucket
+    :param quantile: between 0 and 1 (e.g. 0.95)
+    :param buckets: upper bounds of every bucket but the last, which has no upper bound
+    :param counts: number of values in each bucket (not cumulative), one more than there are bounds
+    :return: the estimate, or None if the histogram is empty
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    seen = 0
+    lower = 0.0
+    for upper, count in zip(buckets, counts):
+        if count and seen + count >= rank:
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+        lower = upper
+    # it's in the last bucket, which has no upper bound
+    return lower
+
+
+class EndpointMetrics:
+    """
+    Everything recorded about the pages built from one URL template
+    """
+    def __init__(self, buckets):
+        self.requests = 0
+        # {status code (or "error" for timeouts and dropped connections): requests}
+        self.statuses = {}
+        self.latency_counts = [0] * (len(buckets) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.bytes = 0
+        self.cache_hits = 0
+        self.pages_parsed = 0
+        self.parse_seconds = 0.0
+        # time requests were held back by the rate limit or waiting to be tried again (see scheduler.py)
+        self.wait_seconds = 0.0
+
+
+class CrawlMetrics:
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        """
+        :param buckets: upper bounds (in seconds) of the buckets of the request latency histograms, in order
+        """
+        self.buckets = list(buckets)
+        self.started = time.time()
+        # {endpoint name: EndpointMetrics}
+        self.endpoints = {}
+        # {table name: rows written}
+        self.rows = {}
+        self.write_seconds = 0.0
+        # (crawl units done, crawl units in the pull), as last shown by a ProgressDisplay
+        self.units = (0, 0)
+        self.lock = threading.Lock()
+
+    def endpoint(self, name):
+        # only call this with self.lock held
+        if name not in self.endpoints:
+            self.endpoints[name] = EndpointMetrics(self.buckets)
+        return self.endpoints[name]
+
+    def record_request(self, endpoint, seconds, status, byte_count=0):
+        """
+        :param endpoint: name of the URL template the request was built from (see fetch.match_endpoint)
+        :param seconds: how long the request took
+        :param status: HTTP status code of the response, or "error" if there wasn't one
+        :param byte_count: bytes in the body of the page
+        """
+        bucket = 0
+        while bucket < len(self.buckets) and seconds > self.buckets[bucket]:
+            bucket += 1
+        with self.lock:
+            stats = self.endpoint(endpoint)
+            stats.requests += 1
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.latency_counts[bucket] += 1
+            stats.latency_sum += seconds
+            stats.latency_max = max(stats.latency_max, seconds)
+            stats.bytes += byte_count
+
+    def record_cache_hit(self, endpoint):
+        with self.lock:
+            self.endpoint(endpoint).cache_hits += 1
+
+    def record_wait(self, endpoint, seconds):
+        with self.lock:
+            self.endpoint(endpoint).wait_seconds += seconds
+
+    def record_parse(self, endpoint, seconds):
+        with self.lock:
+            stats = self.endpoint(endpoint)
+            stats.pages_parsed += 1
+            stats.parse_seconds += seconds
+
+    def record_rows(self, table, count, seconds=0.0):
+        """
+        :param table: name of the table written to
+        :param count: rows actually written (rows that were already there and skipped don't count)
+        :param seconds: time spent writing them
+        """
+        with self.lock:
+            self.rows[table] = self.rows.get(table, 0) + count
+            self.write_seconds += seconds
+
+    def merge(self, summary):
+        """
+        Adds what another CrawlMetrics recorded (e.g. in a worker process, see crawl_workers.py) to this one
+        :param summary: what the other one's summary() returned. It must have been made with the same buckets
+        """
+        with self.lock:
+            for name, other in summary["endpoints"].items():
+                stats = self.endpoint(name)
+                stats.requests += other["requests"]
+                for status, count in other["statuses"].items():
+                    status = int(status) if status.isdigit() else status
+                    stats.statuses[status] = stats.statuses.get(status, 0) + count
+                stats.latency_counts = [count + other_count for count, other_count
+                                        in zip(stats.latency_counts, other["latency"]["buckets"].values())]
+                stats.latency_sum += other["request_seconds"]
+                stats.latency_max = max(stats.latency_max, other["latency"]["max"])
+                stats.bytes += other["bytes"]
+                stats.cache_hits += other["cache_hits"]
+                stats.pages_parsed += other["pages_parsed"]
+                stats.parse_seconds += other["parse_seconds"]
+                stats.wait_seconds += other["wait_seconds"]
+            for table, count in summary["rows_written"].items():
+                self.rows[table] = self.rows.get(table, 0) + count
+            self.write_seconds += summary["write_seconds"]
+
+    def summary(self):
+        """
+        :return: dictionary of everything recorded, which is what write saves as JSON
+        """
+        with self.lock:
+            endpoints = {}
+            for name, stats in sorted(self.endpoints.items()):
+                endpoints[name] = {
+                    "requests": stats.requests,
+                    "statuses": {str(status): count for status, count in sorted(stats.statuses.items(), key=str)},
+                    "cache_hits": stats.cache_hits,
+                    "bytes": stats.bytes,
+                    "request_seconds": stats.latency_sum,
+                    "wait_seconds": stats.wait_seconds,
+                    "latency": {"mean": stats.latency_sum / stats.requests if stats.requests else None,
+                                "p50": histogram_quantile(0.5, self.buckets, stats.latency_counts),
+                                "p95": histogram_quantile(0.95, self.buckets, stats.latency_counts),
+                                "max": stats.latency_max,
+                                "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"],
+                                                    stats.latency_counts))},
+                    "pages_parsed": stats.pages_parsed,
+                    "parse_seconds": stats.parse_seconds}
+            return {"started": self.started,
+                    "elapsed_seconds": time.time() - self.started,
+                    "units_done": self.units[0],
+                    "units_total": self.units[1],
+                    "endpoints": endpoints,
+                    "rows_written": dict(sorted(self.rows.items())),
+                    "write_seconds": self.write_seconds}
+
+    def prometheus_text(self):
+        """
+        :return: everything recorded, in the Prometheus text exposition format
+        """
+        summary = self.summary()
+        endpoints = summary["endpoints"]
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            """
+            :param samples: list of (suffix added to the name, list of (label, value), value)
+            """
+            lines.append("# HELP swim_scraper_{} {}".format(name, help_text))
+            lines.append("# TYPE swim_scraper_{} {}".format(name, kind))
+            for suffix, labels, value in samples:
+                label_text = ",".join('{}="{}"'.format(label, label_value) for label, label_value in labels)
+                lines.append("swim_scraper_{}{}{} {}".format(name, suffix, "{" + label_text + "}" if labels else "",
+                                                             value))
+
+        def by_endpoint(key):
+            return [("", [("endpoint", name)], stats[key]) for name, stats in endpoints.items()]
+
+        metric("requests_total", "counter", "Requests sent, by URL template and response status",
+               [("", [("endpoint", name), ("status", status)], count)
+                for name, stats in endpoints.items() for status, count in stats["statuses"].items()])
+        latency_samples = []
+        for name, stats in endpoints.items():
+            cumulative = 0
+            for bound, count in stats["latency"]["buckets"].items():
+                cumulative += count
+                latency_samples.append(("_bucket", [("endpoint", name), ("le", bound)], cumulative))
+            latency_samples.append(("_sum", [("endpoint", name)], stats["request_seconds"]))
+            latency_samples.append(("_count", [("endpoint", name)], stats["requests"]))
+        metric("request_duration_seconds", "histogram", "Time each request took, by URL template", latency_samples)
+        metric("wait_seconds_total", "counter",
+               "Time requests were held back by the rate limit or before being tried again, by URL template",
+               by_endpoint("wait_seconds"))
+        metric("response_bytes_total", "counter", "Bytes of pages downloaded, by URL template", by_endpoint("bytes"))
+        metric("cache_hits_total", "counter", "Pages served from the response cache, by URL template",
+               by_endpoint("cache_hits"))
+        metric("pages_parsed_total", "counter", "Pages parsed, by URL template", by_endpoint("pages_parsed"))
+        metric("parse_seconds_total", "counter", "Time spent parsing pages, by URL template",
+               by_endpoint("parse_seconds"))
+        metric("rows_written_total", "counter", "Rows written to the database, by table",
+               [("", [("table", table)], count) for table, count in summary["rows_written"].items()])
+        metric("write_seconds_total", "counter", "Time spent writing rows to the database",
+               [("", [], summary["write_seconds"])])
+        metric("crawl_units", "gauge", "Crawl units in the pull, by state",
+               [("", [("state", "done")], summary["units_done"]), ("", [("state", "total")], summary["units_total"])])
+        metric("elapsed_seconds", "gauge", "Time since the pull started", [("", [], summary["elapsed_seconds"])])
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_file_name=METRICS_JSON_FILE_NAME, prometheus_file_name=METRICS_PROMETHEUS_FILE_NAME):
+        """
+        Saves everything recorded. Each file is written next to where it goes and then moved into place, so nothing
+        reading it ever sees half a file
+        :param json_file_name: where to save the JSON summary, or None to not save it
+        :param prometheus_file_name: where to save the Prometheus text file, or None to not save it
+        """
+        for file_name, text in [(json_file_name, lambda: json.dumps(self.summary(), indent=2)),
+                                (prometheus_file_name, self.prometheus_text)]:
+            if file_name is None:
+                continue
+            with open(file_name + ".tmp", "w") as metrics_file:
+                metrics_file.write(text())
+            os.replace(file_name + ".tmp", file_name)
+
+    def report(self):
+        """
+        Prints a table of where the time went for every URL template, and the rows written to each table
+        """
+        summary = self.summary()
+        print("{:>18} {:>8} {:>8} {:>7} {:>9} {:>9} {:>10} {:>9} {:>9}".format(
+            "endpoint", "requests", "cached", "errors", "MB", "p95 ms", "request s", "wait s", "parse s"))
+        for name, stats in summary["endpoints"].items():
+            errors = sum(count for status, count in stats["statuses"].items() if not status.startswith("2"))
+            p95 = stats["latency"]["p95"]
+            print("{:>18} {:>8} {:>8} {:>7} {:>9.2f} {:>9} {:>10.1f} {:>9.1f} {:>9.1f}".format(
+                name, stats["requests"], stats["cache_hits"], errors, stats["bytes"] / 1024 ** 2,
+                "-" if p95 is None else "{:.0f}".format(p95 * 1000), stats["request_seconds"],
+                stats["wait_seconds"], stats["parse_seconds"]))
+        print("rows written: {} in {:.1f} seconds, pull took {:.1f} seconds".format(
+            ", ".join("{} {}".format(count, table) for table, count in summary["rows_written"].items()) or "none",
+            summary["write_seconds"], summary["elapsed_seconds"]))
+
+
+# CrawlMetrics everything is recorded into. The scrapers replace it with a new one at the start of every pull
+current_metrics = CrawlMetrics()
+
+
+def get_metrics():
+    return current_metrics
+
+
+def use_metrics(metrics):
+    """
+    :param metrics: a CrawlMetrics for everything after this to be recorded into
+    """
+    global current_metrics
+    current_metrics = metrics
+
+
+def timed_parser(endpoint):
+    """
+    Decorator for the page parsers that records how long each call takes against endpoint
+    :param endpoint: name of the URL template of the pages the parser reads
+    """
+    def decorator(parser):
+        @functools.wraps(parser)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return parser(*args, **kwargs)
+            finally:
+                get_metrics().record_parse(endpoint, time.perf_counter() - start)
+        return timed
+    return decorator
+
+
+class ProgressDisplay:
+    """
+    A progress bar that is redrawn on the same line, at most every interval seconds, with how many units are done,
+    the request rate, and how long the rest should take at the rate units have been finishing. When the output isn't
+    a terminal (e.g. it's going to a log file) every redraw is written as a line of its own instead
+    """
+    def __init__(self, interval=METRICS_PROGRESS_INTERVAL, stream=None):
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stdout
+        self.in_place = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.started = time.time()
+        self.shown = 0.0
+        # units that were already done when the display started, which don't count towards the rate
+        self.start_done = None
+
+    def due(self):
+        """
+        :return: True if enough time has passed since the bar was last drawn to draw it again
+        """
+        return time.time() - self.shown >= self.interval
+
+    def show(self, done, total):
+        """
+        Draws the bar, whether or not it is due
+        :param done: units finished so far
+        :param total: units there are in all (can grow as new ones are found)
+        """
+        now = time.time()
+        self.shown = now
+        if self.start_done is None:
+            self.start_done = done
+        metrics = get_metrics()
+        metrics.units = (done, total)
+        elapsed = now - self.started
+        with metrics.lock:
+            requests = sum(stats.requests for stats in metrics.endpoints.values())
+        eta = "--:--:--"
+        if done > self.start_done and total > done:
+            seconds_left = int(elapsed / (done - self.start_done) * (total - done))
+            eta = "{}:{:02d}:{:02d}".format(seconds_left // 3600, seconds_left // 60 % 60, seconds_left % 60)
+        elif total and done >= total:
+            eta = "0:00:00"
+        percent = float(done) / total if total else 0.0
+        line = "{} {}/{} units {:6.1f} req/s ETA {}".format(loading_bar(percent), done, total,
+                                                           requests / elapsed if elapsed else 0.0, eta)
+        # \033[K clears whatever was left on the line from the last redraw
+        self.stream.write("\r" + line + "\033[K" if self.in_place else line + "\n")
+        self.stream.flush()
+
+    def update(self, done, total):
+        """
+        Draws the bar if it is due
+        """
+        if self.due():
+            self.show(done, total)
+
+    def finish(self, done, total):
+        """
+        Draws the bar one last time and moves on to the next line
+        """
+        self.show(done, total)
+        if self.in_place:
+            self.stream.write("\n")
+            self.stream.flush()
@@ -0,0 +1,332 @@
+import argparse
+import multiprocessing
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+from constants import *
+import fetch
+from scheduler import RequestScheduler, RequestDeferred, SharedTokenBucket
+from crawl_frontier import *
+from crawl_metrics import CrawlMetrics, ProgressDisplay, get_metrics, use_metrics
+from ingest import BulkIngestor
+from team_index import find_team_id
+from get_swim_data import crawl_unit_result, save_unit_result, start_snapshot, scale_season_times, find_taper_swims
+
+########################################################################################################################
+# Version of get_swim_data.get_swim_data that crawls with several worker processes, so parsing pages isn't held to a   #
+# single core. Every worker claims crawl units from the CrawlUnits table of the database being built (see              #
+# crawl_frontier.claim_unit), downloads and parses them (get_swim_data.crawl_unit_result), and sends what it found     #
+# back to this process, which is the only one that writes to the database. The writer saves results in batches, each   #
+# in one short transaction, and the database is in WAL mode while the workers run so they can read it and claim units  #
+# in between.                                                                                                          #
+#                                                                                                                      #
+# A claimed unit is leased to its worker for CRAWL_WORKER_LEASE_SECONDS and renewed while the worker is busy with it.  #
+# If a worker dies its units go to the others once their leases run out, and a result from a worker that lost its      #
+# lease is thrown away, so every unit is saved exactly once. All the workers take their requests from one token bucket #
+# in shared memory, so together they keep to the request rate, and a worker on a long chain of requests (like a relays #
+# unit) can use all of it while the others are idle. Run with                                                          #
+#     python crawl_workers.py --workers 8                                                                              #
+########################################################################################################################
+
+
+def fetch_settings(context):
+    """
+    :param context: multiprocessing context the workers are started from
+    :return: what a worker needs to download pages the way this process would: (site root, response cache, scheduler
+    arguments, page archive) where the response cache is None for the default one, False for none, or
+    (directory, max_bytes), and the page archive is None for the default one, False for none, or (file name, mode).
+    The scheduler arguments come with a SharedTokenBucket for the host being crawled, which every worker draws on
+    """
+    cache = fetch.response_cache
+    if cache:
+        cache = (cache.directory, cache.max_bytes)
+    scheduler = fetch.get_scheduler()
+    buckets = {}
+    if scheduler.rate is not None:
+        buckets[urlsplit(fetch.resolve_url(SITE_ROOT)).netloc] = SharedTokenBucket(scheduler.rate, scheduler.burst,
+                                                                                   context=context)
+    archive = fetch.page_archive
+    if archive:
+        archive = (archive.file_name, fetch.page_archive_mode)
+    return (fetch.site_root_override, cache,
+            (scheduler.rate, scheduler.burst, scheduler.tries, scheduler.backoff, buckets), archive)
+
+
+def use_fetch_settings(settings):
+    """
+    Sets up downloading in a worker process from what fetch_settings returned in the writer
+    """
+    site_root, cache, scheduler_arguments, archive = settings
+    fetch.use_site_root(site_root)
+    if cache is False:
+        fetch.use_response_cache(None)
+    elif cache is not None:
+        from response_cache import ResponseCache
+        fetch.use_response_cache(ResponseCache(*cache))
+    fetch.use_scheduler(RequestScheduler(*scheduler_arguments))
+    if archive is False:
+        fetch.use_page_archive(None)
+    elif archive is not None:
+        from page_archive import PageArchive
+        fetch.use_page_archive(PageArchive(archive[0]), archive[1])
+
+
+def keep_lease(database_file_name, owner, held, stop):
+    """
+    Renews the lease on the unit the worker is crawling (held[0], None when it isn't crawling one) every third of
+    CRAWL_WORKER_LEASE_SECONDS until stop is set
+    """
+    connection = sqlite3.connect(database_file_name, timeout=CRAWL_WORKER_LEASE_SECONDS / 3)
+    while not stop.wait(CRAWL_WORKER_LEASE_SECONDS / 3):
+        unit_id = held[0]
+        if unit_id is None:
+            continue
+        try:
+            connection.execute("BEGIN IMMEDIATE;")
+            if not renew_lease(connection.cursor(), unit_id, owner, CRAWL_WORKER_LEASE_SECONDS):
+                print("{} lost its lease on crawl unit {}".format(owner, unit_id))
+            connection.commit()
+        except sqlite3.OperationalError as e:  # the database stayed locked, try again next time
+            print("{} couldn't renew its lease on crawl unit {} ({})".format(owner, unit_id, e))
+    connection.close()
+
+
+def send_metrics(owner, results):
+    """
+    Sends what has been recorded since the last time to the writer, and starts recording from scratch
+    """
+    results.put(("metrics", owner, None, get_metrics().summary()))
+    use_metrics(CrawlMetrics())
+
+
+def run_worker(database_file_name, owner, events_to_pull, relays_to_pull, snapshot_id, settings, results, stop):
+    """
+    Claims and crawls units until stop is set. Everything is sent to the writer on results as a (kind, owner, unit,
+    payload) message, where kind is one of
+        "result"   - payload is what get_swim_data.crawl_unit_result returned for the unit
+        "deferred" - a page the unit needs kept failing to load, payload is the message of the RequestDeferred
+        "failed"   - anything else went wrong, payload describes it
+        "metrics"  - unit is None, payload is a summary of the crawl metrics recorded since the last one
+    :param owner: name of the worker, which its leases are held under
+    :param settings: what fetch_settings returned in the writer
+    :param results: multiprocessing queue the messages are put on
+    :param stop: multiprocessing event the writer sets once the pull is over
+    """
+    use_fetch_settings(settings)
+    use_metrics(CrawlMetrics())
+    connection = sqlite3.connect(database_file_name, timeout=CRAWL_WORKER_LEASE_SECONDS / 3)
+    cursor = connection.cursor()
+    held = [None]
+    stop_lease = threading.Event()
+    threading.Thread(target=keep_lease, args=(database_file_name, owner, held, stop_lease), daemon=True).start()
+    metrics_sent = time.time()
+    try:
+        while not stop.is_set():
+            # takes the write lock before claim_unit reads which unit is next. Reading first and upgrading to a write
+            # fails at once, without waiting, if another process wrote in between
+            cursor.execute("BEGIN IMMEDIATE;")
+            unit = claim_unit(cursor, owner, CRAWL_WORKER_LEASE_SECONDS)
+            connection.commit()
+            if unit is None:
+                # the units still being crawled may lead to more, so there's no knowing the pull is over from here
+                stop.wait(CRAWL_WORKER_IDLE_SECONDS)
+                continue
+            held[0] = unit[0]
+            try:
+                message = ("result", owner, unit, crawl_unit_result(cursor, unit, events_to_pull, relays_to_pull,
+                                                                    snapshot_id))
+            except RequestDeferred as e:
+                # sent as a message since RequestDeferred can't be pickled
+                message = ("deferred", owner, unit, str(e))
+            except Exception as e:
+                message = ("failed", owner, unit, repr(e))
+            held[0] = None
+            results.put(message)
+            if time.time() - metrics_sent >= METRICS_PROGRESS_INTERVAL:
+                send_metrics(owner, results)
+                metrics_sent = time.time()
+    finally:
+        stop_lease.set()
+        send_metrics(owner, results)
+        connection.close()
+
+
+def next_messages(results):
+    """
+    :return: list of up to CRAWL_WORKER_WRITE_BATCH messages from the workers, waiting at most
+    CRAWL_WORKER_IDLE_SECONDS for the first one
+    """
+    messages = []
+    try:
+        messages.append(results.get(timeout=CRAWL_WORKER_IDLE_SECONDS))
+        while len(messages) < CRAWL_WORKER_WRITE_BATCH:
+            messages.append(results.get_nowait())
+    except queue.Empty:
+        pass
+    return messages
+
+
+def open_unit_count(cursor):
+    """
+    :return: number of units that are waiting to be claimed or being crawled
+    """
+    return cursor.execute("SELECT count(*) FROM CrawlUnits WHERE state IN (?, ?);",
+                          (PENDING, IN_PROGRESS)).fetchone()[0]
+
+
+def write_results(connection, results, processes, incremental):
+    """
+    Saves what the workers send until every unit is done (or has failed for good)
+    :param processes: the worker processes, to notice if every one of them has died
+    :return: (ingestor, number of swims found, number of units that failed)
+    """
+    cursor = connection.cursor()
+    ingestor = BulkIngestor(connection, incremental=incremental)
+    # units whose pages kept failing to load wait here to be tried again once the rest of the pull has moved on
+    retry_queue = DeferredRetryQueue()
+    progress = ProgressDisplay()
+    swim_count = 0
+    failed_count = 0
+    while True:
+        messages = next_messages(results)
+        retry_units = retry_queue.pop_ready()
+        if messages or retry_units:
+            # a batch is written in one transaction, and the workers are only kept waiting for the length of it (see
+            # run_worker for why the write lock is taken up front)
+            cursor.execute("BEGIN IMMEDIATE;")
+        for unit in retry_units:
+            set_unit_state(cursor, unit[0], PENDING)
+        for kind, owner, unit, payload in messages:
+            if kind == "metrics":
+                get_metrics().merge(payload)
+                continue
+            if lease_owner(cursor, unit[0]) != owner:
+                # the worker lost its lease and another one has the unit now, or has already finished it
+                continue
+            if kind == "result":
+                swim_count += len(payload["swims"])
+                save_unit_result(ingestor, unit, payload)
+                continue
+            set_unit_state(cursor, unit[0], FAILED)
+            if kind == "deferred" and retry_queue.defer(unit):
+                print("{}, crawl unit {} will be tried again later".format(payload, unit))
+                continue
+            print("{}, giving up on crawl unit {}".format(payload, unit))
+            failed_count += 1
+        if messages or retry_units:
+            # a unit's rows are committed along with it being marked done
+            ingestor.commit()
+        progress.update(*count_units(cursor))
+        if not open_unit_count(cursor) and not retry_queue:
+            break
+        if not any(process.is_alive() for process in processes):
+            raise RuntimeError("every crawl worker has stopped")
+    progress.finish(*count_units(cursor))
+    return ingestor, swim_count, failed_count
+
+
+def stop_workers(processes, results, stop):
+    """
+    Tells the workers to stop and waits for them, adding the last metrics each one sends to this process's
+    """
+    stop.set()
+    # a worker can't exit until everything it put on the queue has been taken off
+    while any(process.is_alive() for process in processes):
+        for kind, owner, unit, payload in next_messages(results):
+            if kind == "metrics":
+                get_metrics().merge(payload)
+    for kind, owner, unit, payload in next_messages(results):
+        if kind == "metrics":
+            get_metrics().merge(payload)
+    for process in processes:
+        process.join()
+
+
+def crawl_with_workers(teams_to_pull, genders_to_pull, year_start, year_end, events_to_pull=DEFAULT_EVENTS_TO_PULL,
+                       database_file_name=DATABASE_FILE_NAME, workers=CRAWL_WORKERS, incremental=False):
+    """
+    Same inputs and result as get_swim_data.get_swim_data, but the units are crawled by worker processes
+    :param teams_to_pull: List of strings where each string is a swim team (e.g. "Bucknell University")
+    :param genders_to_pull: List of characters M, F, representing Male and Female
+    :param year_start: Integer value of year to start pulling data from
+    :param year_end: Integer value of final year for data pull
+    :param events_to_pull: List of event codes for events to pull data on
+    :param database_file_name: The name of the database file that information will be stored in
+    :param workers: number of worker processes
+    :param incremental: if True, only swims at least as recent as the latest one already stored for the same swimmer
+    and event are added
+    :return: Nothing is returned. database_file_name will have data written to it, and will be created if it didn't
+    exist before.
+    """
+    # relays are collected separately from individual events
+    relays_to_pull = [event for event in events_to_pull if event[0] in "MF"]
+    events_to_pull = [event for event in events_to_pull if event[0] not in "MF"]
+    team_ids = [find_team_id(team) for team in teams_to_pull]
+    # everything this pull downloads, parses, and writes is counted from here, workers included (see crawl_metrics.py)
+    metrics = CrawlMetrics()
+    use_metrics(metrics)
+
+    connection = sqlite3.connect(database_file_name, timeout=CRAWL_WORKER_LEASE_SECONDS / 3)
+    cursor = connection.cursor()
+    snapshot_id = start_snapshot(cursor, team_ids, year_start, year_end, events_to_pull)
+
+    # units left over from an interrupted run of this pull are picked back up, finished ones are skipped
+    seasons = [simple_year - 1996 for simple_year in range(year_start, year_end)]
+    prepare_frontier(cursor)
+    seed_pull(cursor, team_ids, seasons, genders_to_pull, len(relays_to_pull) > 0)
+    connection.commit()
+    if count_units(cursor)[0]:
+        print("Resuming pull: {} of {} crawl units already done".format(*count_units(cursor)))
+
+    # lets the workers read the database (and claim units) while the writer has rows half written
+    # (the pragma answers with the new mode, which has to be read so the statement doesn't stay open)
+    cursor.execute("PRAGMA journal_mode=WAL;").fetchone()
+    # spawned rather than forked, so the workers start clean and it works the same on every platform
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    stop = context.Event()
+    settings = fetch_settings(context)
+    processes = [context.Process(target=run_worker, daemon=True,
+                                 args=(database_file_name, "worker-{}".format(number), events_to_pull,
+                                       relays_to_pull, snapshot_id, settings, results, stop))
+                 for number in range(1, workers + 1)]
+    start = time.time()
+    for process in processes:
+        process.start()
+    try:
+        ingestor, swim_count, failed_count = write_results(connection, results, processes, incremental)
+    finally:
+        stop_workers(processes, results, stop)
+    cursor.execute("PRAGMA journal_mode=DELETE;").fetchone()
+    print("{} swims from {} workers in {:.1f} seconds".format(swim_count - ingestor.skipped_swims, workers,
+                                                             time.time() - start))
+    metrics.report()
+    metrics.write()
+
+    scale_season_times(cursor, year_start, year_end, events_to_pull, genders_to_pull,
+                       ingestor.touched_partitions() if incremental else None)
+    connection.commit()
+    find_taper_swims(cursor, year_start, year_end, team_ids)
+    if failed_count:
+        print("{} crawl units failed, run the same pull again to retry them".format(failed_count))
+    else:
+        # everything finished, so the next pull of these teams starts from scratch
+        clear_pull(cursor, team_ids, seasons, genders_to_pull)
+    connection.commit()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the swim database with several worker processes")
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS)
+    parser.add_argument("--database", default=DATABASE_FILE_NAME)
+    parser.add_argument("--incremental", action="store_true", help="only add swims newer than the ones stored")
+    args = parser.parse_args()
+    crawl_with_workers(list(DEFAULT_TEAMS_TO_PULL), list(DEFAULT_GENDER), DEFAULT_YEAR_START, DEFAULT_YEAR_END,
+                       list(DEFAULT_EVENTS_TO_PULL), args.database, args.workers, args.incremental)
+
+
+if __name__ == "__main__":
+    main()
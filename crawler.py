@@ -0,0 +1,363 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from constants import *
+from helperfunctions import *
+import fetch
+from fetch import fetch_url, resolve_url, HTTPError
+from scheduler import RequestDeferred
+from get_swim_data import parse_swimmer_events, parse_event_history, parse_roster, parse_team_results, \
+    parse_meet_event_ids, parse_relay_results, parse_splash_splits, name_relay_legs, season_timestamps, \
+    start_snapshot, scale_season_times, find_taper_swims, pulled_meet_teams, meet_relay_teams, save_unit_result
+from crawl_frontier import *
+from ingest import BulkIngestor
+from team_index import find_team_id
+from crawl_metrics import CrawlMetrics, ProgressDisplay, use_metrics
+
+########################################################################################################################
+# Asynchronous version of get_swim_data.get_swim_data. It works through the same crawl units (see crawl_frontier.py),  #
+# but every unit is started as soon as it is known about instead of one after the other. The number of                 #
+# requests waiting on a single host is capped (CRAWLER_MAX_REQUESTS_PER_HOST) so we don't hammer the website, and all  #
+# database writes go through one writer task so sqlite only ever sees a single connection.                             #
+# It still keeps to the request scheduler's rate (scheduler.py), so it is only faster than get_swim_data when waiting  #
+# on the server is the bottleneck. When the rate limit is (a fast server at 5 requests a second), both take as long as #
+# it takes to send every request at that rate.                                                                         #
+########################################################################################################################
+
+
+class Crawler:
+    """
+    Holds everything that is shared between the tasks of a single crawl: the per-host request limits, the thread pool
+    that the blocking downloads and parsing run in, and the queue feeding the database writer.
+    """
+    def __init__(self, max_requests_per_host=CRAWLER_MAX_REQUESTS_PER_HOST, incremental=False):
+        self.max_requests_per_host = max_requests_per_host
+        self.incremental = incremental
+        self.host_limits = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_requests_per_host + (os.cpu_count() or 1))
+        self.write_queue = asyncio.Queue()
+        self.outstanding_units = 0
+        self.unit_tasks = set()
+        self.failed_count = 0
+        self.request_count = 0
+        self.swim_count = 0
+        # (event, simple_year) of every event and season swims were added to, once the crawl is over
+        self.touched_partitions = set()
+        # {(season, gender): ids of the teams whose relays are being pulled}
+        self.relay_team_ids = {}
+        # {gender: {meet_id: set of team ids}} of the relays pulled from each meet before this crawl started
+        self.pulled_meets = {}
+        # {(meet_id, gender): task} for every meet whose relays are being pulled by this crawl, so two teams that swam
+        # the same meet don't both go through its results
+        self.meet_tasks = {}
+        # units whose pages kept failing to load, waiting to be started again
+        self.retry_queue = DeferredRetryQueue()
+
+    def host_limit(self, url):
+        """
+        :param url: url about to be requested
+        :return: the semaphore that caps how many requests can be waiting on that url's host
+        """
+        host = urlsplit(resolve_url(url)).netloc
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.max_requests_per_host)
+        return self.host_limits[host]
+
+    async def fetch(self, url, parser, *parser_args, settled_at=None):
+        """
+        Downloads a page without blocking the event loop, then parses it
+        :param url: url built from one of the templates in constants.py
+        :param parser: one of the parse_* functions from get_swim_data, called as parser(source, *parser_args)
+        :param settled_at: timestamp after which the part of the page that is used can't change (see fetch_url)
+        :return: whatever parser returns, or None if the page didn't load
+        """
+        loop = asyncio.get_running_loop()
+        async with self.host_limit(url):
+            try:
+                source = await loop.run_in_executor(self.executor, fetch_url, url, settled_at)
+            except HTTPError as e:
+                print("{} ({})".format(e, url))
+                return None
+            finally:
+                self.request_count += 1
+        # parsing doesn't need the host, so the next request can start while this runs
+        return await loop.run_in_executor(self.executor, parser, source, *parser_args)
+
+    def start_unit(self, unit, events_to_pull, relays_to_pull, snapshot_id):
+        """
+        Starts crawling a unit (see crawl_frontier.py) in the background
+        """
+        self.outstanding_units += 1
+        task = asyncio.ensure_future(self.crawl_unit(unit, events_to_pull, relays_to_pull, snapshot_id))
+        # the event loop only keeps weak references to tasks, so hold on to it until it's finished
+        self.unit_tasks.add(task)
+        task.add_done_callback(self.unit_tasks.discard)
+
+    async def crawl_unit(self, unit, events_to_pull, relays_to_pull, snapshot_id):
+        """
+        Downloads everything a crawl unit needs and hands the result to the writer, which saves it, adds the units it
+        leads to, and marks the unit done all in one go. If one of its pages kept failing to load the writer is handed
+        the RequestDeferred instead, and starts the unit again later. If anything else goes wrong the unit is marked
+        failed, and the next run of the pull tries it again.
+        """
+        try:
+            result = await self.crawl_unit_result(unit, events_to_pull, relays_to_pull, snapshot_id)
+        except RequestDeferred as e:
+            result = e
+        except Exception as e:
+            print("crawl unit {} failed: {!r}".format(unit, e))
+            result = None
+        await self.write_queue.put((unit, result))
+
+    async def crawl_unit_result(self, unit, events_to_pull, relays_to_pull, snapshot_id):
+        """
+        :return result: dictionary of the team, swimmers, swims, and new units found by crawling the unit
+        """
+        unit_id, kind, team_id, season, gender, swimmer_id, event = unit
+        result = {"team": None, "swimmers": [], "swims": [], "units": [], "meets": [], "meet_relays": []}
+        if kind == "roster":
+            team = await self.fetch(ROSTER_URL.format(team_id, gender, season), parse_roster)
+            if team:
+                result["team"] = (team["name"], team_id)
+                for swimmer_name, roster_swimmer_id in team["roster"]:
+                    result["swimmers"].append((swimmer_name, gender, roster_swimmer_id, team_id))
+                    result["units"].append(("swimmer", team_id, season, gender, roster_swimmer_id))
+                print("got roster of team {} ({}) for season {}".format(team_id, gender, season))
+        elif kind == "swimmer":
+            # the swimmer's page lists every event they have swum, so it is only downloaded once
+            swimmer_events = await self.fetch(SWIMMER_URL.format(swimmer_id), parse_swimmer_events)
+            for swimmer_event in [e for e in events_to_pull if swimmer_events and e in swimmer_events]:
+                result["units"].append(("event", team_id, season, gender, swimmer_id, swimmer_event))
+        elif kind == "event":
+            swims = await self.fetch(SWIMMER_EVENT_URL.format(swimmer_id, event), parse_event_history,
+                                     *season_timestamps(season), settled_at=season_timestamps(season)[1])
+            result["swims"] = [(swimmer_id, team_id, swim[1], 0, swim[2], gender, event, swim[0], 0, snapshot_id)
+                               for swim in swims or []]
+        elif kind == "relays":
+            relay_legs, result["meets"], result["meet_relays"] = await self.crawl_relays(team_id, gender, season,
+                                                                                         relays_to_pull)
+            result["swims"] = [leg[:8] + [0, snapshot_id] for leg in relay_legs]
+        return result
+
+    async def run_writer(self, connection, events_to_pull, relays_to_pull, snapshot_id):
+        """
+        The only task that touches the database. Every message is a (unit, result) pair from crawl_unit. New units
+        are started as soon as they are added, and the writer stops once no units are left running or waiting to be
+        tried again.
+        """
+        cursor = connection.cursor()
+        ingestor = BulkIngestor(connection, incremental=self.incremental)
+        for unit in pending_units(cursor):
+            unit_id, kind, team_id, season, gender, swimmer_id, event = unit
+            if kind == "relays" and (season, gender) not in self.relay_team_ids:
+                self.relay_team_ids[(season, gender)] = relay_team_ids(cursor, season, gender)
+                self.pulled_meets.setdefault(gender, pulled_meet_teams(cursor, gender))
+            set_unit_state(cursor, unit[0], IN_PROGRESS)
+            self.start_unit(unit, events_to_pull, relays_to_pull, snapshot_id)
+        connection.commit()
+        progress = ProgressDisplay()
+        while self.outstanding_units > 0 or self.retry_queue:
+            for unit in self.retry_queue.pop_ready():
+                set_unit_state(cursor, unit[0], IN_PROGRESS)
+                self.start_unit(unit, events_to_pull, relays_to_pull, snapshot_id)
+            try:
+                unit, result = await asyncio.wait_for(self.write_queue.get(), self.retry_queue.seconds_until_ready())
+            except asyncio.TimeoutError:
+                continue  # a deferred unit is ready to be tried again
+            unit_id = unit[0]
+            self.outstanding_units -= 1
+            if isinstance(result, RequestDeferred):
+                set_unit_state(cursor, unit_id, FAILED)
+                if self.retry_queue.defer(unit):
+                    print("{}, crawl unit {} will be tried again later".format(result, unit))
+                    continue
+                print("{}, giving up on crawl unit {}".format(result, unit))
+                result = None
+            if result is None:
+                set_unit_state(cursor, unit_id, FAILED)
+                self.failed_count += 1
+                continue
+            self.swim_count += len(result["swims"])
+            for new_unit in save_unit_result(ingestor, unit, result):
+                set_unit_state(cursor, new_unit[0], IN_PROGRESS)
+                self.start_unit(new_unit, events_to_pull, relays_to_pull, snapshot_id)
+            # units are committed in batches along with their rows (a crash just means the uncommitted units are
+            # crawled again)
+            ingestor.commit_if_due()
+            if progress.due():
+                progress.show(*count_units(cursor))
+        ingestor.commit()
+        progress.finish(*count_units(cursor))
+        self.swim_count -= ingestor.skipped_swims
+        self.touched_partitions = ingestor.touched_partitions()
+
+    async def crawl_relay_event(self, team_ids, gender, meet_id, meet_date, relay_string, relay_id):
+        """
+        :return: (relay_legs, pulled) where relay_legs are the legs of the relay swum by every team in team_ids, and
+        pulled are the ids of the teams whose results were gone through (teams whose splits didn't load are left out)
+        """
+        relay_results = await self.fetch(MEET_EVENT_URL.format(meet_id, relay_id), parse_relay_results, team_ids,
+                                         settled_at=season_end(meet_date, SEASON_LINE_MONTH, SEASON_LINE_DAY))
+        if not relay_results:
+            return [], []
+        relay_teams = [(team_id, relay_swimmers, splash_split_id) for team_id in team_ids
+                       for relay_swimmers, splash_split_id in relay_results[team_id]]
+        # every relay team's splits are on their own page, so ask for all of them at once
+        leg_times = await asyncio.gather(*[self.fetch(SPLASH_SPLITS_URL.format(splash_split_id), parse_splash_splits)
+                                           for team_id, relay_swimmers, splash_split_id in relay_teams])
+        relay_legs = []
+        pulled = []
+        for team_id in team_ids:
+            team_leg_times = [(relay_swimmers, times) for (relay_team_id, relay_swimmers, splash_split_id), times
+                              in zip(relay_teams, leg_times) if relay_team_id == team_id]
+            if any(times is None for relay_swimmers, times in team_leg_times):
+                print("no splits available for team {} at meet {}".format(team_id, meet_id))
+                continue
+            swimmer_id_list = [swimmer_id for relay_swimmers, times in team_leg_times for swimmer_id in relay_swimmers]
+            times = [leg_time for relay_swimmers, relay_times in team_leg_times for leg_time in relay_times]
+            relay_legs.extend(name_relay_legs(list(zip(swimmer_id_list, times)), relay_string, team_id, gender,
+                                              meet_id, meet_date))
+            pulled.append(team_id)
+        return relay_legs, pulled
+
+    async def crawl_meet(self, relay_teams, gender, meet_id, meet):
+        """
+        :param relay_teams: dictionary of {relay event: list of team ids} as made by get_swim_data.meet_relay_teams
+        :return: (relay_legs, pulled) where relay_legs are the legs swum at the meet by the teams in relay_teams, and
+        pulled are (team_id, relay event) for every team and relay whose results were gone through
+        """
+        event_ids = await self.fetch(MEET_URL.format(meet_id, gender), parse_meet_event_ids,
+                                     settled_at=season_end(meet["meet_date"], SEASON_LINE_MONTH, SEASON_LINE_DAY))
+        if not event_ids:
+            print("meet {} not submitted".format(meet_id))
+            return [], []
+        # relays the meet didn't have have nothing to pull
+        pulled = [(team_id, relay_string) for relay_string, team_ids in relay_teams.items()
+                  if to_event_title(gender + relay_string) not in event_ids for team_id in team_ids]
+        relay_strings = [relay_string for relay_string in relay_teams
+                         if to_event_title(gender + relay_string) in event_ids]
+        relay_events = await asyncio.gather(*[
+            self.crawl_relay_event(relay_teams[relay_string], gender, meet_id, meet["meet_date"], relay_string,
+                                   event_ids[to_event_title(gender + relay_string)])
+            for relay_string in relay_strings])
+        for relay_string, (relay_legs, team_ids) in zip(relay_strings, relay_events):
+            pulled.extend((team_id, relay_string) for team_id in team_ids)
+        return [leg for relay_legs, team_ids in relay_events for leg in relay_legs], pulled
+
+    async def crawl_relays(self, team_id, gender, season, relays_to_pull):
+        """
+        Pulls the relays of every meet the team swam in the season, for every team whose relays are being pulled. Meets
+        that were already pulled, or that another team's unit is pulling right now, are skipped
+        :return: (relay_legs, meets, meet_relays) where relay_legs are in the format made by name_relay_legs, meets are
+        (meet_id, meet_name, meet_date, meet_submitted) for every meet the team swam, and meet_relays are
+        (meet_id, gender, team_id, relay event) for every team and relay pulled from each meet
+        """
+        meets = await self.fetch(RESULTS_URL.format(team_id, season), parse_team_results)
+        if not meets:
+            return [], [], []
+        meet_rows = [(meet_id, meet["meet_name"], meet["meet_date"], meet["submitted"])
+                     for meet_id, meet in meets.items()]
+        owned_meet_ids = []
+        owned_meets = []
+        others_meets = []
+        for meet_id, meet in meets.items():
+            if not meet["submitted"]:
+                continue
+            relay_teams = meet_relay_teams(self.pulled_meets.get(gender, {}).get(int(meet_id), {}), team_id,
+                                           self.relay_team_ids.get((season, gender), [team_id]), relays_to_pull)
+            if not relay_teams:
+                continue
+            if (int(meet_id), gender) in self.meet_tasks:
+                # another unit is already pulling this meet, and this team's legs come with it
+                others_meets.append(self.meet_tasks[(int(meet_id), gender)])
+                continue
+            task = asyncio.ensure_future(self.crawl_meet(relay_teams, gender, meet_id, meet))
+            self.meet_tasks[(int(meet_id), gender)] = task
+            owned_meet_ids.append(meet_id)
+            owned_meets.append(task)
+        try:
+            meet_legs = await asyncio.gather(*owned_meets)
+            # if the unit pulling one of this team's meets fails, this unit has to fail too so both are tried again
+            await asyncio.gather(*others_meets)
+        except Exception:
+            # none of the meets this unit was pulling get written, so they have to be pulled again by whichever unit
+            # is tried again first
+            for key, task in list(self.meet_tasks.items()):
+                if task in owned_meets:
+                    del self.meet_tasks[key]
+            raise
+        # only the relays whose pages were actually gone through are recorded, the rest are tried again next pull
+        meet_relays = [(meet_id, gender, relay_team_id, relay_string)
+                       for meet_id, (relay_legs, pulled) in zip(owned_meet_ids, meet_legs)
+                       for relay_team_id, relay_string in pulled]
+        return [leg for relay_legs, pulled in meet_legs for leg in relay_legs], meet_rows, meet_relays
+
+
+def crawl(teams_to_pull, genders_to_pull, year_start, year_end, events_to_pull=DEFAULT_EVENTS_TO_PULL,
+          database_file_name=DATABASE_FILE_NAME, max_requests_per_host=CRAWLER_MAX_REQUESTS_PER_HOST,
+          incremental=False):
+    """
+    Same inputs and result as get_swim_data.get_swim_data, but the pages are downloaded concurrently.
+    :param teams_to_pull: List of strings where each string is a swim team (e.g. "Bucknell University")
+    :param genders_to_pull: List of characters M, F, representing Male and Female
+    :param year_start: Integer value of year to start pulling data from
+    :param year_end: Integer value of final year for data pull
+    :param events_to_pull: List of event codes for events to pull data on
+    :param database_file_name: The name of the database file that information will be stored in
+    :param max_requests_per_host: most requests that can be waiting on one host at the same time
+    :param incremental: if True, only swims at least as recent as the latest one already stored for the same swimmer
+    and event are added
+    :return: Nothing is returned. database_file_name will have data written to it, and will be created if it didn't
+    exist before.
+    """
+    # relays are collected separately from individual events
+    relays_to_pull = [event for event in events_to_pull if event[0] in "MF"]
+    events_to_pull = [event for event in events_to_pull if event[0] not in "MF"]
+    team_ids = [find_team_id(team) for team in teams_to_pull]
+    # everything this pull downloads, parses, and writes is counted from here (see crawl_metrics.py)
+    metrics = CrawlMetrics()
+    use_metrics(metrics)
+
+    connection = sqlite3.connect(database_file_name)
+    cursor = connection.cursor()
+    snapshot_id = start_snapshot(cursor, team_ids, year_start, year_end, events_to_pull)
+
+    # units left over from an interrupted run of this pull are picked back up, finished ones are skipped
+    seasons = [simple_year - 1996 for simple_year in range(year_start, year_end)]
+    prepare_frontier(cursor)
+    seed_pull(cursor, team_ids, seasons, genders_to_pull, len(relays_to_pull) > 0)
+    connection.commit()
+    if count_units(cursor)[0]:
+        print("Resuming pull: {} of {} crawl units already done".format(*count_units(cursor)))
+
+    crawler = Crawler(max_requests_per_host, incremental)
+    start = time.time()
+    asyncio.run(crawler.run_writer(connection, events_to_pull, relays_to_pull, snapshot_id))
+    crawler.executor.shutdown()
+    print("{} requests and {} swims in {:.1f} seconds".format(crawler.request_count, crawler.swim_count,
+                                                              time.time() - start))
+    if fetch.response_cache:
+        fetch.response_cache.report()
+    if fetch.request_scheduler:
+        fetch.request_scheduler.report()
+    metrics.report()
+    metrics.write()
+
+    scale_season_times(cursor, year_start, year_end, events_to_pull, genders_to_pull,
+                       crawler.touched_partitions if incremental else None)
+    connection.commit()
+    find_taper_swims(cursor, year_start, year_end, team_ids)
+    if crawler.failed_count:
+        print("{} crawl units failed, run the same pull again to retry them".format(crawler.failed_count))
+    else:
+        # everything finished, so the next pull of these teams starts from scratch
+        clear_pull(cursor, team_ids, seasons, genders_to_pull)
+    connection.commit()
+    connection.close()
+
+
+if __name__ == "__main__":
+    crawl(DEFAULT_TEAMS_TO_PULL, DEFAULT_GENDER, DEFAULT_YEAR_START, DEFAULT_YEAR_END)
@@ -0,0 +1,73 @@
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+from constants import *
+
+########################################################################################################################
+# Every html page the scrapers parse is turned into a BeautifulSoup tree by make_soup. Most of a collegeswimming.com  #
+# page is navigation, ads, and scripts that no parser looks at, so instead of building the whole tree make_soup only  #
+# keeps the nodes listed for that kind of page in PAGE_NODES (and everything inside them). The parsers run the same    #
+# find/find_all calls either way. How the tree is built is up to the backend (EXTRACTION_BACKEND in constants.py):     #
+#     "html.parser"   the whole page, with python's built in parser. This is how every page used to be parsed          #
+#     "strained"      only the PAGE_NODES of the page, with python's built in parser                                   #
+#     "lxml"          only the PAGE_NODES of the page, with lxml's C parser. Only available if lxml is installed       #
+# benchmark_extraction.py compares them on recorded pages.                                                             #
+########################################################################################################################
+
+
+def has_class(class_name):
+    """
+    :return: regex matching a class attribute that includes class_name. SoupStrainer sees the class attribute as one
+    string while the page is being parsed, so class_="x" would only match elements whose only class is x
+    """
+    return re.compile(r"(^|\s){}(\s|$)".format(re.escape(class_name)))
+
+
+# the nodes each parser needs, by the name of the URL template of the page (see fetch.ENDPOINT_NAMES)
+PAGE_NODES = {"SWIMMER_URL": SoupStrainer("select", class_=has_class("js-event-id-selector")),
+              "ROSTER_URL": SoupStrainer(["h1", "table"]),
+              "RESULTS_URL": SoupStrainer("section", class_=has_class("c-list-grid")),
+              "MEET_URL": SoupStrainer("ul", class_=has_class("c-sticky-filters__list")),
+              "MEET_EVENT_URL": SoupStrainer("table"),
+              "SPLASH_SPLITS_URL": SoupStrainer("tbody"),
+              "TEAM_URL": SoupStrainer("h1", class_=has_class("c-toolbar__title"))}
+
+
+def full_tree(source, nodes):
+    return BeautifulSoup(source, "html.parser")
+
+
+def strained_tree(source, nodes):
+    return BeautifulSoup(source, "html.parser", parse_only=nodes)
+
+
+def lxml_tree(source, nodes):
+    return BeautifulSoup(source, "lxml", parse_only=nodes)
+
+
+# {backend name: function(source, nodes) returning a BeautifulSoup tree}
+BACKENDS = {"html.parser": full_tree, "strained": strained_tree}
+if builder_registry.lookup("lxml") is not None:
+    BACKENDS["lxml"] = lxml_tree
+
+# name of the backend make_soup uses
+backend = EXTRACTION_BACKEND if EXTRACTION_BACKEND in BACKENDS else "strained"
+
+
+def use_backend(name):
+    """
+    :param name: one of the keys of BACKENDS
+    """
+    global backend
+    if name not in BACKENDS:
+        raise ValueError("Unknown extraction backend {!r}, choose from {}".format(name, ", ".join(BACKENDS)))
+    backend = name
+
+
+def make_soup(source, page):
+    """
+    :param source: raw html of a page
+    :param page: name of the URL template the page came from (a key of PAGE_NODES)
+    :return: BeautifulSoup tree holding (at least) the nodes in PAGE_NODES[page]
+    """
+    return BACKENDS[backend](source, PAGE_NODES[page])
@@ -0,0 +1,245 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from constants import *
+from crawl_metrics import get_metrics
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Every page that get_swim_data, crawler, and team_dict_generator download goes through fetch_url. Keeping all network #
+# access in one place means the scrapers can be pointed at a local stand-in server (see stand_in_server.py) instead of #
+# the real website without touching any of the scraping code, and every download is rate limited and tried again by    #
+# the same request scheduler (see scheduler.py) over the same pool of keep-alive connections (see connection_pool.py). #
+# Every request and cache hit is recorded in the crawl metrics (see crawl_metrics.py) against the URL template the     #
+# page was built from. With PAGE_ARCHIVE_ENABLED (or fetch.use_page_archive) every page is also kept in the page       #
+# archive (see page_archive.py) as it is fetched, and in replay mode pages are served from the archive without going   #
+# near the network.                                                                                                    #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# names of the URL templates in constants.py, in the order they are checked against a url
+ENDPOINT_NAMES = ["SWIMMER_EVENT_URL", "SWIMMER_URL", "ROSTER_URL", "RESULTS_URL", "MEET_EVENT_URL", "MEET_URL",
+                  "SPLASH_SPLITS_URL", "TEAM_URL"]
+
+
+def template_pattern(template):
+    """
+    :param template: one of the URL templates in constants.py
+    :return: compiled regex matching the path and query of any url built from template, with one group per {} slot
+    """
+    path = template[len(SITE_ROOT):]
+    return re.compile("^" + "([^/?&]*)".join(re.escape(part) for part in path.split("{}")) + "$")
+
+
+ENDPOINT_PATTERNS = [(name, template_pattern(globals()[name])) for name in ENDPOINT_NAMES]
+
+
+def match_endpoint(url):
+    """
+    :param url: any url, on the real website or a stand-in for it
+    :return: (endpoint, values) where endpoint is the name of the template the url was built from (or "OTHER") and
+    values is the list of things that were formatted into the template
+    """
+    path = re.sub("^[a-z]+://[^/]*", "", url)
+    for name, pattern in ENDPOINT_PATTERNS:
+        match = pattern.match(path)
+        if match:
+            return name, list(match.groups())
+    return "OTHER", []
+
+
+# when this is set, SITE_ROOT at the start of every url is swapped out for it before the page is requested
+site_root_override = None
+# ResponseCache that pages are looked up in before being downloaded. Made on the first fetch if RESPONSE_CACHE_ENABLED
+response_cache = None
+# guards making response_cache, request_scheduler, and connection_pool, since fetch_url can be called from many
+# threads at once
+response_cache_lock = threading.Lock()
+# thread pool fetch_many downloads in. Made on first use
+fetch_pool = None
+# RequestScheduler every download goes through (see scheduler.py). Made on the first download
+request_scheduler = None
+# ConnectionPool every download is sent over (see connection_pool.py). Made on the first download
+connection_pool = None
+# PageArchive pages are recorded in or replayed from (see page_archive.py). Made on the first fetch if
+# PAGE_ARCHIVE_ENABLED
+page_archive = None
+# "record", "replay", or "reparse" (see use_page_archive)
+page_archive_mode = "record"
+
+
+def use_site_root(site_root):
+    """
+    Sends every following fetch to a different server, e.g. "http://127.0.0.1:8000" for the stand-in server.
+    :param site_root: scheme and host to use in place of SITE_ROOT. None goes back to the real website
+    """
+    global site_root_override
+    site_root_override = site_root
+
+
+def use_response_cache(cache):
+    """
+    :param cache: a response_cache.ResponseCache to read pages from and store pages in, or None to always download
+    """
+    global response_cache
+    response_cache = cache if cache is not None else False
+
+
+def use_scheduler(scheduler):
+    """
+    :param scheduler: a scheduler.RequestScheduler for every following download to go through
+    """
+    global request_scheduler
+    request_scheduler = scheduler
+
+
+def get_scheduler():
+    global request_scheduler
+    if request_scheduler is None:
+        with response_cache_lock:
+            if request_scheduler is None:
+                from scheduler import RequestScheduler
+                request_scheduler = RequestScheduler()
+    return request_scheduler
+
+
+def use_connection_pool(pool):
+    """
+    :param pool: a connection_pool.ConnectionPool for every following download to be sent over
+    """
+    global connection_pool
+    connection_pool = pool
+
+
+def get_connection_pool():
+    global connection_pool
+    if connection_pool is None:
+        with response_cache_lock:
+            if connection_pool is None:
+                from connection_pool import ConnectionPool
+                connection_pool = ConnectionPool()
+    return connection_pool
+
+
+def use_page_archive(archive, mode="record"):
+    """
+    :param archive: a page_archive.PageArchive, or None to neither record nor replay pages
+    :param mode: "record" to keep every page fetched from here on in the archive, "replay" to serve every page from
+    the archive instead of downloading it, or "reparse" to replay with pages that were never archived treated as not
+    found (see reparse.py)
+    """
+    global page_archive, page_archive_mode
+    if mode not in ("record", "replay", "reparse"):
+        raise ValueError("page archive mode has to be \"record\", \"replay\", or \"reparse\", not {!r}".format(mode))
+    page_archive = archive if archive is not None else False
+    page_archive_mode = mode
+
+
+def replay(url):
+    """
+    :param url: url built from one of the templates in constants.py
+    :return source: the body of the page, from the page archive
+    raises HTTPError if the page came back with an error when it was recorded, or page_archive.PageNotArchived if it
+    wasn't recorded at all (an HTTPError for a 404 when reparsing)
+    """
+    start = time.perf_counter()
+    status, source = page_archive.replay(url, (404, b"") if page_archive_mode == "reparse" else None)
+    get_metrics().record_request(match_endpoint(url)[0], time.perf_counter() - start, status, len(source))
+    if status != 200:
+        raise HTTPError(resolve_url(url), status, "recorded in the page archive", None, None)
+    return source
+
+
+def download(url):
+    """
+    :return: the body of the page at url, in bytes. Makes a single request on a pooled connection, with no rate limit
+    or retries
+    """
+    endpoint = match_endpoint(url)[0]
+    start = time.perf_counter()
+    try:
+        source = get_connection_pool().request(url)
+    except HTTPError as e:
+        get_metrics().record_request(endpoint, time.perf_counter() - start, e.code)
+        raise
+    except OSError:
+        get_metrics().record_request(endpoint, time.perf_counter() - start, "error")
+        raise
+    get_metrics().record_request(endpoint, time.perf_counter() - start, 200, len(source))
+    return source
+
+
+def resolve_url(url):
+    """
+    :param url: url built from one of the templates in constants.py
+    :return url: the url that will actually be requested
+    """
+    if site_root_override is not None and url.startswith(SITE_ROOT):
+        return site_root_override + url[len(SITE_ROOT):]
+    return url
+
+
+def fetch_url(url, settled_at=None):
+    """
+    :param url: url built from one of the templates in constants.py
+    :param settled_at: timestamp after which the part of the page the caller uses can't change anymore (see
+    ResponseCache.get), or None if it can always change
+    :return source: the body of the page, in bytes
+    raises HTTPError (the same one urllib.request.urlopen raises) if the page isn't there, or
+    scheduler.RequestDeferred if it kept failing to load for reasons that might go away later
+    """
+    global response_cache, page_archive
+    if page_archive is None:
+        with response_cache_lock:
+            if page_archive is None:
+                from page_archive import PageArchive
+                page_archive = PageArchive() if PAGE_ARCHIVE_ENABLED else False
+    if page_archive and page_archive_mode != "record":
+        return replay(url)
+    if response_cache is None:
+        with response_cache_lock:
+            if response_cache is None:
+                from response_cache import ResponseCache
+                response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else False
+
+    archive_url = url
+    url = resolve_url(url)
+    source = response_cache.get(url, settled_at) if response_cache else None
+    if source is not None:
+        get_metrics().record_cache_hit(match_endpoint(url)[0])
+    else:
+        try:
+            source = get_scheduler().request(url, download)
+        except HTTPError as e:
+            if page_archive:
+                page_archive.put(archive_url, e.code, b"")
+            raise
+        if response_cache:
+            response_cache.put(url, source)
+    if page_archive:
+        # pages served from the response cache are archived too, so a replay has every page the pull used. One that the
+        # archive already holds unchanged is only hashed, never compressed or written again (see PageArchive.put)
+        page_archive.put(archive_url, 200, source)
+    return source
+
+
+def fetch_many(urls):
+    """
+    Downloads several pages at the same time (at most CRAWLER_MAX_REQUESTS_PER_HOST at once), so waiting on all of them
+    takes about as long as waiting on the slowest one
+    :param urls: list of urls built from the templates in constants.py
+    :return sources: list with the body of each page, in the same order as urls. Pages that aren't there have the
+    HTTPError that was raised in their place
+    raises scheduler.RequestDeferred if any of the pages kept failing to load
+    """
+    global fetch_pool
+    if fetch_pool is None:
+        fetch_pool = ThreadPoolExecutor(max_workers=CRAWLER_MAX_REQUESTS_PER_HOST)
+    futures = [fetch_pool.submit(fetch_url, url) for url in urls]
+    sources = []
+    for future in futures:
+        try:
+            sources.append(future.result())
+        except HTTPError as e:
+            sources.append(e)
+    return sources
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import random
+from constants import *
+from helperfunctions import to_event_title
+from stand_in_server import page_file_name
+
+########################################################################################################################
+# Writes a small synthetic copy of the parts of collegeswimming.com the scrapers read into a page directory, laid out  #
+# the same way stand_in_server.py records pages, so it can be served by the stand-in server or parsed directly. Every  #
+# html page has the nodes its parser looks for wrapped in the kind of navigation, script, and footer markup the real   #
+# website has around them, which is most of what a page costs to parse. The same seed always writes the same pages,    #
+# so benchmarks on them (benchmark_extraction.py uses them by default) can be reproduced without recording anything.   #
+#     python fixture_pages.py --directory ./fixture_pages --swimmers 30                                                #
+########################################################################################################################
+
+# {team_id: name} of the teams the pages are written for, the teams in DEFAULT_TEAMS_TO_PULL
+FIXTURE_TEAMS = {184: "Bucknell University", 141: "Lehigh University"}
+FIXTURE_SEASON = DEFAULT_YEAR_START - 1996
+# (meet_id, date) of every meet both teams swam in the season
+FIXTURE_MEETS = [(119957 + meet, "{}-{:02d}-{:02d}".format(DEFAULT_YEAR_START, 10 + meet // 4, 1 + 7 * (meet % 4)))
+                 for meet in range(10)]
+# relay events swum at every meet, and the event id they have at the meet for F and M
+FIXTURE_RELAYS = [("M200Y", {"F": 1, "M": 2}), ("F200Y", {"F": 3, "M": 4})]
+
+
+def page_chrome():
+    """
+    :return: (head, foot) html that goes before and after the part of every page a parser reads, standing in for the
+    stylesheets, scripts, menus, and footer of a real page. None of it matches anything in extraction.PAGE_NODES
+    """
+    script = "<script>window.dataLayer=window.dataLayer||[];" + "".join(
+        "dataLayer.push({{'event':'view','slot':{0},'size':[300,250]}});".format(slot) for slot in range(150)) + \
+        "</script>"
+    menu = "".join('<li class="c-nav__item"><a class="c-nav__link" href="/conference/{0}">Conference {0}</a>'
+                   '<ul class="c-nav__sub">{1}</ul></li>'.format(conference, "".join(
+                       '<li><a href="/conference/{0}/division/{1}">Division {1}</a></li>'.format(conference, division)
+                       for division in range(4)))
+                   for conference in range(60))
+    head = '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>CollegeSwimming</title>' + \
+           "".join('<link rel="stylesheet" href="/static/css/{}.css">'.format(sheet) for sheet in range(20)) + \
+           script + '</head><body><header class="c-site-header"><nav class="c-nav"><ul class="c-nav__list">' + \
+           menu + '</ul></nav></header><main class="c-page"><div class="c-page__content">'
+    foot = '</div></main><footer class="c-site-footer"><div class="c-site-footer__links">' + \
+           "".join('<p><a href="/about/{0}">About {0}</a> <span class="u-text-muted">&copy; CollegeSwimming</span></p>'
+                   .format(link) for link in range(80)) + "</div></footer>" + script + "</body></html>"
+    return head, foot
+
+
+def write_fixture_pages(page_directory, swimmers_per_team=30, seed=0):
+    """
+    Writes a season of rosters, swimmer pages, event histories, meet results, relay results, and relay splits for
+    FIXTURE_TEAMS, along with each team's homepage
+    :param page_directory: directory to write the pages in. Made if it doesn't exist
+    :param swimmers_per_team: swimmers on each team's roster, for each gender
+    :param seed: seed for the random times and lineups
+    :return: number of pages written
+    """
+    os.makedirs(page_directory, exist_ok=True)
+    rng = random.Random(seed)
+    head, foot = page_chrome()
+    events = [event for event in DEFAULT_EVENTS_TO_PULL if event[0] not in "MF"]
+    pages = {}
+
+    def put(url, body, html=True):
+        pages[url[len(SITE_ROOT):]] = head + body + foot if html else body
+
+    swimmer_id = 1000
+    # {(team_id, gender): swimmer ids on the roster}
+    rosters = {}
+    for team_id, name in FIXTURE_TEAMS.items():
+        put(TEAM_URL.format(team_id), '<div class="c-toolbar"><h1 class="c-toolbar__title">{}</h1></div>'.format(name))
+        for gender in "MF":
+            roster = rosters[(team_id, gender)] = []
+            for _ in range(swimmers_per_team):
+                swimmer_id += 1
+                roster.append(swimmer_id)
+                put(SWIMMER_URL.format(swimmer_id), '<select class="form-control input-sm js-event-id-selector">' +
+                    "".join('<option class="event" value="{0}">{0}</option>'.format(event)
+                            for event in rng.sample(events, 6)) + "</select>")
+                for event in events:
+                    history = [{"dateofswim": date, "time": round(rng.uniform(20, 120), 2), "meet_id": meet_id}
+                               for meet_id, date in rng.sample(FIXTURE_MEETS, 4)]
+                    # a swim from before the season, which every pull has to leave out
+                    history.append({"dateofswim": "{}-10-01".format(DEFAULT_YEAR_START - 2), "time": 30.0,
+                                    "meet_id": 1})
+                    put(SWIMMER_EVENT_URL.format(swimmer_id, event), json.dumps(history), html=False)
+            put(ROSTER_URL.format(team_id, gender, FIXTURE_SEASON),
+                '<h1 class="c-toolbar__title">{}</h1><table class="c-table-clean c-table-clean--middle '
+                'c-table-clean--fixed table table-hover"><tbody>{}</tbody></table>'.format(name, "".join(
+                    "<tr><td><a href=\"/swimmer/{0}\"><strong>Swimmer O'{0}</strong></a></td><td>FR</td></tr>"
+                    .format(roster_swimmer_id) for roster_swimmer_id in roster)))
+        put(RESULTS_URL.format(team_id, FIXTURE_SEASON), '<section class="c-list-grid">' + "".join(
+            '<a href="/results/{0}"><h3>Meet {0}</h3><ul class="c-list-grid__meta o-list-inline '
+            'o-list-inline--dotted"><li>Completed</li></ul><time datetime="{1}"></time></a>'.format(meet_id, date)
+            for meet_id, date in FIXTURE_MEETS) + "</section>")
+
+    splash_split_id = 5000
+    for meet_id, date in FIXTURE_MEETS:
+        for gender in "MF":
+            put(MEET_URL.format(meet_id, gender),
+                '<ul class="c-sticky-filters__list o-list-block o-list-block--divided js-max-height">' + "".join(
+                    '<li><div class="o-media o-media--flush"><div title="Completed">E{}</div><div>{}</div></div></li>'
+                    .format(event_ids[gender], to_event_title(gender + relay)) for relay, event_ids in FIXTURE_RELAYS)
+                + "</ul>")
+            for relay, event_ids in FIXTURE_RELAYS:
+                rows = []
+                for team_id in FIXTURE_TEAMS:
+                    # an A and a B relay for every team
+                    for _ in range(2):
+                        splash_split_id += 1
+                        rows.append('<tr><td><a href="/team/{}" class="team">Team</a><ol>{}</ol></td>'
+                                    '<td>1:40.00<abbr id="ssp-{}">s</abbr></td></tr>'.format(team_id, "".join(
+                                        '<li><a href="/swimmer/{}">Swimmer</a></li>'.format(leg_swimmer_id)
+                                        for leg_swimmer_id in rng.sample(rosters[(team_id, gender)], 4)),
+                                        splash_split_id))
+                        put(SPLASH_SPLITS_URL.format(splash_split_id), "<table><tbody>" + "".join(
+                            "<tr><td>Swimmer</td><td>{:.2f}</td></tr>".format(rng.uniform(22, 30)) for _ in range(4))
+                            + "</tbody></table>")
+                put(MEET_EVENT_URL.format(meet_id, event_ids[gender]), "<table>" + "".join(rows) + "</table>")
+
+    for path, body in pages.items():
+        with open(page_file_name(page_directory, path), "w") as page_file:
+            page_file.write(body)
+    return len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic collegeswimming.com pages for the stand-in server")
+    parser.add_argument("--directory", default="./fixture_pages", help="directory to write the pages in")
+    parser.add_argument("--swimmers", type=int, default=30, help="swimmers on each team's roster, for each gender")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("wrote {} pages to {}".format(write_fixture_pages(args.directory, args.swimmers, args.seed),
+                                        os.path.abspath(args.directory)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
-import urllib.request
 import json
 import sqlite3
 import random
 import re
+import time
+import numpy as np
+import pandas as pd
 from constants import *
 from helperfunctions import *
-from team_dict import *
-from bs4 import BeautifulSoup
+import fetch
+from fetch import fetch_url, fetch_many, HTTPError
+from scheduler import RequestDeferred
+from crawl_frontier import *
+from ingest import BulkIngestor, number_occurrences
+from migrations import migrate
+from team_index import find_team_id
+from extraction import make_soup
+from crawl_metrics import CrawlMetrics, ProgressDisplay, use_metrics, timed_parser
 
 ########################################################################################################################
 # College Swimming Summer Break Project 2019                                                              Brad Beacham #
@@ -19,10 +28,30 @@ from bs4 import BeautifulSoup
 ########################################################################################################################
 
 
-def request_swimmer(swimmer_id, event, search_start_timestamp, search_end_timestamp):
+########################################################################################################################
+# Page parsers. These only turn a downloaded page into python data, they never touch the network, so they can be shared
+# between the sequential scraper below and the asynchronous one in crawler.py. Each one's time is recorded in the crawl
+# metrics against the URL template of the pages it reads
+########################################################################################################################
+@timed_parser("SWIMMER_URL")
+def parse_swimmer_events(source):
     """
-    :param swimmer_id: Integer ID number of a specific swimmer
-    :param event: the code used for classifying a given event
+    :param source: raw html of a swimmer's page (SWIMMER_URL)
+    :return swimmer_events: list of all event codes that the swimmer has participated in
+    """
+    swimmer_events = []
+    soup = make_soup(source, "SWIMMER_URL")
+    selection = soup.find("select", class_="form-control input-sm js-event-id-selector")
+    if selection:
+        for eventOption in selection.find_all("option", class_="event"):
+            swimmer_events.append(eventOption["value"])
+    return swimmer_events
+
+
+@timed_parser("SWIMMER_EVENT_URL")
+def parse_event_history(source, search_start_timestamp, search_end_timestamp):
+    """
+    :param source: raw json of a swimmer's history in one event (SWIMMER_EVENT_URL)
     :param search_start_timestamp: integer timestamp representing the beginning of the time frame we are collecting
     data from
     :param search_end_timestamp: integer timestamp representing the end of the time frame we are collecting data from
@@ -30,62 +59,26 @@ def request_swimmer(swimmer_id, event, search_start_timestamp, search_end_timest
     achieved by the swimmer in that event, and the third column is the numerical ID of the meet they were competing in.
     """
     swimmer_data = []
-    swimmer_events = []  # This will be filled with the list of all events that this swimmer has participated in
-    url = SWIMMER_URL.format(swimmer_id)
-    try:  # to open a url for that swimmer and read their data
-        page = urllib.request.urlopen(url)
-        source = page.read()
-    except urllib.request.HTTPError as e:
-        print(e)  # otherwise print out the error and return empty list
-        return [[0,0,0]]
-    soup = BeautifulSoup(source, 'html.parser')
-    selection = soup.find("select", class_="form-control input-sm js-event-id-selector")
-    if selection:
-        for eventOption in selection.find_all("option", class_="event"):
-            swimmer_events.append(eventOption["value"])
-
-    # If the event you want data on is contained within the list of events that swimmer has participated in, then add
-    # that data to swimmer_data
-    if event in swimmer_events:
-        url = SWIMMER_EVENT_URL.format(swimmer_id, event)
-        try:  # open and read url containing info on "event" for "swimmer_id"
-            page = urllib.request.urlopen(url)
-            source = page.read()
-        except urllib.request.HTTPError as e:
-            print(e)
-            return [[0,0,0]]
-        event_history = json.loads(source)
-        for swim in event_history:
-            # convert the date string of a swim to time since epoch (in seconds)
-            split_date = swim["dateofswim"].split("-")
-            date = convert_to_time(int(split_date[0]), int(split_date[1]), int(split_date[2]))
-            # if the swim occurred during desired time frame, add it to swimmer_data
-            if search_start_timestamp < date < search_end_timestamp:
-                swim_list = [date, swim["time"], swim["meet_id"]]
-                swimmer_data.append(swim_list)
+    event_history = json.loads(source)
+    for swim in event_history:
+        # convert the date string of a swim to time since epoch (in seconds)
+        split_date = swim["dateofswim"].split("-")
+        date = convert_to_time(int(split_date[0]), int(split_date[1]), int(split_date[2]))
+        # if the swim occurred during desired time frame, add it to swimmer_data
+        if search_start_timestamp < date < search_end_timestamp:
+            swim_list = [date, swim["time"], swim["meet_id"]]
+            swimmer_data.append(swim_list)
     return swimmer_data
 
 
-def get_roster(team_id, season, gender):
+@timed_parser("ROSTER_URL")
+def parse_roster(source):
     """
-    Input: a team_id, season, and gender used to uniquely identify a team
-    Output: List of tuples containing swimmer names and IDs
-    :param team_id: integer ID for a team
-    :param season: string representing the season we are looking at (e.g. "2017-2018" season)
-    :param gender: String M or F representing Men's or Women's roster
+    :param source: raw html of a team's roster page (ROSTER_URL)
     :return team: a dictionary containing the team name and the names and ID's of all team members from the given season
     """
     team = {}
-    #gets a list of (Name, swimmer_id) tuples and the team name for a given team_id
-    url = ROSTER_URL.format(team_id, gender, season)
-    try:  # open the url for the given team_id, season, and gender
-        page = urllib.request.urlopen(url)
-        source = page.read()
-    except urllib.request.HTTPError as e:
-        print(e) # otherwise print out the error and return empty tuple
-        return {}
-
-    soup = BeautifulSoup(source, 'html.parser')
+    soup = make_soup(source, "ROSTER_URL")
     # find the team name from BeautifulSoup
     team["name"] = soup.find("h1", class_="c-toolbar__title").text
     # find table containing full team roster from BeautifulSoup
@@ -99,22 +92,13 @@ def get_roster(team_id, season, gender):
     return team
 
 
-def get_team_results(team_id, season):
+@timed_parser("RESULTS_URL")
+def parse_team_results(source):
     """
-    :param team_id: integer id of the team to collect meets for (e.g. 184)
-    :param season: string season from which you are collecting meets (e.g. "2018-2019")
+    :param source: raw html of the page listing all meets a team swam in during a season (RESULTS_URL)
     :return meets: dictionary of meet ids, names, and dates (for the purpose of filling in date slot in relays)
     """
-    url = RESULTS_URL.format(team_id, season)
-    try:  # open url for page containing all meets that given team participated in during given season
-        page = urllib.request.urlopen(url)
-        source = page.read()
-    except urllib.request.HTTPError as e:
-        print(e) # otherwise print out the error and return empty tuple
-        return {}
-
-    soup = BeautifulSoup(source, 'html.parser')
-    print("getting meets for team {} during season {}".format(team_id, season))
+    soup = make_soup(source, "RESULTS_URL")
     # meets["team_name"] = soup.find("h1", class_="c-toolbar__title").text
 
     meets = {}
@@ -131,14 +115,188 @@ def get_team_results(team_id, season):
         meet_date = convert_to_time(int(split_date[0]), int(split_date[1]), int(split_date[2]))
 
         meets[meet_id] = {"meet_name": meet_name, "meet_date": meet_date, "submitted": meet_submitted}
+    return meets
+
+
+@timed_parser("MEET_URL")
+def parse_meet_event_ids(source):
+    """
+    :param source: raw html of a meet's results page for one gender (MEET_URL)
+    :return event_id_dict: dictionary of event names to event id's for given meet, or None if the meet has no results
+    """
+    soup = make_soup(source, "MEET_URL")
+    event_id_dict = {}
+    # Find list of all events from meet for given gender
+    event_list = soup.find("ul", class_="c-sticky-filters__list o-list-block o-list-block--divided js-max-height")
+    if event_list is None:
+        return None
+    # add all events from the meet to event_id_dict
+    for event in event_list.find_all("div", class_="o-media o-media--flush"):
+        event = event.find("div", title="Completed")
+        event_id = int(re.sub("[^0-9]", "", event.text))
+        event_name = event.find_next_sibling("div").text
+        event_id_dict[event_name] = event_id
+    return event_id_dict
+
+
+def parse_relay_teams(source, team_id):
+    """
+    :param source: raw html of the results of one relay event at a meet (MEET_EVENT_URL)
+    :param team_id: the team whose relay teams you want to find in the results
+    :return relay_teams: list of (swimmer_id_list, splash_split_id) tuples, one for each relay team that team_id entered
+    and that wasn't disqualified, in the order they appear in the results
+    """
+    return parse_relay_results(source, [team_id])[team_id]
+
+
+@timed_parser("MEET_EVENT_URL")
+def parse_relay_results(source, team_ids):
+    """
+    Same as parse_relay_teams, but finds the relay teams of several teams while only parsing the page once
+    :param source: raw html of the results of one relay event at a meet (MEET_EVENT_URL)
+    :param team_ids: list of the teams whose relay teams you want to find in the results
+    :return relay_results: dictionary of {team_id: relay_teams} with relay_teams as returned by parse_relay_teams
+    """
+    soup = make_soup(source, "MEET_EVENT_URL")
+    relay_results = {}
+    for team_id in team_ids:
+        relay_results[team_id] = parse_team_relay_teams(soup, team_id)
+    return relay_results
+
+
+def parse_team_relay_teams(soup, team_id):
+    relay_teams = []
+    # find all times that team_id is mentioned in BeautifulSoup
+    team_instances = soup.find_all("a", href="/team/{}".format(team_id))  # find out actual name for relay teams
+    for team in team_instances:
+        if len(team.attrs) == 2:  # team names are mentioned multiple times in each row, check for correct column
+            # if a team was disqualified, skip it
+            if "DQ" in team.find_parent('td').find_next_sibling().text:
+                print("excluding disqualified team.")
+                continue
+
+            # get list of all 4 swimmers on relay team
+            swimmer_id_list = []
+            table_soup = team.find_next_sibling('ol')
+            for swimmer in table_soup.find_all('a'):
+                swimmer_id_list.append(swimmer['href'].split('/')[2])
+
+            # id used to look up the split times of the swimmers on this relay team
+            splash_split_id = team.find_parent('td').find_next_sibling().find('abbr')['id'][4:]
+            relay_teams.append((swimmer_id_list, splash_split_id))
+    return relay_teams
+
+
+@timed_parser("SPLASH_SPLITS_URL")
+def parse_splash_splits(source):
+    """
+    :param source: raw html of the split times of a single relay team (SPLASH_SPLITS_URL)
+    :return times: list of leg times as strings, or None if no splits were recorded
+    """
+    # NOTE: this might be an issue if names are available but not splits. see if this is a possible situation
+    splash_soup = make_soup(source, "SPLASH_SPLITS_URL").tbody
+    if splash_soup is None:
+        return None
+    times = []
+    for row in splash_soup.find_all("tr"):
+        if row.find_all("td")[-1].text[0].isdigit():  # in relays longer than 200Y, not all rows have leg times.
+            times.append(row.find_all("td")[-1].text)  # this is the leg time for a given swimmer.
+    return times
+
+
+########################################################################################################################
+# Sequential scraper
+########################################################################################################################
+def request_swimmer_events(swimmer_id):
+    """
+    :param swimmer_id: Integer ID number of a specific swimmer
+    :return swimmer_events: list of all events that this swimmer has participated in, or None if their page didn't load
+    """
+    url = SWIMMER_URL.format(swimmer_id)
+    try:  # to open a url for that swimmer and read their data
+        source = fetch_url(url)
+    except HTTPError as e:
+        print(e)  # otherwise print out the error and return nothing
+        return None
+    return parse_swimmer_events(source)
+
+
+def request_swimmer(swimmer_id, event, search_start_timestamp, search_end_timestamp, swimmer_events=None):
+    """
+    :param swimmer_id: Integer ID number of a specific swimmer
+    :param event: the code used for classifying a given event
+    :param search_start_timestamp: integer timestamp representing the beginning of the time frame we are collecting
+    data from
+    :param search_end_timestamp: integer timestamp representing the end of the time frame we are collecting data from
+    :param swimmer_events: the swimmer's events from request_swimmer_events. Pass this in when asking for more than one
+    event so the swimmer's page is only downloaded once. If it's left out the page is downloaded here.
+    :return swimmer_data: a 2-D array where the first column is the date a swim took place, second column is the time
+    achieved by the swimmer in that event, and the third column is the numerical ID of the meet they were competing in.
+    Empty if the swimmer's pages aren't there
+    raises RequestDeferred if a page kept failing to load, so the swims can be asked for again later
+    """
+    if swimmer_events is None:
+        swimmer_events = request_swimmer_events(swimmer_id)
+        if swimmer_events is None:
+            return []
+
+    # If the event you want data on is contained within the list of events that swimmer has participated in, then add
+    # that data to swimmer_data
+    if event not in swimmer_events:
+        return []
+    url = SWIMMER_EVENT_URL.format(swimmer_id, event)
+    try:  # open and read url containing info on "event" for "swimmer_id"
+        # only swims from before the end of the time frame are used, so once it's over a cached copy stays good
+        source = fetch_url(url, search_end_timestamp)
+    except HTTPError as e:
+        print(e)
+        return []
+    return parse_event_history(source, search_start_timestamp, search_end_timestamp)
+
+
+def get_roster(team_id, season, gender):
+    """
+    Input: a team_id, season, and gender used to uniquely identify a team
+    Output: List of tuples containing swimmer names and IDs
+    :param team_id: integer ID for a team
+    :param season: string representing the season we are looking at (e.g. "2017-2018" season)
+    :param gender: String M or F representing Men's or Women's roster
+    :return team: a dictionary containing the team name and the names and ID's of all team members from the given season
+    """
+    #gets a list of (Name, swimmer_id) tuples and the team name for a given team_id
+    url = ROSTER_URL.format(team_id, gender, season)
+    try:  # open the url for the given team_id, season, and gender
+        source = fetch_url(url)
+    except HTTPError as e:
+        print(e) # otherwise print out the error and return empty tuple
+        return {}
+    return parse_roster(source)
+
+
+def get_team_results(team_id, season):
+    """
+    :param team_id: integer id of the team to collect meets for (e.g. 184)
+    :param season: string season from which you are collecting meets (e.g. "2018-2019")
+    :return meets: dictionary of meet ids, names, and dates (for the purpose of filling in date slot in relays)
+    """
+    url = RESULTS_URL.format(team_id, season)
+    try:  # open url for page containing all meets that given team participated in during given season
+        source = fetch_url(url)
+    except HTTPError as e:
+        print(e) # otherwise print out the error and return empty tuple
+        return {}
+
+    print("getting meets for team {} during season {}".format(team_id, season))
+    meets = parse_team_results(source)
     print(meets)
     return meets
 
 
-def get_meet_event_ids(meet, gender):
+def get_meet_event_ids(meet, gender, settled_at=None):
     """
     :param meet: unique integer ID representing a meet
     :param gender: character M,F,X representing gender (male, female, mixed) to get events for
+    :param settled_at: timestamp of the end of the meet's season, after which its results can't change
     :return event_id_dict: dictionary of event id's to event names for given meet
     #TODO: get this to work without a gender input
         #NOTE: if gender is not specified, it goes to a default gender (or last one you looked at on any page)
@@ -147,26 +305,14 @@ def get_meet_event_ids(meet, gender):
     """
     url = MEET_URL.format(meet, gender)
     try:  # open url for given meet looking at results for gender
-        page = urllib.request.urlopen(url)
-        source = page.read()
-    except urllib.request.HTTPError as e:
+        source = fetch_url(url, settled_at)
+    except HTTPError as e:
         print(e)  # otherwise print out the error and return empty tuple
         return {}
 
-    soup = BeautifulSoup(source, 'html.parser')
     print("getting event_ids for meet {} for gender {}".format(meet, gender))
-    # meets["team_name"] = soup.find("h1", class_="c-toolbar__title").text
-
-    event_id_dict = {}
-    # Find list of all events from meet for given gender
-    event_list = soup.find("ul", class_="c-sticky-filters__list o-list-block o-list-block--divided js-max-height")
-    if event_list is not None:
-        # add all events from the meet to event_id_dict
-        for event in event_list.find_all("div", class_="o-media o-media--flush"):
-            event = event.find("div", title="Completed")
-            event_id = int(re.sub("[^0-9]", "", event.text))
-            event_name = event.find_next_sibling("div").text
-            event_id_dict[event_name] = event_id
+    event_id_dict = parse_meet_event_ids(source)
+    if event_id_dict is not None:
         print(event_id_dict)
         return event_id_dict
     else:
@@ -174,131 +320,460 @@ def get_meet_event_ids(meet, gender):
         return {"MEET NOT SUBMITTED": 0}
 
 
-# you could also do this by looking it up by team, then you just have to visit every meet.
-def get_relay_leg_times(team_id, meet_id, relay_id):
+def get_relay_leg_times(team_ids, meet_id, relay_id, settled_at=None):
     """
-    :param team_id: the team whose data you want to collect for the given relay event
+    :param team_ids: list of the teams whose data you want to collect for the given relay event
     :param meet_id: the id of the meet they competed in
     :param relay_id: the id for the relay event at that particular meet
-    :return relay_leg_times:
+    :param settled_at: timestamp of the end of the meet's season, after which its results can't change
+    :return relay_leg_times: dictionary of {team_id: list of (swimmer_id, leg_time) pairs} for every team in team_ids
+    whose results were gone through, with an empty list for teams that didn't swim the relay. Teams whose splits didn't
+    load or weren't recorded are left out, and None is returned if the results page didn't load
     """
-    # get IDs of the swimmers on a university's relay team(s)
+    # get IDs of the swimmers on every team's relay team(s). The results page is only downloaded once for all of them
     url = MEET_EVENT_URL.format(meet_id, relay_id)
     try:  # open url for results of the relay in the meet designated by meet_id and relay_id
-        page = urllib.request.urlopen(url)
-        source = page.read()
-    except urllib.request.HTTPError as e:
-        print(e)  # otherwise print out the error and return empty tuple
-        return ([],[])
-    soup = BeautifulSoup(source, "html.parser")
+        source = fetch_url(url, settled_at)
+    except HTTPError as e:
+        print(e)  # otherwise print out the error and return nothing
+        return None
+
+    # every relay team's split times are on their own page, so download all of them at once
+    relay_teams = [(team_id, relay_swimmers, splash_split_id)
+                   for team_id, team_relay_teams in parse_relay_results(source, team_ids).items()
+                   for relay_swimmers, splash_split_id in team_relay_teams]
+    splash_sources = fetch_many([SPLASH_SPLITS_URL.format(splash_split_id)
+                                 for team_id, relay_swimmers, splash_split_id in relay_teams])
+
+    # {team_id: (swimmer_id_list, times)} with the swimmers and leg times of all of a team's relay teams, in order
+    team_legs = {}
+    skipped_teams = set()
+    for (team_id, relay_swimmers, splash_split_id), splash_source in zip(relay_teams, splash_sources):
+        if team_id in skipped_teams:
+            continue
+        if isinstance(splash_source, HTTPError):
+            print(splash_source)  # the team's legs can't be matched up without every relay team's splits, skip it
+            skipped_teams.add(team_id)
+            continue
+        # add split times, if they were recorded
+        leg_times = parse_splash_splits(splash_source)
+        if leg_times is None:
+            print("no splits available for meet {}".format(meet_id))
+            skipped_teams.add(team_id)
+            continue
+        swimmer_id_list, times = team_legs.setdefault(team_id, ([], []))
+        swimmer_id_list.extend(relay_swimmers)
+        times.extend(leg_times)
+
+    relay_leg_times = {}
+    for team_id in team_ids:
+        if team_id not in skipped_teams:
+            swimmer_id_list, times = team_legs.get(team_id, ([], []))
+            if swimmer_id_list:
+                print(swimmer_id_list)
+                print(times)
+            relay_leg_times[team_id] = list(zip(swimmer_id_list, times))
+    return relay_leg_times
 
-    swimmer_id_list = []
-    times = []
-    # find all times that team_id is mentioned in BeautifulSoup
-    team_instances = soup.find_all("a", href="/team/{}".format(team_id))  # find out actual name for relay teams
-    # get relay leg times by relay team (note that all relay teams checked are from same main team)
-    for team in team_instances:
-        if len(team.attrs) == 2:  # team names are mentioned multiple times in each row, check for correct column
-            # if a team was disqualified, skip it
-            if "DQ" in team.find_parent('td').find_next_sibling().text:
-                print("excluding disqualified team.")
-                continue
 
-            # get list of all 4 swimmers on relay team
-            table_soup = team.find_next_sibling('ol')
-            for swimmer in table_soup.find_all('a'):
-                swimmer_id_list.append(swimmer['href'].split('/')[2])
+def name_relay_legs(relay_results, relay_string, team_id, gender, meet_id, meet_date):
+    """
+    :param relay_results: list of (swimmer_id, leg_time) pairs for every relay team a team entered in one relay event,
+    in the order they were swum
+    :param relay_string: the relay event code (e.g. M200Y)
+    :param team_id: the ID number of the team that swam the relays
+    :param gender: a character M,F,X representing Male, Female, or Mixed
+    :param meet_id: the id of the meet the relays were swum at
+    :param meet_date: integer timestamp of the day of the meet
+    :return relay_swims: 2D list where rows are individual relay legs and columns are in following format:
+    [swimmer_id, team_id, time, 0, meet_id, gender, event_code, date]
+    """
+    # used to differentiate between relay teams within a team
+    team_letter = {0: "A", 1: "B", 2: "C", 3: "D", 4: "E", 5: "F"}
+    medley_leg_dict = {0: "LM", 1: "2M", 2: "3M", 3: "4M"}
 
-            # get the split times of the 4 swimmers on a relay team
-            splash_split_id = team.find_parent('td').find_next_sibling().find('abbr')['id'][4:]
-            splash_splits_url = SPLASH_SPLITS_URL.format(splash_split_id)
-            try:  # open url with table of relay split time table
-                page = urllib.request.urlopen(splash_splits_url)
-                splash_source = page.read()
-            except urllib.request.HTTPError as e:
-                print(e) # otherwise print out the error and return empty tuple
-                return ([],[])
-
-            # add split times, if they were recorded
-            # NOTE: this might be an issue if names are available but not splits. see if this is a possible situation
-            splash_soup = BeautifulSoup(splash_source,"html.parser").tbody
-            if splash_soup is None:
-                print("no splits available for meet {}".format(meet_id))
-                return []
-            for row in splash_soup.find_all("tr"):
-                if row.find_all("td")[-1].text[0].isdigit():  # in relays longer than 200Y, not all rows have leg times.
-                    times.append(row.find_all("td")[-1].text)  # this is the leg time for a given swimmer.
+    relay_swims = []
+    for i in range(len(relay_results)):
+        # NOTE: This assumes teams place exactly as planned
+        if relay_string[0] == "M":
+            # Event is a medley relay, so names relay legs accordingly as events
+            leg_name = medley_leg_dict[i%4] + str(int(relay_string[1:-1])//4) + team_letter[i//4]
+        elif relay_string[0] == "F":
+            # Event is freestyle relay, so names relay legs accordingly as events
+            if i % 4 != 0:
+                leg_name = "1F" + str(int(relay_string[1:-1])//4) + team_letter[i//4]
+            else:
+                leg_name = "LF" + str(int(relay_string[1:-1])//4) + team_letter[i//4]
         else:
             continue
-    print(swimmer_id_list)
-    print(times)
-    relay_leg_times = list(zip(swimmer_id_list, times))
-    return relay_leg_times
+        relay_swims.append([relay_results[i][0], team_id, relay_results[i][1], 0, meet_id, gender, leg_name, meet_date])
+    return relay_swims
+
+
+def get_meet_relays(meet_id, meet_date, gender, relay_teams):
+    """
+    Goes through the results of a meet once, collecting the relay legs of every team being pulled
+    :param meet_id: the id of the meet
+    :param meet_date: integer timestamp of the day of the meet
+    :param gender: a character M,F,X representing Male, Female, or Mixed
+    :param relay_teams: dictionary of {relay event: list of the ID numbers of the teams whose legs are being collected}
+    as made by meet_relay_teams
+    :return relay_swims: relay legs in the format made by name_relay_legs
+    :return pulled: list of (team_id, relay event) for every team and relay whose results were gone through. Ones whose
+    pages didn't load or had no splits are left out, so they are tried again by the next pull
+    """
+    relay_swims = []
+    pulled = []
+    # the meet's pages can't change once its season is over
+    settled_at = season_end(meet_date, SEASON_LINE_MONTH, SEASON_LINE_DAY)
+    # all events in the meet that gender participated in
+    event_ids = get_meet_event_ids(meet_id, gender, settled_at)
+    if not event_ids or "MEET NOT SUBMITTED" in event_ids:
+        return relay_swims, pulled
+    # add data on all relay types in relay_teams to relay_swims
+    for relay_string, team_ids in relay_teams.items():
+        event_name = to_event_title(gender + relay_string)
+        if event_name not in event_ids:
+            # the meet didn't have this relay, so there is nothing to pull
+            pulled.extend((team_id, relay_string) for team_id in team_ids)
+            continue
+        # get all relay leg times for every team in meet meet_id for relay relay_string
+        relay_leg_times = get_relay_leg_times(team_ids, meet_id, event_ids[event_name], settled_at)
+        for team_id, relay_results in (relay_leg_times or {}).items():
+            relay_swims.extend(name_relay_legs(relay_results, relay_string, team_id, gender, meet_id, meet_date))
+            pulled.append((team_id, relay_string))
+    return relay_swims, pulled
+
+
+def meet_relay_teams(pulled, team_to_pull, relay_team_ids, relays_to_pull):
+    """
+    :param pulled: dictionary of {relay event: set of team ids} already pulled from a meet (see pulled_meet_teams)
+    :param team_to_pull: the ID number of the team whose meet it is
+    :param relay_team_ids: list of the ID numbers of every team whose relays are being pulled
+    :param relays_to_pull: List of relay events to pull. (e.g. MM200 = Men's 200 Yard Medley Relay)
+    :return relay_teams: dictionary of {relay event: list of team ids} for every relay in relays_to_pull that
+    team_to_pull hasn't been pulled from the meet for yet, with every team in relay_team_ids that hasn't either. Empty
+    if team_to_pull has already been pulled for all of them
+    """
+    relay_teams = {}
+    for relay_string in relays_to_pull:
+        pulled_teams = pulled.get(relay_string, set())
+        if team_to_pull in pulled_teams:
+            continue
+        # every team being pulled that hasn't been pulled from this meet yet gets its legs from the same pages
+        team_ids = [team_id for team_id in relay_team_ids if team_id not in pulled_teams]
+        if team_to_pull not in team_ids:
+            team_ids.append(team_to_pull)
+        relay_teams[relay_string] = team_ids
+    return relay_teams
 
 
-def get_relay_swim_data(team_to_pull, gender_to_pull, season_to_pull, relays_to_pull):
+def get_relay_swim_data(team_to_pull, gender_to_pull, season_to_pull, relays_to_pull, relay_team_ids=None,
+                        pulled_meets=None):
     """
     :param team_to_pull: the ID number of the team whose data is being collected
     :param gender_to_pull: a character M,F,X representing Male, Female, or Mixed
     :param season_to_pull: a string representing the season/year the data is being pulled from
     :param relays_to_pull: List of relay events to pull. (e.g. MM200 = Men's 200 Yard Medley Relay)
+    :param relay_team_ids: list of the ID numbers of every team whose relays are being pulled. Their legs are collected
+    from each of team_to_pull's meets at the same time as team_to_pull's. Leaving this out only pulls team_to_pull
+    :param pulled_meets: dictionary of {meet_id: {relay event: set of team ids}} of the relays already pulled from each
+    meet (see pulled_meet_teams). Relays team_to_pull has already been pulled for are skipped
     :return relay_swims: 2D list where rows are individual swims and columns are in following format:
-    [swimmer_id, team_id, time, 0, meet_id, gender, event_code, date, 0, snapshot_id]
-    which is identical to the format in which new rows are added to swims table
+    [swimmer_id, team_id, time, 0, meet_id, gender, event_code, date]
+    which is identical to the format in which new rows are added to swims table (without taper and snapshot)
+    :return meets: dictionary of all of team_to_pull's meets in the season, as returned by get_team_results
+    :return meet_teams: dictionary of {meet_id: list of (team_id, relay event)} of the relays that were pulled from each
+    meet, as returned by get_meet_relays
     """
-    # used to differentiate between relay teams within a team
-    team_letter = {0: "A", 1: "B", 2: "C", 3: "D", 4: "E", 5: "F"}
-
-    # Event is a medley relay, so names relay legs accordingly as events and appends them to relay_swims
-    def medley():
-        medley_leg_dict = {0: "LM", 1: "2M", 2: "3M", 3: "4M"}
-        for i in range(len(relay_results)):
-            # NOTE: This assumes teams place exactly as planned
-            medley_leg_name = medley_leg_dict[i%4] + str(int(relay_string[1:-1])//4) + team_letter[i//4]
-            relay_swims.append([relay_results[i][0], team_to_pull, relay_results[i][1], 0, meet_id, gender_to_pull,
-                                medley_leg_name, meets[meet_id]["meet_date"]])
-
-    # Event is freestyle relay, so names relay legs accordingly as events and appends them to relay_swims
-    def freestyle():
-        for i in range(len(relay_results)):
-            if i % 4 != 0:
-                # NOTE: This assumes teams place exactly as planned
-                freestyle_leg_name = "1F" + str(int(relay_string[1:-1])//4) + team_letter[i//4]
-            else:
-                freestyle_leg_name = "LF" + str(int(relay_string[1:-1])//4) + team_letter[i//4]
-
-            relay_swims.append([relay_results[i][0], team_to_pull, relay_results[i][1], 0, meet_id, gender_to_pull,
-                                freestyle_leg_name, meets[meet_id]["meet_date"]])
-
+    relay_team_ids = relay_team_ids or [team_to_pull]
+    pulled_meets = pulled_meets or {}
     relay_swims = []
+    meet_teams = {}
 
     # get full dictionary of meets and their data
     meets = get_team_results(team_to_pull, season_to_pull)  # can have this work the same way that get_swim_data does later if that helps
-    list_of_meets = list(meets.keys())
-
-    for meet_id in list_of_meets:
-        if meets[meet_id]["submitted"]:
-            # add "events" key to meets, containing all events in meet that gender_to_pull participated in
-            meets[meet_id]["events"] = get_meet_event_ids(meet_id, gender_to_pull)
-            # add data on all relay types in relays_to_pull to relay_swims
-            for relay_string in relays_to_pull:
-                event_name = to_event_title(gender_to_pull + relay_string)
-                if event_name in meets[meet_id]["events"]:
-                    # get all relay leg times for team_to_pull in meet meet_id for relay relay_string
-                    relay_results = get_relay_leg_times(team_to_pull, meet_id, meets[meet_id]["events"][event_name])
-                    if relay_string[0] is "M":
-                        medley()
-                    elif relay_string[0] is "F":
-                        freestyle()
-        else:
-            print("Results for {} not submitted".format(meets[meet_id]["meet_name"]))
-    return relay_swims, meets  # NOTE: can add meets as a return value to use it to make meets database table
+
+    for meet_id, meet in meets.items():
+        if not meet["submitted"]:
+            print("Results for {} not submitted".format(meet["meet_name"]))
+            continue
+        relay_teams = meet_relay_teams(pulled_meets.get(int(meet_id), {}), team_to_pull, relay_team_ids,
+                                       relays_to_pull)
+        if not relay_teams:
+            print("Relays for {} already pulled".format(meet["meet_name"]))
+            continue
+        meet_relay_swims, meet_teams[meet_id] = get_meet_relays(meet_id, meet["meet_date"], gender_to_pull,
+                                                                relay_teams)
+        relay_swims.extend(meet_relay_swims)
+    return relay_swims, meets, meet_teams
+
+
+def pulled_meet_teams(cursor, gender):
+    """
+    :param cursor: cursor of the open sqlite database
+    :param gender: a character M,F,X representing Male, Female, or Mixed
+    :return pulled_meets: dictionary of {meet_id: {relay event: set of team ids}} for every meet in the MeetRelays table
+    """
+    pulled_meets = {}
+    for meet_id, team_id, event in cursor.execute("SELECT meet_id, team_id, event FROM MeetRelays WHERE gender=?;",
+                                                  (gender,)):
+        pulled_meets.setdefault(meet_id, {}).setdefault(event, set()).add(team_id)
+    return pulled_meets
+
+
+def start_snapshot(cursor, teams_to_pull, year_start, year_end, events_to_pull):
+    """
+    Makes sure all of the tables exist, upgrades the database to the newest schema (see migrations.py), and records the
+    parameters of this pull in the Snapshots table
+    :param cursor: cursor of the open sqlite database
+    :param teams_to_pull: list of integer team ids being pulled
+    :param year_start: Integer value of year to start pulling data from
+    :param year_end: Integer value of final year for data pull
+    :param events_to_pull: List of event codes for events to pull data on
+    :return snapshot_id: integer id that every row added during this pull is tagged with
+    """
+    # add information about this snapshot to the Snapshots table (and create it if it doesn't exist)
+    cursor.execute(CREATE_SNAPSHOT_TABLE_COMMAND)
+    snapshot_id = random.randint(0, 4294967295)  # what are the odds? 100% I'm a lazy programmer << NOTE: change this
+
+    # create a Snapshot entry of the new data being pulled. This is essentially a changelog
+    date_range_string = "{0}.{1}.{2}-{3}.{1}.{2}".format(year_start, SEASON_LINE_MONTH, SEASON_LINE_DAY, year_end)
+    teams_string = ",".join(str(team) for team in teams_to_pull)
+    events_string = ",".join(events_to_pull)
+    cursor.execute(INSERT_SNAPSHOT_COMMAND.format(snapshot_id, date_range_string, teams_string, events_string))
+
+    # ensure the existence of each event table and the Teams/Swimmers tables
+    cursor.execute(CREATE_SWIMS_TABLE)
+    cursor.execute(CREATE_SWIMMER_TABLE.format("Swimmers"))
+    cursor.execute(CREATE_TEAM_TABLE.format("Teams"))
+    cursor.execute(CREATE_MEET_TABLE)
+    cursor.execute(CREATE_MEET_RELAYS_TABLE)
+    migrate(cursor.connection)
+    return snapshot_id
+
+
+def scale_season_times(cursor, year_start, year_end, events_to_pull, genders_to_pull, partitions=None):
+    """
+    Fills out the scaled column of Swims with the z-score of each time compared to every other time in the same event,
+    season, and gender. The average and standard deviation of every event and season are worked out in a temporary
+    ScaleStats table, then every swim is scaled by a single UPDATE
+    :param cursor: cursor of the open sqlite database
+    :param year_start: Integer value of first season to scale
+    :param year_end: Integer value of the year after the last season to scale
+    :param events_to_pull: List of (non relay) event codes to scale
+    :param genders_to_pull: List of characters M, F, representing Male and Female
+    :param partitions: set of (gender + event, simple_year) to scale (like BulkIngestor.touched_partitions()). Every
+    other event and season is left as it is. None scales every event and season in the range
+    """
+    print("Scaling times")
+    cursor.execute(CREATE_SCALE_STATS_TABLE)
+    cursor.execute("DELETE FROM ScaleStats;")
+    for simple_year in range(year_start, year_end):
+        season_start_timestamp = convert_to_time(int(simple_year), SEASON_LINE_MONTH, SEASON_LINE_DAY)
+        season_end_timestamp = convert_to_time(int(simple_year) + 1, SEASON_LINE_MONTH, SEASON_LINE_DAY)
+        event_codes = [gender + event for event in events_to_pull for gender in genders_to_pull
+                       if partitions is None or (gender + event, simple_year) in partitions]
+        if not event_codes:
+            continue
+        # calculate average times for each event by gender
+        cursor.execute("INSERT INTO ScaleStats (event, season_start, season_end, average) "
+                       "SELECT event, ?, ?, avg(time) FROM Swims WHERE event IN ({}) AND date>? AND date<? "
+                       "GROUP BY event;".format(", ".join("?" * len(event_codes))),
+                       [season_start_timestamp, season_end_timestamp] + event_codes +
+                       [season_start_timestamp, season_end_timestamp])
+        missing_events = set(event_codes) - {row[0] for row in cursor.execute(
+            "SELECT event FROM ScaleStats WHERE season_start=?;", (season_start_timestamp,))}
+        for event_code in sorted(missing_events):
+            print("No data was available on event {}".format(event_code[1:]))
+    # standard deviation of every event-gender pairing, measured from its average
+    cursor.execute("UPDATE ScaleStats SET variance=spread.variance FROM "
+                   "(SELECT ScaleStats.rowid AS stats_id, "
+                   "avg((Swims.time - ScaleStats.average) * (Swims.time - ScaleStats.average)) AS variance "
+                   "FROM Swims JOIN ScaleStats ON Swims.event=ScaleStats.event AND Swims.date>ScaleStats.season_start "
+                   "AND Swims.date<ScaleStats.season_end GROUP BY ScaleStats.rowid) AS spread "
+                   "WHERE ScaleStats.rowid=spread.stats_id;")
+    stats = cursor.execute("SELECT rowid, event, season_start, average, variance FROM ScaleStats "
+                           "ORDER BY season_start, event;").fetchall()
+    for stats_id, event_code, season_start, average, variance in stats:
+        print("average for {} in {}: {}".format(event_code, season_year(season_start + 1, SEASON_LINE_MONTH,
+                                                                       SEASON_LINE_DAY), average))
+    # events where every time is the same can't be scaled, so their swims are given a z-score of 0
+    cursor.executemany("UPDATE ScaleStats SET sd=? WHERE rowid=?;",
+                       [(variance ** .5 if variance else None, stats_id)
+                        for stats_id, event_code, season_start, average, variance in stats])
+    # calculate z-score of every time in one pass
+    cursor.execute("UPDATE Swims SET scaled=coalesce((Swims.time - ScaleStats.average) / ScaleStats.sd, 0) "
+                   "FROM ScaleStats WHERE Swims.event=ScaleStats.event AND Swims.date>ScaleStats.season_start "
+                   "AND Swims.date<ScaleStats.season_end;")
+    cursor.execute("DROP TABLE ScaleStats;")
+    print("scaled")
+
+
+def find_taper_swims(cursor, year_start, year_end, teams_to_pull):
+    """
+    Fills out the taper column of Swims (see the README for what each value means). The swims of every team and season
+    are loaded at once and every day a team swam is classified together, then the taper values are written back with a
+    single UPDATE
+    :param cursor: cursor of the open sqlite database
+    :param year_start: Integer value of first season to look at
+    :param year_end: Integer value of the year after the last season to look at
+    :param teams_to_pull: list of integer team ids to look at
+    """
+    print("\nFinding taper swims")
+    # season_lines[i] is where the season starting in year_start + i begins, and the one before it ends
+    season_lines = [convert_to_time(simple_year, SEASON_LINE_MONTH, SEASON_LINE_DAY)
+                    for simple_year in range(year_start, year_end + 1)]
+    for simple_year in range(year_start, year_end):
+        print("Season {}-{}".format(simple_year, simple_year + 1))
+        print("From timestamp {} to {}".format(season_lines[simple_year - year_start],
+                                               season_lines[simple_year - year_start + 1]))
+    cursor.execute("SELECT team, date, scaled FROM Swims WHERE team IN ({}) AND date>? AND date<?;".format(
+        ", ".join("?" * len(teams_to_pull))), list(teams_to_pull) + [season_lines[0], season_lines[-1]])
+    swims = pd.DataFrame(cursor.fetchall(), columns=["team", "date", "scaled"])
+    # swims that fall right on a season line aren't in any season
+    swims = swims[~swims["date"].isin(season_lines)]
+    swims["season"] = np.searchsorted(season_lines, swims["date"])
+
+    # every day each team swam, with how many swims it had that day and their average scaled time
+    days = swims.groupby(["team", "season", "date"])["scaled"].agg(["size", "mean"]).reset_index()
+    # days where exactly 7 swims were recorded are left out. this is indicative of a glitch where I cannot isolate which
+    # roster a swimmer is in if they switched team. They still count towards the number of days the team swam though
+    counted = days["size"] != 7
+    team_seasons = [days["team"], days["season"]]
+    days["average_score"] = (days["mean"].where(counted, 0).groupby(team_seasons).transform("sum") /
+                             days.groupby(["team", "season"])["date"].transform("size"))
+    days = days[counted]
+    # a taper swim is a swim at a meet with a below average z-score for that season
+    # this can be assumed because, given that a team has dual meets and taper meets
+    # online, there will be a two-node normal distribution. the lower node contains
+    # taper swims.
+    # Brad's interpretation of this:
+    # If a swim was better than team average, give taper of 1, otherwise set taper to 2
+    taper = np.where(days["mean"] < days["average_score"], 1, 2)
+
+    # we'll now update them in the database
+    cursor.execute(CREATE_TAPER_DAYS_TABLE)
+    cursor.execute("DELETE FROM TaperDays;")
+    cursor.executemany("INSERT INTO TaperDays VALUES(?, ?, ?);",
+                       zip(days["team"].tolist(), days["date"].tolist(), taper.tolist()))
+    cursor.execute("UPDATE Swims SET taper=TaperDays.taper FROM TaperDays "
+                   "WHERE Swims.team=TaperDays.team AND Swims.date=TaperDays.date;")
+    cursor.execute("DROP TABLE TaperDays;")
+    print("Finding outliers")
+    cursor.execute("UPDATE Swims SET taper=3 WHERE scaled>3")
+
+
+def season_timestamps(season):
+    """
+    :param season: collegeswimming.com season id (the year the season starts in minus 1996)
+    :return: (start, end) integer timestamps of the season
+    """
+    return (convert_to_time(int(season) + 1996, SEASON_LINE_MONTH, SEASON_LINE_DAY),
+            convert_to_time(int(season) + 1996 + 1, SEASON_LINE_MONTH, SEASON_LINE_DAY))
+
+
+def crawl_unit_result(cursor, unit, events_to_pull, relays_to_pull, snapshot_id):
+    """
+    Downloads and parses everything a single crawl unit needs (see crawl_frontier.py) without writing anything
+    :param cursor: cursor of the open sqlite database, only read from (to see which teams' relays are pulled together,
+    and which meets have been gone through already)
+    :param unit: (unit_id, kind, team_id, season, gender, swimmer_id, event) tuple from the CrawlUnits table
+    :param events_to_pull: List of (non relay) event codes to pull data on
+    :param relays_to_pull: List of relay event codes to pull data on
+    :param snapshot_id: integer id that every row added during this pull is tagged with
+    :return result: dictionary of the team, swimmers, swims, meets, and meet_relays rows found by crawling the unit, and
+    the new units it leads to, in the form save_unit_result takes them
+    raises RequestDeferred if a page kept failing to load, in which case the unit can be crawled again later
+    """
+    unit_id, kind, team_id, season, gender, swimmer_id, event = unit
+    result = {"team": None, "swimmers": [], "swims": [], "units": [], "meets": [], "meet_relays": []}
+    if kind == "roster":
+        # pull the roster for this season and gender
+        team = get_roster(team_id, season, gender)
+        print(team)
+        if team:  # if there wasn't a 404 error
+            result["team"] = (team["name"], team_id)
+            for swimmer_name, roster_swimmer_id in team["roster"]:
+                result["swimmers"].append((swimmer_name, gender, roster_swimmer_id, team_id))
+                result["units"].append(("swimmer", team_id, season, gender, roster_swimmer_id))
+    elif kind == "swimmer":
+        # the swimmer's page lists every event they have swum, so it's only downloaded once
+        swimmer_events = request_swimmer_events(swimmer_id)
+        if swimmer_events is not None:
+            # only ask for the requested events that they actually swam
+            for swimmer_event in [e for e in events_to_pull if e in swimmer_events]:
+                result["units"].append(("event", team_id, season, gender, swimmer_id, swimmer_event))
+    elif kind == "event":
+        print("{} {}".format(swimmer_id, event))
+        search_start_timestamp, search_end_timestamp = season_timestamps(season)
+        swims = request_swimmer(swimmer_id, event, search_start_timestamp, search_end_timestamp, [event])
+        sys.stdout.flush()
+        result["swims"] = [(swimmer_id, team_id, swim[1], 0, swim[2], gender, event, swim[0], 0, snapshot_id)
+                           for swim in swims]
+    elif kind == "relays":
+        # Retrieve relay swim data and data on meets that team team_id competed in. Each meet's results are gone
+        # through once for every team pulling relays, so meets another team's unit already did are skipped
+        relay_swims, meets, meet_teams = get_relay_swim_data(team_id, gender, season, relays_to_pull,
+                                                             relay_team_ids(cursor, season, gender),
+                                                             pulled_meet_teams(cursor, gender))
+        result["swims"] = [tuple(relay_swim[:8]) + (0, snapshot_id) for relay_swim in relay_swims]
+        # the meets the team swam, and which teams' relays were pulled from each meet
+        result["meets"] = [(meet_id, meet["meet_name"], meet["meet_date"], meet["submitted"])
+                           for meet_id, meet in meets.items()]
+        result["meet_relays"] = [(meet_id, gender, meet_team_id, relay_string)
+                                 for meet_id, pulled in meet_teams.items() for meet_team_id, relay_string in pulled]
+    return result
+
+
+def save_unit_result(ingestor, unit, result):
+    """
+    Adds what crawling a unit found to the database, adds the units it leads to, and marks it as done. Rows are written
+    in batches by the ingestor, which also takes care of committing.
+    :param ingestor: ingest.BulkIngestor writing to the open sqlite database
+    :param unit: the unit that was crawled
+    :param result: what crawl_unit_result (or crawler.Crawler.crawl_unit_result) returned for it
+    :return new_units: the units it led to that weren't in the CrawlUnits table yet
+    """
+    cursor = ingestor.connection.cursor()
+    if result["team"] is not None:
+        # teams and swimmers already in the database are skipped
+        ingestor.add_team(*result["team"])
+    for swimmer in result["swimmers"]:
+        ingestor.add_swimmer(*swimmer)
+    for swim in number_occurrences(result["swims"]):
+        ingestor.add_swim(*swim)
+    for meet in result["meets"]:
+        ingestor.add_meet(*meet)
+    for meet_relays in result["meet_relays"]:
+        ingestor.add_meet_relays(*meet_relays)
+    new_units = [add_unit(cursor, *new_unit) for new_unit in result["units"]]
+    set_unit_state(cursor, unit[0], DONE)
+    return [new_unit for new_unit in new_units if new_unit is not None]
+
+
+def crawl_unit(ingestor, unit, events_to_pull, relays_to_pull, snapshot_id):
+    """
+    Downloads everything a single crawl unit needs (see crawl_frontier.py), adds it to the database, adds any units it
+    leads to, and marks it as done.
+    :param ingestor: ingest.BulkIngestor writing to the open sqlite database
+    :param unit: (unit_id, kind, team_id, season, gender, swimmer_id, event) tuple from the CrawlUnits table
+    :param events_to_pull: List of (non relay) event codes to pull data on
+    :param relays_to_pull: List of relay event codes to pull data on
+    :param snapshot_id: integer id that every row added during this pull is tagged with
+    """
+    cursor = ingestor.connection.cursor()
+    set_unit_state(cursor, unit[0], IN_PROGRESS)
+    if unit[1] == "relays":
+        # the meets earlier relays units went through have to be in the database to be skipped
+        ingestor.flush()
+    save_unit_result(ingestor, unit, crawl_unit_result(cursor, unit, events_to_pull, relays_to_pull, snapshot_id))
 
 
 def get_swim_data(teams_to_pull, genders_to_pull,
                   year_start, year_end,
                   events_to_pull=DEFAULT_EVENTS_TO_PULL,
-                  database_file_name=DATABASE_FILE_NAME, ):
+                  database_file_name=DATABASE_FILE_NAME, incremental=False):
     """
     :param teams_to_pull: List of strings where each string is a swim team (e.g. "Bucknell University")
     :param genders_to_pull: List of characters M, F, representing Male and Female
@@ -306,6 +781,8 @@ def get_swim_data(teams_to_pull, genders_to_pull,
     :param year_end: Integer value of final year for data pull
     :param events_to_pull: List of event codes for events to pull data on
     :param database_file_name: The name of the database file that information will be stored in
+    :param incremental: if True, only swims at least as recent as the latest one already stored for the same swimmer
+    and event are added (see ingest.py). Meant for refreshing a season that is still going
     :return: Nothing is returned. database_file_name will have data written to it, and will be created if it didn't
     exist before.
     """
@@ -317,173 +794,84 @@ def get_swim_data(teams_to_pull, genders_to_pull,
             events_to_pull.remove(event)
             relays_to_pull.append(event)
 
-    # Convert team_dict entries to integer team ID's.
+    # Convert team names to integer team ID's. A name that isn't a team fails here, before anything is downloaded
     for team in range(len(teams_to_pull)):
-        teams_to_pull[team] = TEAM_DICT[teams_to_pull[team]]
+        teams_to_pull[team] = find_team_id(teams_to_pull[team])
+
+    # everything this pull downloads, parses, and writes is counted from here (see crawl_metrics.py)
+    metrics = CrawlMetrics()
+    use_metrics(metrics)
 
     # open the sqlite database
     connection = sqlite3.connect(database_file_name)
     cursor = connection.cursor()
 
-    # add information about this snapshot to the Snapshots table (and create it if it doesn't exist)
-    cursor.execute(CREATE_SNAPSHOT_TABLE_COMMAND)
-    snapshot_id = random.randint(0, 4294967295)  # what are the odds? 100% I'm a lazy programmer << NOTE: change this
+    snapshot_id = start_snapshot(cursor, teams_to_pull, year_start, year_end, events_to_pull)
 
-    # create a Snapshot entry of the new data being pulled. This is essentially a changelog
-    date_range_string = "{0}.{1}.{2}-{3}.{1}.{2}".format(year_start, SEASON_LINE_MONTH, SEASON_LINE_DAY, year_end)
-    teams_string = ",".join(str(team) for team in teams_to_pull)
-    events_string = ",".join(events_to_pull)
-    cursor.execute(INSERT_SNAPSHOT_COMMAND.format(snapshot_id, date_range_string, teams_string, events_string))
+    # the pull is broken into crawl units kept in the database. If a previous run of this pull was interrupted, its
+    # finished units are still marked as done and are skipped here
+    seasons = [simple_year - 1996 for simple_year in range(year_start, year_end)]
+    resumed = prepare_frontier(cursor)
+    seed_pull(cursor, teams_to_pull, seasons, genders_to_pull, len(relays_to_pull) > 0)
+    connection.commit()
+    if resumed or count_units(cursor)[0]:
+        print("Resuming pull: {} of {} crawl units already done".format(*count_units(cursor)))
 
-    # ensure the existence of each event table and the Teams/Swimmers tables
-    cursor.execute(CREATE_SWIMS_TABLE)
-    cursor.execute(CREATE_SWIMMER_TABLE.format("Swimmers"))
-    cursor.execute(CREATE_TEAM_TABLE.format("Teams"))
-    cursor.execute(CREATE_MEET_TABLE)
-    
     # retrieve and add the times to the database
-    for simple_year in range(year_start, year_end):   # for each competition year, do the following
-        # THIS IS WHERE SEASON STRING IS MADE AND ROSTER URL BUILDING IS STARTED
-        season_string = simple_year - 1996#str(simple_year) + "-" + str(simple_year + 1)  # old method
-        print("Collecting Season {}".format(season_string))
-        search_start_timestamp = convert_to_time(int(simple_year), SEASON_LINE_MONTH, SEASON_LINE_DAY)
-        search_end_timestamp = convert_to_time(int(simple_year) + 1, SEASON_LINE_MONTH, SEASON_LINE_DAY)
-
-        team_counter = 0
-        percent = 0
-        for team_id in teams_to_pull:   # for each team
-            for gender in genders_to_pull:  # for each gender
-                # pull the roster for this season and gender
-                team = get_roster(team_id, season_string, gender)
-                print (team)
-                # add team to the Teams table
-                if not team["name"] is "":  # if there wasn't a 404 error, check if there is existing data on team
-                    matches = cursor.execute(CHECK_TEAM_TABLE.format("Teams", team_id))
-                    if matches.fetchone() is None:  # if there are no duplicates, add the team to team table
-                        cursor.execute(ADD_TO_TEAM_TABLE.format("Teams", team["name"], team_id))
-                for index, swimmer in enumerate(team["roster"]):
-                    print(swimmer[0] + " " + swimmer[1])  # for each swimmer on the team
-
-                    # enumerate this loop to have an index for the loading bar
-                    percent_of_team = float(index) / float(len(team["roster"]))
-                    show_loading_bar(percent + (percent_of_team / float(len(teams_to_pull))))
-
-                    # add the swimmer to the Swimmers table, if they aren't there already
-                    matches = cursor.execute(CHECK_SWIMMER_TABLE.format("Swimmers", swimmer[1]))
-                    if matches.fetchone() is None:
-                        cursor.execute(ADD_TO_SWIMMER_TABLE.format("Swimmers", sqlsafe(swimmer[0]), gender, swimmer[1], team_id))
-                    # Add all of this swimmer's swim data for this season to the swims table, for the events requested
-                    for event in events_to_pull:  # pull swim data for requested events
-                        print(swimmer[1] + " " + event)
-                        swims = request_swimmer(swimmer[1], event, search_start_timestamp, search_end_timestamp)
-                        sys.stdout.flush()
-                        # Add swims to Swims table
-                        for swim in swims:
-                            command = INSERT_SWIM_COMMAND.format(swimmer[1], team_id, swim[1], 0, swim[2], gender, event, swim[0], 0, snapshot_id)
-                            cursor.execute(command)
-
-                # Retrieve relay swim data and data on meets that team team_id competed in
-                relay_swims, meets = get_relay_swim_data(team_id, gender, season_string, relays_to_pull)
-
-                # Add relay swim data to database swims table
-                for relay_swim in relay_swims:
-                    relay_command = INSERT_SWIM_COMMAND.format(relay_swim[0],relay_swim[1],relay_swim[2],0,
-                                                               relay_swim[4], relay_swim[5], relay_swim[6],
-                                                               relay_swim[7], 0, snapshot_id)
-                    cursor.execute(relay_command)
-
-                # Add meet data to database meets table
-                # NOTE: Meets table still hasn't been pulled/created yet, if get_swim_data fails try commenting out this
-                #for meet in meets:
-                #    matches = cursor.execute(CHECK_MEET_TABLE.format(meet))
-                #    if matches.fetchone() is None:
-                #        meet_command = INSERT_MEET_COMMAND.format(meet, meets[meet]["meet_name"],
-                #                                                  meets[meet]["meet_date"],
-                #                                                  meets[meet]["submitted"])
-                #        cursor.execute(meet_command)
-
-                # print the loading bar
-                team_counter += 1
-                percent = float(team_counter) / float(len(teams_to_pull))
-                show_loading_bar(percent)
-
-        connection.commit()
+    ingestor = BulkIngestor(connection, incremental=incremental)
+    # units whose pages kept failing to load wait here to be tried again once the rest of the pull has moved on
+    retry_queue = DeferredRetryQueue()
+    failed_count = 0
+    progress = ProgressDisplay()
+    while True:
+        for retry_unit in retry_queue.pop_ready():
+            set_unit_state(cursor, retry_unit[0], PENDING)
+        unit = next_pending_unit(cursor)
+        if unit is None:
+            if not retry_queue:
+                break
+            time.sleep(retry_queue.seconds_until_ready())
+            continue
+        try:
+            crawl_unit(ingestor, unit, events_to_pull, relays_to_pull, snapshot_id)
+        except RequestDeferred as e:
+            # every page a unit needs is downloaded before any of its rows are added, so there's nothing to undo
+            set_unit_state(cursor, unit[0], FAILED)
+            if retry_queue.defer(unit):
+                print("{}, crawl unit {} will be tried again later".format(e, unit))
+            else:
+                print("{}, giving up on crawl unit {}".format(e, unit))
+                failed_count += 1
+        # units being marked done are committed along with their rows, so nothing is half saved if the pull dies
+        ingestor.commit_if_due()
+        if progress.due():
+            progress.show(*count_units(cursor))
+    ingestor.commit()
+    progress.finish(*count_units(cursor))
+    if fetch.request_scheduler:
+        fetch.request_scheduler.report()
+    if incremental:
+        print("skipped {} swims that were already stored".format(ingestor.skipped_swims))
+    metrics.report()
+    metrics.write()
 
     ####################################################################################################################
     # REMAINDER OF CODE HERE ISN'T USED FOR OUR PURPOSES                                                               #
     # this code doesn't work for relay swims                                                                           #
     ####################################################################################################################
 
-    get_event_times = "SELECT time FROM Swims WHERE event='{}{}' AND date>{} AND date<{}"
-    update_with_scaled = "UPDATE Swims SET scaled={} WHERE event='{}{}' AND date>{} AND date<{} AND time={}"
-    # fill out the scaled column
-    print("Scaling times")
-    # convert each swim to a season z-score
-    for simple_year in range(year_start, year_end):
-        season_start_timestamp = convert_to_time(int(simple_year), SEASON_LINE_MONTH, SEASON_LINE_DAY)
-        season_end_timestamp = convert_to_time(int(simple_year) + 1, SEASON_LINE_MONTH, SEASON_LINE_DAY)
-        for event in events_to_pull:
-            for gender in genders_to_pull:
-                # calculate average times for each event by gender
-                cursor.execute(get_event_times.format(gender, event, season_start_timestamp, season_end_timestamp))
-                times = [x[0] for x in cursor.fetchall()]
-                try:
-                    average = sum(times) / len(times)
-                except ZeroDivisionError as e:
-                    print("No data was available on event {}".format(event))
-                    continue
-                print("average for {}{} in {}: {}".format(gender, event, simple_year, average))
-                # calculate z-score of times scored for this event-gender pairing
-                sd = (sum([(x - average)**2 for x in times]) / len(times)) ** .5  # standard deviation
-                update_list = [(x, (x - average) / sd) for x in times]
-                for update in update_list:
-                    command = update_with_scaled.format(update[1], gender, event, season_start_timestamp,
-                                                        season_end_timestamp, update[0])
-                    cursor.execute(command)
+    # an incremental pull only changes the seasons and events it added swims to, so only those are scaled again
+    scale_season_times(cursor, year_start, year_end, events_to_pull, genders_to_pull,
+                       ingestor.touched_partitions() if incremental else None)
     connection.commit()
-    print("scaled")
 
-    print("\nFinding taper swims")
-    for simple_year in range(year_start, year_end):
-        season_start_timestamp = convert_to_time(int(simple_year), SEASON_LINE_MONTH, SEASON_LINE_DAY)
-        season_end_timestamp = convert_to_time(int(simple_year) + 1, SEASON_LINE_MONTH, SEASON_LINE_DAY)
-        print("Season {}-{}".format(simple_year, simple_year + 1))
-        print("From timestamp {} to {}".format(season_start_timestamp, season_end_timestamp))
-        for team_id in teams_to_pull:
-            # get a list of all the days this team swam
-            cursor.execute("SELECT date FROM Swims WHERE team={} AND date>{} AND date<{}".format(team_id,
-                                                                                                 season_start_timestamp,
-                                                                                                 season_end_timestamp))
-            dates = cursor.fetchall()
-            dates = list(set(dates))  # this removes duplicates, which there are many
-            meet_scores = []             # populate this with
-            average_score = 0
-            for date in dates:
-                # first check if only one swimmer swam. this is indicative of a glitch where I
-                # cannot isolate which roster a swimmer is in if they switched team.
-                cursor.execute("SELECT count(*) FROM Swims WHERE team={} AND date={}".format(team_id, date[0]))
-                if cursor.fetchone()[0] != 7:
-                    # get the average scaled time for this day of swimming and add it to the list
-                    cursor.execute("SELECT avg(scaled) FROM Swims WHERE team={} AND date={}".format(team_id, date[0]))
-                    meet_tuple = (cursor.fetchone()[0], date[0])
-                    average_score += meet_tuple[0]
-                    meet_scores.append(meet_tuple)
-            average_score /= len(dates)
-            for date in meet_scores:
-                # a taper swim is a swim at a meet with a below average z-score for that season
-                # this can be assumed because, given that a team has dual meets and taper meets
-                # online, there will be a two-node normal distribution. the lower node contains
-                # taper swims. we'll now update them in the database
-                # Brad's interpretation of this:
-                # If a swim was better than team average, give taper of 1, otherwise set taper to 2
-                if date[0] < average_score:
-                    cursor.execute("UPDATE Swims SET taper=1 WHERE team={} AND date={}".format(team_id, date[1]))
-                else:
-                    cursor.execute("UPDATE Swims SET taper=2 WHERE team={} AND date={}".format(team_id, date[1]))
-
-    print("Finding outliers")
-    cursor.execute("UPDATE Swims SET taper=3 WHERE scaled>3")  # a lazy solution. I'm tired << let's fix that
+    find_taper_swims(cursor, year_start, year_end, teams_to_pull)
 
+    if failed_count:
+        print("{} crawl units failed, run the same pull again to retry them".format(failed_count))
+    else:
+        # everything finished, so the next pull of these teams starts from scratch
+        clear_pull(cursor, teams_to_pull, seasons, genders_to_pull)
     connection.commit()
     connection.close()
 
@@ -526,4 +914,5 @@ def main():
     inputs_for_swim_data_search(True)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,30 @@ def convert_to_time(year, month, day):
     return (datetime.datetime(int(year), int(month), int(day)) - datetime.datetime(1970,1,1)).total_seconds()
 
 
+def season_year(timestamp, season_line_month, season_line_day):
+    """
+    :param timestamp: integer timestamp of time since epoch in seconds, like the date column of Swims
+    :param season_line_month: first month of the season
+    :param season_line_day: day of season_line_month the season starts on
+    :return: the year the season the timestamp falls in started (e.g. 2018 for the 2018-2019 season)
+    """
+    year = (datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=timestamp)).year
+    if timestamp <= convert_to_time(year, season_line_month, season_line_day):
+        year -= 1
+    return year
+
+
+def season_end(timestamp, season_line_month, season_line_day):
+    """
+    :param timestamp: integer timestamp of time since epoch in seconds, like the date column of Swims
+    :param season_line_month: first month of the season
+    :param season_line_day: day of season_line_month the season starts on
+    :return: integer timestamp of the end of the season the timestamp falls in
+    """
+    return convert_to_time(season_year(timestamp, season_line_month, season_line_day) + 1, season_line_month,
+                           season_line_day)
+
+
 # def to_title(event_string):  # NOTE: Never used
 #     """
 #     Use when displaying results (not during data collection)
@@ -92,12 +116,20 @@ def sqlsafe(name):
     return name
 
 
-def show_loading_bar(percent):
+def loading_bar(percent):
     """
     Input some value between 0 and 1
-    Print a string of "#" and " " characters ending with a floating point percent value
+    :return: a string of "#" and " " characters ending with a floating point percent value
     """
     chars = int(percent * 50)
-    print("\n" + ("#" * chars) + (" " * (50 - chars)) + " {:10.2f}%\r".format(100 * percent))
+    return ("#" * chars) + (" " * (50 - chars)) + " {:6.2f}%".format(100 * percent)
+
+
+def show_loading_bar(percent):
+    """
+    Input some value between 0 and 1
+    Print the loading bar over the last one printed, on the same line
+    """
+    sys.stdout.write("\r" + loading_bar(percent))
     sys.stdout.flush()
 
@@ -0,0 +1,211 @@
+import time
+from constants import *
+from helperfunctions import season_year
+from crawl_metrics import get_metrics
+
+########################################################################################################################
+# Buffered writes to the Teams, Swimmers, Swims, Meets, and MeetRelays tables. Rows are collected in memory and        #
+# written with executemany and bound parameters, and commits only happen when the caller says it's at a safe point     #
+# (commit_if_due), once enough rows or time have built up. Anything else done on the same connection (like marking     #
+# crawl units done) is committed along with the rows, so it never gets ahead of the rows it describes. Swims are       #
+# written in the order of their uniqueness key, and a transaction holds many batches, since keeping the indexes on     #
+# Swims up to date is most of what a write costs.                                                                      #
+#                                                                                                                      #
+# Swims are unique on (swimmer, event, meet_id, date, time, occurrence), so writing a swim that is already stored does #
+# nothing, and the date of the latest swim of every swimmer in every event is kept in the SyncState table. An          #
+# incremental ingestor uses SyncState to drop swims that are older than what is already stored before they reach the   #
+# database. The rows each flush actually writes are counted in the crawl metrics (see crawl_metrics.py).               #
+########################################################################################################################
+
+
+def prepare_swims_table(cursor):
+    """
+    Adds the occurrence column, the uniqueness key, and the SyncState table to the Swims table. If the database was
+    made before the key existed, the occurrences of the stored swims are numbered within each snapshot, and the copies
+    of swims that a later pull stored again are moved to the DuplicateSwims table. A key from before occurrence existed
+    is swapped for the new one. Does nothing if that has already been done.
+    raises RuntimeError, leaving the transaction to be rolled back, if the swims deleted aren't the ones backed up
+    :param cursor: cursor of the open sqlite database, which must already have a Swims table
+    """
+    cursor.execute(CREATE_SYNC_STATE_TABLE)
+    if "occurrence" not in [row[1] for row in cursor.execute("PRAGMA table_info(Swims);")]:
+        cursor.execute(ADD_SWIMS_OCCURRENCE_COLUMN)
+        cursor.execute(NUMBER_SWIM_OCCURRENCES)
+        cursor.execute(SET_SWIM_OCCURRENCES)
+        cursor.execute("DROP TABLE SwimOccurrences;")
+    key = [row[2] for row in cursor.execute("PRAGMA index_info(SwimsNaturalKey);")]
+    if "occurrence" in key:
+        return
+    if key:
+        # the old key held, so nothing is left to delete
+        cursor.execute("DROP INDEX SwimsNaturalKey;")
+    cursor.execute(CREATE_DUPLICATE_SWIMS_TABLE)
+    backed_up = cursor.execute(BACK_UP_DUPLICATE_SWIMS).rowcount
+    duplicates = cursor.execute(DELETE_DUPLICATE_SWIMS).rowcount
+    if duplicates != backed_up:
+        raise RuntimeError("{} duplicate swims would be deleted, but {} were backed up".format(duplicates, backed_up))
+    if duplicates:
+        print("moved {} copies of swims stored again by a later pull to the DuplicateSwims table".format(duplicates))
+    cursor.execute(CREATE_SWIMS_NATURAL_KEY)
+    cursor.execute(FILL_SYNC_STATE_COMMAND)
+
+
+def number_occurrences(swims):
+    """
+    :param swims: list of swims in the form BulkIngestor.add_swim takes them (without occurrence), from one page of
+    results, such as a swimmer's event history or the relays of a team's season
+    :return: list of the swims with their occurrence added to the end: how many swims by the same swimmer, in the same
+    event, at the same meet, on the same day, in the same time came before it in swims (like a prelim and a final)
+    """
+    seen = {}
+    numbered = []
+    for swim in swims:
+        key = (int(swim[0]), swim[4], swim[5] + swim[6], swim[7], swim[2])
+        seen[key] = seen.get(key, -1) + 1
+        numbered.append(tuple(swim) + (seen[key],))
+    return numbered
+
+
+class BulkIngestor:
+    def __init__(self, connection, batch_size=INGEST_BATCH_SIZE, commit_seconds=INGEST_COMMIT_SECONDS,
+                 incremental=False, commit_rows=INGEST_COMMIT_ROWS):
+        """
+        :param connection: open sqlite connection. Only commit it through commit() while the ingestor is in use
+        :param batch_size: rows buffered before they are written
+        :param commit_seconds: commit_if_due also commits once this many seconds have passed since the last commit
+        :param incremental: if True, swims from before the latest stored swim of the same swimmer and event are skipped
+        :param commit_rows: rows written before commit_if_due commits
+        """
+        self.connection = connection
+        self.batch_size = batch_size
+        self.commit_seconds = commit_seconds
+        self.commit_rows = commit_rows
+        connection.execute("PRAGMA cache_size=-{};".format(INGEST_CACHE_KIB))
+        self.teams = []
+        self.swimmers = []
+        self.swims = []
+        self.meets = []
+        self.meet_relays = []
+        # rows in the lists above, counted as they are added since summing their lengths for every row adds up
+        self.buffered_count = 0
+        self.last_commit = time.time()
+        self.uncommitted_rows = 0
+        self.rows_written = 0
+        # {(swimmer_id, event): latest date} of swims added since the last flush, to be written to SyncState
+        self.sync_updates = {}
+        # {(swimmer_id, event): latest date} already in the database, only loaded for incremental ingestors
+        self.last_dates = {}
+        # made here too, so an ingestor can write to a database that has a Swims table but was never migrated
+        connection.execute(CREATE_SYNC_STATE_TABLE)
+        if incremental:
+            self.last_dates = {(swimmer_id, event): last_date for swimmer_id, event, last_date
+                               in connection.execute("SELECT swimmer, event, last_date FROM SyncState;")}
+        self.skipped_swims = 0
+        # (event, date) of every swim added, to work out which seasons need to be scaled again
+        self.swim_days = set()
+
+    def buffered_rows(self):
+        return self.buffered_count
+
+    def add_team(self, name, team_id):
+        self.teams.append((name, team_id))
+        self.flush_if_full()
+
+    def add_swimmer(self, name, gender, swimmer_id, team_id):
+        self.swimmers.append((name, gender, swimmer_id, team_id))
+        self.flush_if_full()
+
+    def add_swim(self, swimmer_id, team_id, time, scaled, meet_id, gender, event, date, taper, snapshot_id,
+                 occurrence=0):
+        """
+        Takes the same values, in the same order, that get formatted into INSERT_SWIM_COMMAND, and the number of swims
+        by the swimmer in the same event, meet, day, and time that came before this one (see number_occurrences)
+        """
+        # relay legs come with the id as a string, which would never match the integer ids loaded from SyncState
+        swimmer_id = int(swimmer_id)
+        key = (swimmer_id, gender + event)
+        # swims from the same day as the latest stored one are kept, since a meet's results can be posted in pieces.
+        # The ones that are already stored are dropped by the uniqueness key
+        if key in self.last_dates and date < self.last_dates[key]:
+            self.skipped_swims += 1
+            return
+        self.swims.append((swimmer_id, team_id, time, scaled, meet_id, gender + event, date, taper, snapshot_id,
+                           occurrence))
+        self.sync_updates[key] = max(date, self.sync_updates.get(key, date))
+        self.swim_days.add((gender + event, date))
+        self.flush_if_full()
+
+    def add_meet(self, meet_id, meet_name, meet_date, meet_submitted):
+        self.meets.append((int(meet_id), meet_name, int(meet_date), int(meet_submitted)))
+        self.flush_if_full()
+
+    def add_meet_relays(self, meet_id, gender, team_id, event):
+        """
+        Records that the team's relay event (e.g. F200Y) at the meet has been pulled
+        """
+        self.meet_relays.append((int(meet_id), gender, int(team_id), event))
+        self.flush_if_full()
+
+    def touched_partitions(self):
+        """
+        :return: set of (event, simple_year) for every event (with gender) and season a swim was added to
+        """
+        return {(event, season_year(date, SEASON_LINE_MONTH, SEASON_LINE_DAY)) for event, date in self.swim_days}
+
+    def flush(self):
+        """
+        Writes every buffered row to the database without committing. SyncState is only brought up to date by commit
+        """
+        # in natural key order, so each executemany walks the uniqueness key from front to back instead of jumping
+        # between random pages of it
+        self.swims.sort(key=lambda swim: (swim[0], swim[5], swim[4], swim[6], swim[2], swim[9]))
+        self.write_rows([("Teams", BULK_ADD_TO_TEAM_TABLE, self.teams),
+                         ("Swimmers", BULK_ADD_TO_SWIMMER_TABLE, self.swimmers),
+                         ("Swims", BULK_INSERT_SWIM_COMMAND, self.swims),
+                         ("Meets", BULK_ADD_TO_MEET_TABLE, self.meets),
+                         ("MeetRelays", BULK_ADD_TO_MEET_RELAYS_TABLE, self.meet_relays)])
+        self.uncommitted_rows += self.buffered_rows()
+        self.rows_written += self.buffered_rows()
+        self.teams, self.swimmers, self.swims, self.meets, self.meet_relays = [], [], [], [], []
+        self.buffered_count = 0
+
+    def write_rows(self, tables):
+        """
+        :param tables: list of (table, command, rows) with rows to write to each table with executemany
+        """
+        cursor = self.connection.cursor()
+        metrics = get_metrics()
+        for table, command, rows in tables:
+            if rows:
+                start = time.perf_counter()
+                cursor.executemany(command, rows)
+                # rowcount only counts rows that were actually inserted or changed, not the ones skipped as duplicates
+                metrics.record_rows(table, cursor.rowcount, time.perf_counter() - start)
+
+    def commit(self):
+        """
+        Writes every buffered row, brings SyncState up to date, and commits
+        """
+        self.flush()
+        # once per transaction rather than once per flush, so a swimmer and event that shows up in many batches is only
+        # written once
+        self.write_rows([("SyncState", UPDATE_SYNC_STATE_COMMAND,
+                          sorted(key + (date,) for key, date in self.sync_updates.items()))])
+        self.sync_updates = {}
+        self.connection.commit()
+        self.last_commit = time.time()
+        self.uncommitted_rows = 0
+
+    def flush_if_full(self):
+        self.buffered_count += 1
+        if self.buffered_count >= self.batch_size:
+            self.flush()
+
+    def commit_if_due(self):
+        """
+        Commits if enough rows or time have built up since the last commit. Only call this when everything done on the
+        connection so far belongs together (e.g. between crawl units)
+        """
+        if self.uncommitted_rows + self.buffered_rows() >= self.commit_rows or \
+                time.time() - self.last_commit >= self.commit_seconds:
+            self.commit()
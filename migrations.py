@@ -0,0 +1,126 @@
+import argparse
+import os
+import sqlite3
+from constants import *
+from ingest import prepare_swims_table
+
+########################################################################################################################
+# Versioned changes to the schema of the swim database. The number of migrations a database has been through is kept   #
+# in its user_version (PRAGMA user_version, 0 for a database that has never been migrated), and migrate runs the ones  #
+# after that in order, each in its own transaction along with the new version number, so a database is never left      #
+# half way through a migration. start_snapshot migrates the database before every pull, and existing files can be      #
+# upgraded in place with                                                                                               #
+#     python migrations.py collegeswimming.db other.db                                                                 #
+# New migrations go at the end of MIGRATIONS, and must work on databases that are missing the tables they change.      #
+########################################################################################################################
+
+
+def add_swims_natural_key(cursor):
+    cursor.execute(CREATE_SWIMS_TABLE)
+    prepare_swims_table(cursor)
+
+
+def add_swims_indexes(cursor):
+    cursor.execute(CREATE_SWIMS_TABLE)
+    cursor.execute(CREATE_SWIMS_EVENT_DATE_INDEX)
+    cursor.execute(CREATE_SWIMS_TEAM_DATE_INDEX)
+    cursor.execute(CREATE_SWIMS_MEET_INDEX)
+    # gives the query planner row counts to choose between the indexes with
+    cursor.execute("ANALYZE Swims;")
+
+
+def type_meets_table(cursor):
+    cursor.execute(CREATE_MEET_TABLE)
+    cursor.execute("ALTER TABLE Meets RENAME TO UntypedMeets;")
+    cursor.execute(CREATE_MEET_TABLE)
+    cursor.execute(COPY_UNTYPED_MEETS_COMMAND)
+    cursor.execute("DROP TABLE UntypedMeets;")
+
+
+def add_crawl_unit_leases(cursor):
+    cursor.execute(CREATE_CRAWL_UNITS_TABLE)
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(CrawlUnits);")]
+    if "lease_owner" not in columns:
+        cursor.execute("ALTER TABLE CrawlUnits ADD COLUMN lease_owner TEXT;")
+        cursor.execute("ALTER TABLE CrawlUnits ADD COLUMN lease_expires REAL;")
+    cursor.execute(CREATE_CRAWL_UNITS_STATE_INDEX)
+
+
+def add_meet_relay_events(cursor):
+    cursor.execute(CREATE_MEET_RELAYS_TABLE)
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(MeetRelays);")]
+    if "event" not in columns:
+        # which relays the old rows stood for was never recorded, so their meets are gone through once more by the next
+        # pull. The legs that are already stored are skipped by the Swims uniqueness key
+        cursor.execute("DROP TABLE MeetRelays;")
+        cursor.execute(CREATE_MEET_RELAYS_TABLE)
+
+
+def add_swim_occurrences(cursor):
+    cursor.execute(CREATE_SWIMS_TABLE)
+    prepare_swims_table(cursor)
+
+
+# (description, function(cursor)) of every migration, oldest first. A database at version n has been through the first n
+MIGRATIONS = [("unique swims and the SyncState table", add_swims_natural_key),
+              ("indexes for scaling, taper classification, and lineups", add_swims_indexes),
+              ("Meets keyed by meet_id with an integer meet_date", type_meets_table),
+              ("leases on crawl units for worker processes", add_crawl_unit_leases),
+              ("relay events in MeetRelays", add_meet_relay_events),
+              ("occurrence in the Swims uniqueness key", add_swim_occurrences)]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connection):
+    """
+    :return: number of migrations the database has been through
+    """
+    return connection.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(connection):
+    """
+    Runs every migration the database hasn't been through yet. Anything uncommitted on the connection is committed first
+    :param connection: open sqlite connection
+    :return: the version the database was at before
+    """
+    connection.commit()
+    start_version = schema_version(connection)
+    if start_version > SCHEMA_VERSION:
+        raise RuntimeError("Database is at schema version {}, newer than this code ({})".format(start_version,
+                                                                                                SCHEMA_VERSION))
+    for version in range(start_version, SCHEMA_VERSION):
+        description, upgrade = MIGRATIONS[version]
+        print("Migrating to schema version {}: {}".format(version + 1, description))
+        cursor = connection.cursor()
+        cursor.execute("BEGIN;")
+        try:
+            upgrade(cursor)
+            cursor.execute("PRAGMA user_version={};".format(version + 1))
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+    return start_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade swim databases to the newest schema in place")
+    parser.add_argument("files", nargs="*", default=[DATABASE_FILE_NAME], help="sqlite files to upgrade")
+    parser.add_argument("--check", action="store_true", help="only print the version of each file")
+    args = parser.parse_args()
+
+    for file_name in args.files:
+        if not os.path.exists(file_name):
+            print("{} doesn't exist".format(file_name))
+            continue
+        connection = sqlite3.connect(file_name)
+        if args.check:
+            print("{}: schema version {} of {}".format(file_name, schema_version(connection), SCHEMA_VERSION))
+        else:
+            print("{}: from schema version {} to {}".format(file_name, migrate(connection), schema_version(connection)))
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
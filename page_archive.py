@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from constants import *
+from fetch import match_endpoint
+
+########################################################################################################################
+# Compressed archive of every page fetch_url fetches (when PAGE_ARCHIVE_ENABLED is True, it is off by default), so a   #
+# pull can be run again later without the website, and the database can be rebuilt from the pages with fixed parsers   #
+# instead of downloading everything again (see reparse.py). Every page is kept in an sqlite file with its url (as      #
+# built from the templates in constants.py, before fetch.resolve_url, so an archive recorded through the stand-in      #
+# server replays the same as one recorded from the real website), when it was fetched, its status code, and its body   #
+# compressed with zlib. Pages that came back with an error (like a 404) are kept too, so a replay goes down the same   #
+# paths the recorded pull did. A page whose body hasn't changed since the last time it was archived isn't stored       #
+# again, but every change is a new copy, so the archive keeps growing with every pull until it reaches                 #
+# PAGE_ARCHIVE_MAX_BYTES, and then the replaced copies and the oldest pages are thrown out to make room.               #
+#                                                                                                                      #
+# fetch.use_page_archive(PageArchive(file_name), "replay") serves every page from the archive instead of downloading   #
+# it (see benchmark_replay.py). Run with                                                                               #
+#     python page_archive.py page_archive.db                                                                           #
+# to see what an archive holds.                                                                                        #
+########################################################################################################################
+
+CREATE_ARCHIVE_TABLE = "CREATE TABLE IF NOT EXISTS ArchivedPages (url TEXT, fetched REAL, endpoint TEXT, " \
+                       "status INTEGER, content_hash TEXT, size INTEGER, body BLOB, PRIMARY KEY (url, fetched));"
+# copies of pages that a newer copy of the same page has replaced, oldest first
+SUPERSEDED_COPIES_COMMAND = "SELECT url, fetched, length(body) FROM ArchivedPages AS page WHERE fetched<(SELECT " \
+                            "max(fetched) FROM ArchivedPages WHERE url=page.url) ORDER BY fetched;"
+OLDEST_COPIES_COMMAND = "SELECT url, fetched, length(body) FROM ArchivedPages ORDER BY fetched;"
+
+
+class PageNotArchived(LookupError):
+    """
+    Raised when a page is replayed that the archive doesn't have, which means the replayed pull asked for something the
+    recorded one didn't
+    """
+    def __init__(self, url):
+        super().__init__("{} isn't in the page archive".format(url))
+        self.url = url
+
+
+class PageArchive:
+    """
+    The archive can be shared between threads (crawler.py downloads from a thread pool), and several processes can
+    record into the same file at once (crawl_workers.py).
+    """
+    def __init__(self, file_name=PAGE_ARCHIVE_FILE_NAME, compression_level=PAGE_ARCHIVE_COMPRESSION_LEVEL,
+                 max_bytes=PAGE_ARCHIVE_MAX_BYTES):
+        self.file_name = file_name
+        self.compression_level = compression_level
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file_name, timeout=60, check_same_thread=False)
+        # lets the processes recording into the archive read it while one of them is writing. Every page is committed
+        # on its own, and in WAL mode those commits only wait on the disk at checkpoints
+        self.connection.execute("PRAGMA journal_mode=WAL;").fetchone()
+        self.connection.execute("PRAGMA synchronous=NORMAL;")
+        self.connection.execute(CREATE_ARCHIVE_TABLE)
+        self.connection.commit()
+        # [pages stored, bytes of pages stored, bytes after compressing, pages replayed]
+        self.counters = [0, 0, 0, 0]
+        # compressed bytes of every page in the archive. Only counts what this archive stores after now, so it is
+        # counted again from the file (which other processes may have added to) before anything is thrown out
+        self.stored_bytes = self.total_bytes()
+        # {url: (status, content_hash)} of the latest copy of every page this archive has stored or checked, so a page
+        # put again unchanged (like one served from the response cache on every pull) doesn't go to the file at all
+        self.latest = {}
+
+    def put(self, url, status, source, fetched=None):
+        """
+        :param url: url of the page, before fetch.resolve_url
+        :param status: HTTP status code the page came back with
+        :param source: body of the page, in bytes
+        :param fetched: timestamp of when it was fetched, now if left out
+        :return: True if it was stored, False if the latest archived copy of the page is the same
+        """
+        content_hash = hashlib.sha256(source).hexdigest()
+        with self.lock:
+            if self.latest.get(url) == (status, content_hash):
+                return False
+            latest = self.connection.execute("SELECT status, content_hash FROM ArchivedPages WHERE url=? "
+                                             "ORDER BY fetched DESC LIMIT 1;", (url,)).fetchone()
+            self.latest[url] = (status, content_hash)
+            if latest == (status, content_hash):
+                return False
+            # only pages that are actually stored get compressed
+            body = zlib.compress(source, self.compression_level)
+            self.connection.execute("INSERT OR REPLACE INTO ArchivedPages VALUES(?, ?, ?, ?, ?, ?, ?);",
+                                    (url, fetched if fetched is not None else time.time(), match_endpoint(url)[0],
+                                     status, content_hash, len(source), body))
+            self.connection.commit()
+            self.counters[0] += 1
+            self.counters[1] += len(source)
+            self.counters[2] += len(body)
+            self.stored_bytes += len(body)
+            if self.stored_bytes > self.max_bytes:
+                self.prune()
+        return True
+
+    def total_bytes(self):
+        return self.connection.execute("SELECT coalesce(sum(length(body)), 0) FROM ArchivedPages;").fetchone()[0]
+
+    def prune(self):
+        """
+        Throws out copies of pages until the archive is a tenth under max_bytes (so it isn't pruned again on the very
+        next page), the ones a newer copy of the same page has replaced first, then the ones fetched longest ago. Must
+        be called holding the lock
+        """
+        self.stored_bytes = self.total_bytes()
+        target = self.max_bytes * 9 // 10
+        pruned = set()
+        for command in (SUPERSEDED_COPIES_COMMAND, OLDEST_COPIES_COMMAND):
+            for url, fetched, size in self.connection.execute(command):
+                if self.stored_bytes <= target:
+                    break
+                if (url, fetched) not in pruned:
+                    pruned.add((url, fetched))
+                    self.stored_bytes -= size
+        self.connection.executemany("DELETE FROM ArchivedPages WHERE url=? AND fetched=?;", pruned)
+        self.connection.commit()
+        # the latest copy of some of the pages may be gone
+        self.latest = {}
+        print("pruned {} pages from the page archive to keep it under {:.1f} MB".format(len(pruned),
+                                                                                       self.max_bytes / 1024 ** 2))
+
+    def get(self, url, before=None):
+        """
+        :param url: url of the page, before fetch.resolve_url
+        :param before: timestamp to look back from, so the page is seen as it was then. Now if left out
+        :return: (status, body) of the latest copy of the page fetched no later than before, or None if there isn't one
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT status, body FROM ArchivedPages WHERE url=? AND fetched<=? "
+                                          "ORDER BY fetched DESC LIMIT 1;",
+                                          (url, before if before is not None else time.time())).fetchone()
+        if row is None:
+            return None
+        return row[0], zlib.decompress(row[1])
+
+    def replay(self, url, missing=None):
+        """
+        :param missing: (status, body) to return for a page that isn't in the archive, instead of raising
+        :return: (status, body) of the latest copy of the page
+        raises PageNotArchived if it isn't in the archive and missing is None
+        """
+        page = self.get(url)
+        if page is None and missing is None:
+            raise PageNotArchived(url)
+        page = page if page is not None else missing
+        with self.lock:
+            self.counters[3] += 1
+        return page
+
+    def archived_values(self, endpoint):
+        """
+        :param endpoint: name of one of the URL templates in constants.py (e.g. "ROSTER_URL")
+        :return: list with the values formatted into the template (see fetch.match_endpoint) for every page built from
+        it that loaded when it was last fetched
+        """
+        with self.lock:
+            urls = self.connection.execute("SELECT url FROM ArchivedPages AS page WHERE endpoint=? AND status=200 AND "
+                                           "fetched=(SELECT max(fetched) FROM ArchivedPages WHERE url=page.url);",
+                                           (endpoint,)).fetchall()
+        return [match_endpoint(url)[1] for url, in urls]
+
+    def summary(self):
+        """
+        :return: list of (endpoint, pages, copies, bytes, compressed bytes) for every URL template in the archive
+        """
+        with self.lock:
+            return self.connection.execute("SELECT endpoint, count(DISTINCT url), count(*), sum(size), "
+                                           "sum(length(body)) FROM ArchivedPages GROUP BY endpoint "
+                                           "ORDER BY endpoint;").fetchall()
+
+    def report(self):
+        """
+        Prints how many pages the archive holds for each URL template and how well they compressed
+        """
+        print("{:>18} {:>8} {:>8} {:>10} {:>12}".format("endpoint", "pages", "copies", "MB", "compressed"))
+        for endpoint, pages, copies, size, compressed in self.summary():
+            print("{:>18} {:>8} {:>8} {:>10.2f} {:>10.2f}MB  {:.1f}x".format(
+                endpoint, pages, copies, size / 1024 ** 2, compressed / 1024 ** 2, size / max(compressed, 1)))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show what a page archive holds")
+    parser.add_argument("archive", nargs="?", default=PAGE_ARCHIVE_FILE_NAME)
+    args = parser.parse_args()
+    archive = PageArchive(args.archive)
+    archive.report()
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
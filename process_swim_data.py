@@ -5,8 +5,12 @@ import re
 import helperfunctions as hf
 from collections import Counter
 import math
+import numpy as np
 # This file is for processing the data
 
+# columns of get_athlete_data that can be used as predicted performances
+PREDICTION_PREFERENCES = ["minimum_time", "average_time", "median_time"]
+
 
 def get_data():
     """
@@ -35,30 +39,16 @@ def get_athlete_data(swims, swimmers, teams, event_list):
     :param event_list: list of events included in the dataset
     :return: team_data, a dataframe of all swimmers, as well as different measures of their performance
     """
-    # group swim data by swimmer ID and event code
-    grouped_dataset = swims.groupby(["swimmer", "event"])
-    # get list of all groups made above
-    swimmer_event_pairs_used = grouped_dataset.groups.keys()
-
-    team_data = []
-    for swimmer, swimmer_data in swimmers.iterrows():
-        team = teams.loc[swimmer_data["team_id"]]["team_name"]
-        for event in event_list:
-            if (swimmer, event) not in swimmer_event_pairs_used:
-                # swimmer-event pair is not an existing group (meaning swimmer never participated in that event), so
-                # put down their predicted times for the event as None
-                team_data.append({"swimmer_id": swimmer, "event": event, "team": team, "minimum_time": None,
-                                  "average_time": None, "median_time": None})
-            else:
-                # swimmer-event pair exists, so calculate and insert predicted times for that swimmer-event pair
-                individual_event_data = grouped_dataset.get_group((swimmer, event))
-                minimum_time = individual_event_data["time"].min()
-                average_time = individual_event_data["time"].mean()
-                median_time = individual_event_data["time"].median()
-                team_data.append({"swimmer_id": swimmer, "event": event, "team": team,
-                                  "minimum_time": minimum_time, "average_time": average_time, "median_time": median_time})
-    # convert team_data dictionary into a pandas dataframe
-    team_data = pd.DataFrame(team_data, columns=["swimmer_id", "event", "team", "minimum_time", "average_time", "median_time"])
+    # minimum, average, and median time of every swimmer-event pair, worked out for every group at once
+    grouped_times = swims.groupby(["swimmer", "event"])["time"].agg(["min", "mean", "median"])
+    grouped_times.columns = ["minimum_time", "average_time", "median_time"]
+    # one row for every swimmer in every event, in swimmer then event order. Swimmer-event pairs that aren't an existing
+    # group (meaning the swimmer never participated in that event) get NaN for their predicted times
+    all_pairs = pd.MultiIndex.from_product([swimmers.index, event_list], names=["swimmer_id", "event"])
+    team_data = grouped_times.reindex(all_pairs).reset_index()
+    # look every swimmer's team name up once, then repeat it for each of their events
+    team_names = swimmers["team_id"].map(teams["team_name"]).to_numpy()
+    team_data.insert(2, "team", team_names.repeat(len(event_list)))
     # This will have every possible athlete-event pairing, even if an athlete hasn't done that event before
     return team_data
 
@@ -154,27 +144,36 @@ def get_predicted_performance_matrix(team_data, preference):
     Outputs:
     athlete_prediction_dictionary, a dictionary of athletes and their predicted performances
     """
-    # NOTE: This returns a DATA FRAME since it converts the dictionary into a data frame.
+    # NOTE: This returns a DATA FRAME with a row for every swimmer id and a column for every event.
     # NOTE: In the future when we decide how this information is input, there should be a dictionary that converts
     #  different input types to be equal to these values (i.e. {"minimum" : MIN,...}), or the reverse of this
-    # NOTE: It also might be a good idea to use athlete ID instead of name somewhere in case two team members have the
-    #  same name, but that is a problem for another time
 
-    group_by_individual = team_data.groupby("swimmer_id")  # should uniquely identify every player
+    # one row per athlete (in swimmer id order) with their predicted time in each event, in a single reshape
+    athlete_predictions = team_data.pivot(index="swimmer_id", columns="event", values=preference)
+    # keep the events in the order they come in team_data, and leave the index and columns unnamed
+    athlete_predictions = athlete_predictions.reindex(columns=team_data["event"].unique())
+    athlete_predictions.index.name = None
+    athlete_predictions.columns.name = None
+    return athlete_predictions
 
-    athlete_prediction_dictionary = {}
-    for athlete, athlete_data in group_by_individual:
-        # get a single athlete's performance in all events, using performance measurement preference
-        individual_data = athlete_data[["event", preference]].transpose()
-        # name columns after events
-        individual_data.columns = individual_data.iloc[0]
-        # there should be an extra row that has all the column names in it. get rid of it
-        individual_data.drop("event", inplace=True)
-        # add a dictionary entry for that athlete with all of the events and predicted times
-        athlete_prediction_dictionary[athlete] = individual_data.to_dict('records')[0]
-    #print(athlete_prediction_dictionary)
-    # convert dictionary to pandas dataframe and return it
-    return pd.DataFrame.from_dict(athlete_prediction_dictionary, orient='index')
+
+def get_predicted_performance_array(team_data, preferences=PREDICTION_PREFERENCES):
+    """
+    get_predicted_performance_matrix for several preferences at once, for comparing how they predict
+    :param team_data: a pandas data frame like get_athlete_data returns
+    :param preferences: list of columns of team_data to use as predicted performances
+    :return performances: numpy array where performances[p, s, e] is the predicted time of swimmer s in event e using
+    preferences[p], NaN for events a swimmer hasn't swum
+    :return swimmer_ids: numpy array of the swimmer ids along the second axis, in the same order as the rows of
+    get_predicted_performance_matrix
+    :return events: numpy array of the event codes along the third axis, in the same order as its columns
+    """
+    swimmer_codes, swimmer_ids = pd.factorize(team_data["swimmer_id"], sort=True)
+    event_codes, events = pd.factorize(team_data["event"])
+    performances = np.full((len(preferences), len(swimmer_ids), len(events)), np.nan)
+    # every row of team_data fills in its swimmer and event for all of the preferences at once
+    performances[:, swimmer_codes, event_codes] = team_data[preferences].to_numpy(dtype=float).T
+    return performances, np.asarray(swimmer_ids), np.asarray(events)
 
 
 def get_team_lineup(swims, swimmers, teams, event_list, meet_id):
@@ -214,6 +213,32 @@ def get_team_lineup(swims, swimmers, teams, event_list, meet_id):
     return pd.DataFrame.from_dict(meet_lineup, orient='index')
 
 
+def get_team_lineups(swims, swimmers, event_list, meet_ids, team_ids=None):
+    """
+    get_team_lineup for many meets at once, e.g. every meet of a season
+    :param swims: raw data on individual swims in a dataframe.
+    :param swimmers: dataframe of swimmer names and IDs
+    :param event_list: the list of events that are included in the dataset
+    :param meet_ids: list of the meets to find lineups for
+    :param team_ids: list of the teams whose swimmers the lineups include, every team in swimmers if left out
+    :return lineups: numpy array of bools where lineups[m, s, e] is True if swimmer s swam event e at meet meet_ids[m]
+    (meaning a time was recorded for it), the same as the 1s and 0s of get_team_lineup
+    :return swimmer_ids: numpy array of the swimmer ids along the second axis, in the order they are in swimmers
+    :return events: numpy array of the events along the third axis, in the order of event_list
+    """
+    if team_ids is not None:
+        swimmers = swimmers[swimmers["team_id"].isin(team_ids)]
+    meet_swims = swims[swims["meet_id"].isin(meet_ids) & swims["swimmer"].isin(swimmers.index) &
+                       swims["time"].notna()]
+    # count the swims of every swimmer at every meet in each event in one pass, then lay the counts out over all of the
+    # requested meets, swimmers, and events so swimmers who didn't swim at a meet get a row of zeros
+    swim_counts = pd.crosstab([meet_swims["meet_id"], meet_swims["swimmer"]], meet_swims["event"])
+    swim_counts = swim_counts.reindex(index=pd.MultiIndex.from_product([meet_ids, swimmers.index]), columns=event_list,
+                                      fill_value=0)
+    lineups = swim_counts.to_numpy().reshape(len(meet_ids), len(swimmers), len(event_list)) > 0
+    return lineups, swimmers.index.to_numpy(), np.asarray(event_list)
+
+
 def score_event(results_a, results_b, places, scoring_limit):
     """
     assigns points to groups based on who has the smallest score/time.
@@ -282,10 +307,10 @@ def calculate_pred_score(perf_team_a, line_team_a, perf_team_b, line_team_b, sco
     relay_event_results = dict()
     for value in relay_list:
         #find out what type of relay value is and make list of legs in relay
-        if value[2] is "F":
+        if value[2] == "F":
             # relay is a freestyle relay, so there are two types of legs
             legs = [value, value[:1]+"1"+value[2:]]
-        elif value[2] is "M":
+        elif value[2] == "M":
             # relay is medley relay, so there are four different legs
             legs = [value, value[:1] + "2" + value[2:], value[:1] + "3" + value[2:], value[:1] + "4" + value[2:]]
         # get sum of legs in relay for full relay time.
@@ -469,4 +494,6 @@ def demo_code_with_time_filter():
     print(team_a_matrix)
     return(team_a_matrix)
 
-demo_code_with_time_filter()
\ No newline at end of file
+
+if __name__ == "__main__":
+    demo_code_with_time_filter()
\ No newline at end of file
@@ -0,0 +1,78 @@
+import argparse
+import os
+import time
+from constants import *
+import fetch
+from page_archive import PageArchive
+from team_index import find_team_name
+from crawl_workers import crawl_with_workers
+
+########################################################################################################################
+# Rebuilds the database from the page archive (see page_archive.py) with the parsers as they are now, without          #
+# downloading anything, for when the website's markup changed or a parser turned out to be wrong. What to rebuild is   #
+# worked out from the archive itself: every team, gender, and season with an archived roster, every event with an      #
+# archived swimmer times page, and relays for the seasons with archived meet lists. That pull is then run by the       #
+# worker processes of crawl_workers.py with every page replayed from the archive, so parsing is spread over every      #
+# core. Pages the original pulls never fetched count as not found, so combinations that weren't pulled are just left   #
+# out. The new database is built next to the old one and swapped in at the end, and the old one is kept with           #
+# ".before_reparse" added to its name.                                                                                 #
+#     python reparse.py --database collegeswimming.db --archive page_archive.db                                        #
+########################################################################################################################
+
+
+def archived_pull(archive):
+    """
+    :param archive: page_archive.PageArchive to rebuild from
+    :return: (team_ids, genders, year_start, year_end, events) of a pull covering every roster and swimmer times page in
+    the archive, with the relay events of DEFAULT_EVENTS_TO_PULL added if any team's meet list was archived
+    """
+    rosters = [(int(team_id), gender, int(season)) for team_id, gender, season in archive.archived_values("ROSTER_URL")]
+    if not rosters:
+        raise ValueError("there aren't any rosters in the page archive to rebuild from")
+    team_ids = sorted({team_id for team_id, gender, season in rosters})
+    genders = sorted({gender for team_id, gender, season in rosters})
+    seasons = [season for team_id, gender, season in rosters]
+    archived_events = {event for swimmer_id, event in archive.archived_values("SWIMMER_EVENT_URL")}
+    # the default events first, in their usual order
+    events = [event for event in DEFAULT_EVENTS_TO_PULL if event in archived_events] + \
+        sorted(archived_events.difference(DEFAULT_EVENTS_TO_PULL))
+    if archive.archived_values("RESULTS_URL"):
+        events += [event for event in DEFAULT_EVENTS_TO_PULL if event[0] in "MF"]
+    return team_ids, genders, min(seasons) + 1996, max(seasons) + 1997, events
+
+
+def reparse(database_file_name=DATABASE_FILE_NAME, archive_file_name=PAGE_ARCHIVE_FILE_NAME, workers=None):
+    """
+    Rebuilds database_file_name from the pages in the archive
+    :param workers: number of worker processes parsing pages, one per core if left out
+    """
+    archive = PageArchive(archive_file_name)
+    team_ids, genders, year_start, year_end, events = archived_pull(archive)
+    teams = [find_team_name(team_id) for team_id in team_ids]
+    print("Rebuilding {} from {}: {} teams, genders {}, seasons {}-{}, {} events".format(
+        database_file_name, archive_file_name, len(teams), ",".join(genders), year_start, year_end - 1, len(events)))
+    fetch.use_page_archive(archive, "reparse")
+    rebuilt_file_name = database_file_name + ".reparse"
+    if os.path.exists(rebuilt_file_name):
+        os.remove(rebuilt_file_name)
+    start = time.time()
+    crawl_with_workers(teams, genders, year_start, year_end, events, rebuilt_file_name, workers or os.cpu_count() or 1)
+    fetch.use_page_archive(None)
+    archive.close()
+    if os.path.exists(database_file_name):
+        os.replace(database_file_name, database_file_name + ".before_reparse")
+    os.replace(rebuilt_file_name, database_file_name)
+    print("Rebuilt {} in {:.1f} seconds".format(database_file_name, time.time() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the database from the page archive without downloading")
+    parser.add_argument("--database", default=DATABASE_FILE_NAME)
+    parser.add_argument("--archive", default=PAGE_ARCHIVE_FILE_NAME)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per core if left out")
+    args = parser.parse_args()
+    reparse(args.database, args.archive, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from constants import *
+from helperfunctions import convert_to_time
+from fetch import match_endpoint
+
+########################################################################################################################
+# On-disk cache for every page downloaded from collegeswimming.com. Page bodies are stored by the sha256 of their      #
+# contents (so identical pages are only stored once) and an sqlite index maps each url to its body, along with which   #
+# URL template it came from, its size, and when it was stored and last used. How long a page stays fresh depends on    #
+# its template (see RESPONSE_CACHE_TTL in constants.py), and when the cache grows past its size limit the least        #
+# recently used pages are thrown out. A caller that only reads the part of a page about a season that is over (like a  #
+# swimmer's times in one season, or a meet's results) can say when that season ended, and a copy stored after then     #
+# never goes stale for it.                                                                                             #
+########################################################################################################################
+
+CREATE_CACHE_INDEX = "CREATE TABLE IF NOT EXISTS CachedPages (url TEXT PRIMARY KEY, content_hash TEXT, endpoint TEXT, " \
+                     "size INTEGER, stored REAL, last_used REAL);"
+CREATE_CACHE_LRU_INDEX = "CREATE INDEX IF NOT EXISTS CachedPagesLastUsed ON CachedPages (last_used);"
+# endpoints whose url has a season id in it, and which slot of the template it is in
+SEASON_SLOTS = {"ROSTER_URL": 2, "RESULTS_URL": 1}
+
+
+def season_is_closed(season_id, now=None):
+    """
+    :param season_id: collegeswimming.com season id, which is the starting year of the season minus 1996
+    :return: True if the season is over, so nothing about it should change anymore
+    """
+    now = time.time() if now is None else now
+    season_end = convert_to_time(int(season_id) + 1996 + 1, SEASON_LINE_MONTH, SEASON_LINE_DAY)
+    return season_end < now
+
+
+def time_to_live(url):
+    """
+    :param url: url of a cached page
+    :return: seconds the page stays fresh once stored, or None if it never goes stale
+    """
+    endpoint, values = match_endpoint(url)
+    if endpoint in SEASON_SLOTS and values[SEASON_SLOTS[endpoint]].isdigit() and \
+            season_is_closed(values[SEASON_SLOTS[endpoint]]):
+        return None
+    return RESPONSE_CACHE_TTL.get(endpoint, RESPONSE_CACHE_TTL["OTHER"])
+
+
+class ResponseCache:
+    """
+    The cache can be shared between threads (crawler.py downloads from a thread pool).
+    """
+    def __init__(self, directory=RESPONSE_CACHE_DIRECTORY, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self.connection.execute(CREATE_CACHE_INDEX)
+        self.connection.execute(CREATE_CACHE_LRU_INDEX)
+        self.connection.commit()
+        self.stored_bytes = self.total_bytes()
+        # {endpoint: [hits, misses]}
+        self.counters = {}
+
+    def blob_file_name(self, content_hash):
+        return os.path.join(self.directory, content_hash[:2], content_hash)
+
+    def count(self, url, hit):
+        counter = self.counters.setdefault(match_endpoint(url)[0], [0, 0])
+        counter[0 if hit else 1] += 1
+
+    def get(self, url, settled_at=None):
+        """
+        :param url: url of the page
+        :param settled_at: timestamp after which the part of the page the caller uses can't change anymore (like the end
+        of the season it is about). A copy stored after then is fresh forever, whatever the page's time to live
+        :return: the cached body of the page, or None if it isn't cached or has gone stale
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT content_hash, stored FROM CachedPages WHERE url=?;", (url,)).fetchone()
+            ttl = time_to_live(url)
+            if row is not None and settled_at is not None and row[1] >= settled_at:
+                ttl = None
+            now = time.time()
+            if row is None or (ttl is not None and row[1] + ttl < now):
+                self.count(url, False)
+                return None
+            try:
+                with open(self.blob_file_name(row[0]), "rb") as blob:
+                    source = blob.read()
+            except FileNotFoundError:
+                self.count(url, False)
+                return None
+            self.connection.execute("UPDATE CachedPages SET last_used=? WHERE url=?;", (now, url))
+            self.connection.commit()
+            self.count(url, True)
+            return source
+
+    def put(self, url, source):
+        """
+        :param url: url of the page
+        :param source: body of the page, in bytes
+        """
+        content_hash = hashlib.sha256(source).hexdigest()
+        file_name = self.blob_file_name(content_hash)
+        with self.lock:
+            if not os.path.exists(file_name):
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                # named after the process, since crawl_workers.py can have several writing the same page at once
+                part_file_name = "{}.{}.part".format(file_name, os.getpid())
+                with open(part_file_name, "wb") as blob:
+                    blob.write(source)
+                os.replace(part_file_name, file_name)
+                self.stored_bytes += len(source)
+            old_row = self.connection.execute("SELECT content_hash, size FROM CachedPages WHERE url=?;",
+                                              (url,)).fetchone()
+            now = time.time()
+            self.connection.execute("INSERT OR REPLACE INTO CachedPages VALUES(?, ?, ?, ?, ?, ?);",
+                                    (url, content_hash, match_endpoint(url)[0], len(source), now, now))
+            if old_row is not None and old_row[0] != content_hash:
+                self.release_blob(*old_row)
+            self.evict()
+            self.connection.commit()
+
+    def total_bytes(self):
+        # identical pages share one file on disk, so only count each body once
+        return self.connection.execute("SELECT coalesce(sum(size), 0) FROM "
+                                       "(SELECT DISTINCT content_hash, size FROM CachedPages);").fetchone()[0]
+
+    def release_blob(self, content_hash, size):
+        """
+        Deletes a page body from disk if no url points to it anymore. Must be called holding the lock.
+        """
+        if self.connection.execute("SELECT 1 FROM CachedPages WHERE content_hash=? LIMIT 1;",
+                                   (content_hash,)).fetchone() is None:
+            os.remove(self.blob_file_name(content_hash))
+            self.stored_bytes -= size
+
+    def evict(self):
+        """
+        Throws out least recently used pages until the cache fits in max_bytes. Must be called holding the lock.
+        """
+        while self.stored_bytes > self.max_bytes:
+            row = self.connection.execute("SELECT url, content_hash, size FROM CachedPages ORDER BY last_used LIMIT 1;"
+                                          ).fetchone()
+            if row is None:
+                break
+            self.connection.execute("DELETE FROM CachedPages WHERE url=?;", (row[0],))
+            self.release_blob(row[1], row[2])
+
+    def report(self):
+        """
+        Prints the hits and misses for each endpoint since the cache was opened
+        """
+        for endpoint, (hits, misses) in sorted(self.counters.items()):
+            print("{:>18}: {:6} hits {:6} misses".format(endpoint, hits, misses))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
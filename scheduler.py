@@ -0,0 +1,248 @@
+import multiprocessing
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from constants import *
+from crawl_metrics import get_metrics
+from fetch import match_endpoint
+
+########################################################################################################################
+# Every download fetch_url makes goes through a RequestScheduler, which keeps each host at a steady rate with a token  #
+# bucket and tries requests again when they fail for reasons that might go away:                                       #
+#     429 Too Many Requests and 503 Service Unavailable: the whole host is paused for as long as the Retry-After       #
+#         header asks (or an exponential backoff if there isn't one) and its rate is halved. The rate creeps back up   #
+#         as pages load again                                                                                          #
+#     other 5xx errors, 408, timeouts, and dropped connections: the request is tried again after an exponential        #
+#         backoff with jitter, so many workers don't all come back at the same moment                                  #
+#     404 and every other error: raised straight away, the page really isn't there                                     #
+# A request that still fails after SCHEDULER_TRIES tries raises RequestDeferred. The scrapers catch it for the whole   #
+# crawl unit and put the unit in a DeferredRetryQueue (see crawl_frontier.py) to be tried again later in the pull,     #
+# instead of treating the page as empty.                                                                               #
+########################################################################################################################
+
+# status codes worth trying again, and the ones that mean the host wants us to slow down
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+class RequestDeferred(Exception):
+    """
+    Raised when a request has failed every try for reasons that might go away if it is tried again later
+    """
+    def __init__(self, url, error, tries):
+        super().__init__("{} failed after {} tries ({})".format(url, tries, error))
+        self.url = url
+        self.error = error
+
+
+def backoff_delay(attempt, backoff=SCHEDULER_BACKOFF):
+    """
+    :param attempt: number of tries that have failed so far, minus one
+    :return: seconds to wait before the next try, doubled after every failed try and randomly between half and one and
+    a half times that
+    """
+    return min(SCHEDULER_MAX_WAIT, backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def retry_after_seconds(headers):
+    """
+    :param headers: headers of an error response
+    :return: seconds the Retry-After header asks to wait (it can be a number of seconds or a date), or None if there
+    isn't one that makes sense
+    """
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(SCHEDULER_MAX_WAIT, int(value))
+    try:
+        return min(SCHEDULER_MAX_WAIT, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Lets requests to one host through at rate a second, with up to burst of them at once after a quiet spell. The
+    bucket can go into debt: every request takes a token straight away and waits for as long as it takes the bucket to
+    refill to it, so waiting requests go out evenly spaced in the order they asked
+    """
+    def __init__(self, rate, burst=SCHEDULER_BURST, min_rate=SCHEDULER_MIN_REQUESTS_PER_SECOND):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # when the rate was last halved, and what it was before that
+        self.slowed = 0.0
+        self.ceiling = rate
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        :return: seconds to wait before sending the request that takes the next token
+        """
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def slow_down(self, pause, sent):
+        """
+        Holds back every request that hasn't gone out yet for at least pause seconds, and halves the rate. Requests that
+        were already out when the rate was last halved only count once, so a burst of 429s halves it a single time
+        :param sent: time.monotonic() when the request that was throttled went out
+        """
+        with self.lock:
+            self.refill()
+            if sent >= self.slowed:
+                self.ceiling = self.rate
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.slowed = time.monotonic()
+            self.tokens = min(self.tokens, -pause * self.rate)
+
+    def speed_up(self):
+        """
+        Raises the rate a little after a request goes through. Close to the rate the host last pushed back at, it goes
+        up ten times slower, so the bucket settles just under what the host puts up with
+        """
+        with self.lock:
+            self.refill()
+            step = self.max_rate / SCHEDULER_RECOVERY_REQUESTS
+            if self.rate >= 0.9 * self.ceiling:
+                step /= 10
+            self.rate = min(self.max_rate, self.rate + step)
+
+
+def shared_field(index):
+    """
+    :return: property reading and writing slot index of the shared state of a SharedTokenBucket
+    """
+    return property(lambda self: self.state[index], lambda self, value: self.state.__setitem__(index, value))
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket kept in shared memory, so several processes (like the workers of crawl_workers.py) take their tokens
+    from one bucket, and any of them can use the whole rate while the others are idle. It has to be made before the
+    processes start and handed to them when they do. time.monotonic is the same clock in every process on a machine
+    """
+    tokens = shared_field(0)
+    updated = shared_field(1)
+    rate = shared_field(2)
+    slowed = shared_field(3)
+    ceiling = shared_field(4)
+
+    def __init__(self, rate, burst=SCHEDULER_BURST, min_rate=SCHEDULER_MIN_REQUESTS_PER_SECOND,
+                 context=multiprocessing):
+        """
+        :param context: multiprocessing context the processes sharing the bucket are started from
+        """
+        self.state = context.RawArray("d", 5)
+        super().__init__(rate, burst, min_rate)
+        self.lock = context.Lock()
+
+
+class RequestScheduler:
+    def __init__(self, rate=SCHEDULER_REQUESTS_PER_SECOND, burst=SCHEDULER_BURST, tries=SCHEDULER_TRIES,
+                 backoff=SCHEDULER_BACKOFF, buckets=None):
+        """
+        :param rate: requests a second sent to each host. None sends them as fast as they are asked for (but still
+        tries them again when they fail), which is meant for the stand-in server
+        :param burst: requests that can go out back to back after a quiet spell
+        :param tries: times a request is tried before RequestDeferred is raised
+        :param backoff: seconds waited after the first failed try, doubled after every one after that
+        :param buckets: dictionary of {host: TokenBucket} to use for those hosts instead of making new ones, like the
+        SharedTokenBucket crawl_workers.py gives every worker
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tries = tries
+        self.backoff = backoff
+        # {host: TokenBucket}
+        self.buckets = dict(buckets or {})
+        self.lock = threading.Lock()
+        # [requests sent, tries that failed and were tried again, throttling responses, requests given up on]
+        self.counters = [0, 0, 0, 0]
+
+    def bucket(self, url):
+        """
+        :return: the TokenBucket of the url's host, or None if requests aren't rate limited
+        """
+        if self.rate is None:
+            return None
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def wait(self, endpoint, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+            get_metrics().record_wait(endpoint, seconds)
+
+    def request(self, url, download):
+        """
+        :param url: url to request, after fetch.resolve_url
+        :param download: function(url) that makes the request and returns the body of the page
+        :return: whatever download returned
+        raises HTTPError for errors that won't go away by trying again (like 404), or RequestDeferred if the request
+        kept failing for reasons that might
+        """
+        bucket = self.bucket(url)
+        # time spent holding the request back is recorded against the url's template in the crawl metrics
+        endpoint = match_endpoint(url)[0]
+        for attempt in range(self.tries):
+            if bucket is not None:
+                self.wait(endpoint, bucket.reserve())
+            sent = time.monotonic()
+            self.count(0)
+            try:
+                source = download(url)
+            except HTTPError as e:
+                if e.code not in RETRY_STATUS_CODES:
+                    raise
+                error = e
+            except OSError as e:  # timeouts and dropped connections
+                error = e
+            else:
+                if bucket is not None:
+                    bucket.speed_up()
+                return source
+            pause = None
+            if isinstance(error, HTTPError) and error.code in THROTTLE_STATUS_CODES:
+                self.count(2)
+                pause = retry_after_seconds(error.headers)
+                if pause is None:
+                    pause = backoff_delay(attempt, self.backoff)
+                if bucket is not None:
+                    # every request to the host waits, not just this one, so the next try waits in reserve()
+                    bucket.slow_down(pause, sent)
+                    pause = 0.0
+            if attempt + 1 == self.tries:
+                break
+            self.count(1)
+            self.wait(endpoint, pause if pause is not None else backoff_delay(attempt, self.backoff))
+        self.count(3)
+        raise RequestDeferred(url, error, self.tries)
+
+    def report(self):
+        """
+        Prints how many requests were sent, tried again, throttled, and given up on since the scheduler was made
+        """
+        print("{} requests sent, {} tried again, {} throttled by the host, {} given up on".format(*self.counters))
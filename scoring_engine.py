@@ -0,0 +1,322 @@
+import itertools
+import multiprocessing
+import os
+import re
+import numpy as np
+import pandas as pd
+from constants import *
+
+########################################################################################################################
+# process_swim_data.calculate_pred_score done with numpy arrays. A ScoringEngine works out once, from the list of      #
+# events, which columns are individual events and which are the legs of each relay, so a dual meet is scored with a    #
+# few array operations instead of masking data frames, matching relay names, and calling score_event for every event.  #
+# Scores are the same as calculate_pred_score's, except for differences in the last bits from adding the points up in  #
+# another order.                                                                                                       #
+#     engine = ScoringEngine(bucknell_perf.columns)                                                                    #
+#     score_a, score_b = engine.score(engine.lower(bucknell_perf, bucknell_lineup),                                    #
+#                                     engine.lower(lehigh_perf, lehigh_lineup))                                        #
+########################################################################################################################
+
+# matches the leadoff leg of every relay, like calculate_pred_score
+RELAY_LEADOFF = re.compile(".L[MF].+")
+
+
+def relay_legs(leadoff):
+    """
+    :param leadoff: event code of the leadoff leg of a relay, like "FLM200Y"
+    :return: list of the event codes of every leg of the relay, starting with the leadoff
+    """
+    if leadoff[2] == "F":
+        # freestyle relays have two types of legs
+        return [leadoff, leadoff[:1] + "1" + leadoff[2:]]
+    # medley relays have four different legs
+    return [leadoff] + [leadoff[:1] + leg + leadoff[2:] for leg in "234"]
+
+
+def score_events(times, is_team_a, places, scoring_limits):
+    """
+    score_event for many events (and many meets) at once
+    :param times: numpy array of shape (..., events, entries) with the times of every entry into each event, inf for
+    entries that didn't swim
+    :param is_team_a: numpy array of bools shaped like times, True for team a's entries and False for team b's
+    :param places: numpy array of shape (events, places) with the points awarded for first, second, etc place in each
+    event, padded with 0
+    :param scoring_limits: numpy array with the maximum number of swimmers per team that can score in each event
+    :return: numpy arrays of shape (...) with the scores of team a and b summed over the events
+    """
+    if times.shape[-1] == 0:
+        return np.zeros(times.shape[:-2]), np.zeros(times.shape[:-2])
+    order = np.argsort(times, axis=-1, kind="stable")
+    times = np.take_along_axis(times, order, axis=-1)
+    is_team_a = np.take_along_axis(is_team_a, order, axis=-1)
+    positions = np.arange(times.shape[-1])
+    # entries with the same time are tied, and the place of a group of tied entries is the place of the first of them
+    first_of_tie = np.ones(times.shape, dtype=bool)
+    first_of_tie[..., 1:] = times[..., 1:] != times[..., :-1]
+    last_of_tie = np.ones(times.shape, dtype=bool)
+    last_of_tie[..., :-1] = first_of_tie[..., 1:]
+    tie_start = np.maximum.accumulate(np.where(first_of_tie, positions, 0), axis=-1)
+    tie_end = np.minimum.accumulate(np.where(last_of_tie, positions, positions[-1])[..., ::-1], axis=-1)[..., ::-1] + 1
+    # tied entries split the points of the places they take up. Places past the last one that scores are worth nothing
+    cumulative_points = np.concatenate([np.zeros((len(places), 1), dtype=places.dtype), np.cumsum(places, axis=1)],
+                                       axis=1)
+    events = np.arange(len(places))[:, None]
+    points = (cumulative_points[events, np.minimum(tie_end, places.shape[1])] -
+              cumulative_points[events, np.minimum(tie_start, places.shape[1])]) / (tie_end - tie_start)
+    points = np.where(np.isfinite(times), points, 0)
+    # an entry only scores if its team had at most scoring_limit entries ahead of its group of ties
+    team_a_ahead = np.take_along_axis(np.cumsum(is_team_a, axis=-1) - is_team_a, tie_start, axis=-1)
+    scores = np.where(is_team_a, team_a_ahead, tie_start - team_a_ahead) <= scoring_limits[:, None]
+    score_a = np.where(is_team_a & scores, points, 0).sum(axis=(-2, -1))
+    score_b = np.where(~is_team_a & scores, points, 0).sum(axis=(-2, -1))
+    return score_a, score_b
+
+
+class ScoringEngine:
+    """
+    Scores dual meets the way calculate_pred_score does, for teams whose predicted performances have the events of
+    event_list as their columns. A team's lineup is lowered (see lower) to the times of its entries in every event that
+    is scored: the relay events first, where relays of the same type and distance are scored together whatever the
+    gender (like "F200" for "FLF200Y" and "MLF200Y"), then the individual events
+    """
+    def __init__(self, event_list, scoring_method="Six Lane"):
+        self.event_list = pd.Index(event_list)
+        self.scoring_method = scoring_method
+        columns = {event: column for column, event in enumerate(self.event_list)}
+        self.individual_columns = np.array([column for column, event in enumerate(self.event_list)
+                                            if event[2] not in "MF"], dtype=int)
+        # every relay's legs, padded with -1 up to the four legs of a medley relay
+        leadoffs = [event for event in self.event_list if RELAY_LEADOFF.match(event)]
+        self.relay_leg_columns = np.full((len(leadoffs), 4), -1, dtype=int)
+        relay_events = {}
+        for relay, leadoff in enumerate(leadoffs):
+            legs = [columns[leg] for leg in relay_legs(leadoff)]
+            self.relay_leg_columns[relay, :len(legs)] = legs
+            relay_events.setdefault(leadoff[2:-1], []).append(relay)
+        self.relay_events = list(relay_events)
+        # the relays scored together in every relay event, padded with -1
+        self.relay_event_relays = np.full((len(relay_events), max(map(len, relay_events.values()), default=0)), -1,
+                                          dtype=int)
+        for relay_event, relays in enumerate(relay_events.values()):
+            self.relay_event_relays[relay_event, :len(relays)] = relays
+        # points and scorer limits of every event scored, in the order of the lowered lineups
+        event_places = [RELAY_POINTS[scoring_method]] * len(self.relay_events) + \
+            [INDIVIDUAL_POINTS[scoring_method]] * len(self.individual_columns)
+        self.places = np.zeros((len(event_places), max(map(len, event_places), default=0)), dtype=int)
+        for event, places in enumerate(event_places):
+            self.places[event, :len(places)] = places
+        self.scoring_limits = np.array([SCORER_LIMIT[scoring_method][1]] * len(self.relay_events) +
+                                       [SCORER_LIMIT[scoring_method][0]] * len(self.individual_columns), dtype=int)
+        # {(id(performances), id(lineup)): (performances, lineup, lowered lineup)} of the lineups score_meet lowered,
+        # oldest first. The data frames are kept so their ids can't be taken by new ones while they are in here
+        self.lowered = {}
+
+    def lower(self, performances, lineup):
+        """
+        :param performances: pandas data frame of predicted performances for a team's swimmers, with a column for each
+        event of event_list
+        :param lineup: pandas data frame of a lineup for the team (like get_team_lineup returns), or a numpy array of
+        bools of shape (..., swimmers, events) with one or more lineups in the same order as the rows and columns of
+        performances (like get_team_lineups returns)
+        :return: numpy array of shape (..., events scored, entries) with the times of the team's entries into every
+        event, padded with inf, for score. The leading axes are the ones of the lineup array if one was given
+        """
+        if not performances.columns.equals(self.event_list):
+            performances = performances[self.event_list]
+        if isinstance(lineup, pd.DataFrame):
+            if not (lineup.index.equals(performances.index) and lineup.columns.equals(performances.columns)):
+                lineup = lineup.reindex(index=performances.index, columns=self.event_list)
+            lineup = lineup.to_numpy() == 1
+        times = np.where(lineup, performances.to_numpy(dtype=float), np.nan)
+        relay_times = self.relay_times(times)
+        individual_times = self.individual_times(times)
+        entries = np.full(times.shape[:-2] + self.places.shape[:1] + (max(relay_times.shape[-1],
+                                                                           individual_times.shape[-1]),), np.inf)
+        entries[..., :len(self.relay_events), :relay_times.shape[-1]] = relay_times
+        entries[..., len(self.relay_events):, :individual_times.shape[-1]] = individual_times
+        return entries
+
+    def lowered_lineup(self, performances, lineup):
+        """
+        :return: lower(performances, lineup), which is only worked out the first time the same performances and lineup
+        objects are passed in. A lineup changed in place after that isn't lowered again, so pass in a new one or call
+        forget_lineups. At most SCORING_ENGINE_CACHED_LINEUPS lineups are kept, the oldest are dropped first
+        """
+        key = (id(performances), id(lineup))
+        if key not in self.lowered:
+            if len(self.lowered) >= SCORING_ENGINE_CACHED_LINEUPS:
+                del self.lowered[next(iter(self.lowered))]
+            self.lowered[key] = (performances, lineup, self.lower(performances, lineup))
+        return self.lowered[key][2]
+
+    def forget_lineups(self):
+        """
+        Drops every lineup lowered_lineup has kept
+        """
+        self.lowered.clear()
+
+    def score_meet(self, team_a, team_b):
+        """
+        calculate_pred_score for a single dual meet. Scoring the same lineups again (like while searching for the best
+        lineup against a few of the other team's) skips lowering them, which takes longer than scoring the meet
+        :param team_a: (performances, lineup) of team a, as lower takes them, or a lineup already lowered with lower
+        :param team_b: (performances, lineup) of team b, or a lineup already lowered with lower
+        :return: (score_a, score_b) predicted scores of team a and b
+        """
+        entries = [team if isinstance(team, np.ndarray) else self.lowered_lineup(*team) for team in (team_a, team_b)]
+        score_a, score_b = self.score(*entries)
+        return float(score_a), float(score_b)
+
+    def relay_times(self, times):
+        """
+        :param times: numpy array of shape (..., swimmers, events) with the predicted times of the swimmers in the
+        events they swim, NaN elsewhere
+        :return: numpy array of shape (..., relay events, relays) with the time of every relay, the sum of the times of
+        everyone swimming one of its legs, and inf for relays nobody swims in
+        """
+        # every leg is added up over the swimmers along the last axis, which is how pandas adds up the columns in
+        # calculate_pred_score, so relay times come out the same to the last bit and the same relays are found to tie
+        leg_times = np.nansum(np.swapaxes(times, -1, -2)[..., self.relay_leg_columns, :], axis=-1)
+        relay_times = np.where(self.relay_leg_columns >= 0, leg_times, 0).sum(axis=-1)
+        relay_times = np.where(relay_times != 0, relay_times, np.inf)
+        return np.where(self.relay_event_relays >= 0, relay_times[..., self.relay_event_relays], np.inf)
+
+    def individual_times(self, times):
+        """
+        :param times: numpy array of shape (..., swimmers, events) with the predicted times of the swimmers in the
+        events they swim, NaN elsewhere
+        :return: numpy array of shape (..., individual events, entries) with the times of the swimmers swimming each
+        individual event, fastest first, padded with inf up to the most swimmers any event has
+        """
+        times = np.swapaxes(times[..., self.individual_columns], -1, -2)
+        # only the swimmers in the lineup are entered, which is usually a few of the team in every event, so the rest
+        # are dropped to keep the sort in score_events short
+        times = np.sort(np.where(np.isnan(times), np.inf, times), axis=-1)
+        return times[..., :np.isfinite(times).sum(axis=-1).max(initial=0)]
+
+    def score(self, entries_a, entries_b):
+        """
+        :param entries_a: lowered lineup of team a (see lower)
+        :param entries_b: lowered lineup of team b. The axes before the last two are broadcast against entries_a's, so
+        entries_a[:, None] and entries_b[None, :] score every lineup of team a against every lineup of team b
+        :return: predicted scores of team a and b. numpy arrays with the broadcast leading axes if several lineups were
+        lowered at once
+        """
+        # both teams' entries side by side in every event
+        batch_shape = np.broadcast_shapes(entries_a.shape[:-1], entries_b.shape[:-1])
+        times = np.concatenate([np.broadcast_to(entries_a, batch_shape + entries_a.shape[-1:]),
+                                np.broadcast_to(entries_b, batch_shape + entries_b.shape[-1:])], axis=-1)
+        is_team_a = np.broadcast_to(np.arange(times.shape[-1]) < entries_a.shape[-1], times.shape)
+        return score_events(times, is_team_a, self.places, self.scoring_limits)
+
+
+def lower_lineups(engine, performances, lineups):
+    """
+    :param engine: ScoringEngine for the events of performances
+    :param performances: pandas data frame of predicted performances for a team's swimmers
+    :param lineups: list of pandas data frames of lineups for the team, or a numpy array of bools of shape (lineups,
+    swimmers, events) like get_team_lineups returns
+    :return: numpy array of shape (lineups, events scored, entries) with every lineup lowered (see ScoringEngine.lower)
+    """
+    if isinstance(lineups, np.ndarray):
+        return engine.lower(performances, lineups)
+    lowered = [engine.lower(performances, lineup) for lineup in lineups]
+    entries = np.full((len(lowered), len(engine.places), max((times.shape[-1] for times in lowered), default=0)),
+                      np.inf)
+    for lineup, times in enumerate(lowered):
+        entries[lineup, :, :times.shape[-1]] = times
+    return entries
+
+
+def score_rows(engine, entries_a, entries_b, batch_size):
+    """
+    Scores every lineup of team a against every lineup of team b, batch_size meets at a time
+    :param entries_a: lowered lineups of team a (see lower_lineups)
+    :param entries_b: lowered lineups of team b
+    :return: numpy array of shape (lineups of team a, lineups of team b, 2) with the scores of team a and b in every
+    meet
+    """
+    scores = np.zeros((len(entries_a), len(entries_b), 2))
+    rows = max(1, batch_size // max(len(entries_b), 1))
+    for start in range(0, len(entries_a), rows):
+        score_a, score_b = engine.score(entries_a[start:start + rows, None], entries_b[None])
+        scores[start:start + rows, :, 0] = score_a
+        scores[start:start + rows, :, 1] = score_b
+    return scores
+
+
+# (engine, lowered lineups of every team, batch_size) in a worker process of score_matrix, set once by start_worker
+worker_state = None
+
+
+def start_worker(engine, entries, batch_size):
+    """
+    Pool initializer of score_matrix, so the engine and every team's lowered lineups are sent to each worker once
+    instead of with every shard
+    """
+    global worker_state
+    worker_state = (engine, entries, batch_size)
+
+
+def score_shard(team_a, team_b, start, stop):
+    """
+    :return: score_rows of lineups start to stop of team_a against every lineup of team_b, in a worker process
+    """
+    engine, entries, batch_size = worker_state
+    return score_rows(engine, entries[team_a][start:stop], entries[team_b], batch_size)
+
+
+def matrix_workers(lineup_counts, workers=SCORE_MATRIX_WORKERS):
+    """
+    :param lineup_counts: number of lineups of every team in a score matrix
+    :param workers: most processes to split the matrix between
+    :return: number of processes score_matrix actually scores the matrix in. Starting a process takes longer than
+    scoring a few thousand meets, and processes past one a core only take turns, so this is at most one a core and one
+    for every SCORE_MATRIX_MEETS_PER_WORKER meets
+    """
+    meets = sum(count_a * count_b for count_a, count_b in itertools.combinations(lineup_counts, 2))
+    return max(1, min(workers, os.cpu_count() or 1, meets // SCORE_MATRIX_MEETS_PER_WORKER))
+
+
+def score_matrix(performances, lineups, scoring_method="Six Lane", workers=SCORE_MATRIX_WORKERS,
+                 batch_size=SCORE_MATRIX_BATCH_SIZE):
+    """
+    process_swim_data.pred_score_matrix for any number of teams and lineups. With more than two teams (like a
+    triangular meet), every pair of teams is scored as a dual meet and each team's points are added up over its dual
+    meets, like a double dual.
+    :param performances: list of pandas data frames of predicted performances, one for each team, all with the same
+    events as their columns
+    :param lineups: list with the lineups of every team, each a list of pandas data frames or a numpy array like
+    get_team_lineups returns
+    :param scoring_method: used to determine how points are allocated
+    :param workers: most processes the lineups are split between, 1 to score them all in this process. Fewer are
+    used on machines with fewer cores and for small matrices (see matrix_workers)
+    :param batch_size: meets scored together in one batch of array operations
+    :return: numpy array of shape (lineups of team 1, ..., lineups of team k, k) where [i_1, ..., i_k, t] is the score
+    of team t when every team u uses lineup i_u. For two teams, [i, j] is the (score_a, score_b) of pred_score_matrix
+    """
+    engine = ScoringEngine(performances[0].columns, scoring_method)
+    entries = [lower_lineups(engine, team, team_lineups) for team, team_lineups in zip(performances, lineups)]
+    lineup_counts = [len(team_entries) for team_entries in entries]
+    pairs = list(itertools.combinations(range(len(entries)), 2))
+    workers = matrix_workers(lineup_counts, workers)
+    # the lineups of the first team of every pair are split into one contiguous shard of rows for each worker
+    shards = [(team_a, team_b, rows[0], rows[-1] + 1) for team_a, team_b in pairs
+              for rows in np.array_split(np.arange(lineup_counts[team_a]), workers) if len(rows)]
+    if workers > 1:
+        # spawned rather than forked, like the workers of crawl_workers.py
+        with multiprocessing.get_context("spawn").Pool(workers, start_worker, (engine, entries, batch_size)) as pool:
+            results = pool.starmap(score_shard, shards, chunksize=1)
+    else:
+        results = [score_rows(engine, entries[team_a][start:stop], entries[team_b], batch_size)
+                   for team_a, team_b, start, stop in shards]
+
+    payoffs = np.zeros(lineup_counts + [len(entries)])
+    for (team_a, team_b, start, stop), scores in zip(shards, results):
+        # the scores of a dual meet only depend on the lineups of its two teams, so they are spread over the others
+        shape = [1] * len(entries)
+        shape[team_a], shape[team_b] = stop - start, lineup_counts[team_b]
+        team_a_rows = (slice(None),) * team_a + (slice(start, stop), Ellipsis)
+        payoffs[team_a_rows + (team_a,)] += scores[..., 0].reshape(shape)
+        payoffs[team_a_rows + (team_b,)] += scores[..., 1].reshape(shape)
+    return payoffs
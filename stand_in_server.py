@@ -0,0 +1,163 @@
+import argparse
+import gzip
+import os
+import random
+import ssl
+import threading
+import time
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote
+from constants import *
+
+########################################################################################################################
+# A local stand-in for collegeswimming.com. It serves pages that were recorded earlier out of a directory, so the      #
+# scrapers can be run (and timed) without an internet connection and without bothering the real website. Point a      #
+# scraper at it with fetch.use_site_root("http://127.0.0.1:<port>").                                                   #
+#                                                                                                                      #
+# If it is started with an upstream, any page it doesn't have yet is downloaded from the upstream, saved, and served,  #
+# which is how the recorded page directory gets filled in the first place:                                             #
+#     python stand_in_server.py --upstream https://www.collegeswimming.com                                            #
+#                                                                                                                      #
+# --throttle-rate and --failure-rate make it answer some requests with 429s and 503s, to see how the scrapers cope     #
+# with a website that is overloaded or wants them to slow down. --certificate serves https instead, and                #
+# --connect-latency adds a delay to setting up every new connection, to see what keep-alive connections save (see      #
+# connection_pool.py).                                                                                                 #
+########################################################################################################################
+
+
+def page_file_name(page_directory, path):
+    """
+    :param page_directory: directory the recorded pages are kept in
+    :param path: path and query string of a request (e.g. /swimmer/221480/times/byeventid/150Y)
+    :return: the file that page is recorded in
+    """
+    return os.path.join(page_directory, quote(path, safe=""))
+
+
+def make_handler(page_directory, upstream=None, latency=0.0, throttle_rate=None, failure_rate=0.0, connect_latency=0.0):
+    """
+    :param page_directory: directory the recorded pages are kept in
+    :param upstream: site root to download (and record) pages from when they aren't recorded yet. None means 404
+    :param latency: seconds to wait before answering each request, to act more like a server on the other side of the
+    internet
+    :param throttle_rate: requests a second the server answers before it starts answering 429 with a Retry-After
+    header, like a website that bans scrapers that go too fast. None never throttles
+    :param failure_rate: fraction of requests (0 to 1) answered with a 503 with no Retry-After, at random
+    :param connect_latency: seconds to wait before answering anything on a new connection, which the client spends
+    waiting on the TLS handshake (or its first response). Stands in for the round trips of setting up a connection
+    :return: a request handler class for ThreadingHTTPServer
+    """
+    # [tokens, time they were counted] of the server's own token bucket
+    throttle = [throttle_rate, time.monotonic()]
+    throttle_lock = threading.Lock()
+
+    def throttled():
+        with throttle_lock:
+            now = time.monotonic()
+            throttle[0] = min(throttle_rate, throttle[0] + (now - throttle[1]) * throttle_rate)
+            throttle[1] = now
+            if throttle[0] < 1:
+                return True
+            throttle[0] -= 1
+            return False
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # the headers and the body go out in separate writes, which Nagle's algorithm would hold up on a kept-alive
+        # connection until the client's delayed ACK
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            if connect_latency:
+                time.sleep(connect_latency)
+            super().setup()
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            if throttle_rate is not None and throttled():
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if random.random() < failure_rate:
+                self.send_error(503)
+                return
+            file_name = page_file_name(page_directory, self.path)
+            if not os.path.exists(file_name) and upstream is not None:
+                try:
+                    source = urllib.request.urlopen(upstream + self.path, timeout=FETCH_TIMEOUT).read()
+                except urllib.request.HTTPError as e:
+                    self.send_error(e.code)
+                    return
+                with open(file_name, "wb") as page_file:
+                    page_file.write(source)
+            if not os.path.exists(file_name):
+                self.send_error(404)
+                return
+            with open(file_name, "rb") as page_file:
+                source = page_file.read()
+            self.send_response(200)
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                source = gzip.compress(source)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(source)))
+            self.end_headers()
+            self.wfile.write(source)
+
+        def log_message(self, format, *args):
+            pass  # one line per request drowns out the scraper's own output
+
+    return StandInHandler
+
+
+def start_stand_in_server(page_directory=STAND_IN_PAGE_DIRECTORY, port=STAND_IN_PORT, upstream=None, latency=0.0,
+                          throttle_rate=None, failure_rate=0.0, connect_latency=0.0, certificate=None):
+    """
+    Starts the server on a background thread. The arguments after port (except certificate) are the same as
+    make_handler's
+    :param port: port to listen on. 0 picks any free port
+    :param certificate: PEM file holding a certificate and its private key. If given the server speaks https
+    :return server: the running server. server.server_address[1] is the port, server.shutdown() stops it
+    """
+    os.makedirs(page_directory, exist_ok=True)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(page_directory, upstream, latency, throttle_rate,
+                                                                   failure_rate, connect_latency))
+    if certificate is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certificate)
+        # the handshake happens on the connection's own thread instead of holding up every other connection's accept
+        server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded collegeswimming.com pages locally")
+    parser.add_argument("--directory", default=STAND_IN_PAGE_DIRECTORY, help="directory of recorded pages")
+    parser.add_argument("--port", type=int, default=STAND_IN_PORT)
+    parser.add_argument("--upstream", default=None, help="record missing pages from here (e.g. " + SITE_ROOT + ")")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay added to every response")
+    parser.add_argument("--throttle-rate", type=float, default=None,
+                        help="requests a second answered before answering 429 Too Many Requests")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--connect-latency", type=float, default=0.0,
+                        help="seconds of delay added to setting up every connection")
+    parser.add_argument("--certificate", default=None, help="PEM file with a certificate and key, to serve https")
+    args = parser.parse_args()
+    server = start_stand_in_server(args.directory, args.port, args.upstream, args.latency, args.throttle_rate,
+                                   args.failure_rate, args.connect_latency, args.certificate)
+    print("Serving {} on {}://127.0.0.1:{}".format(args.directory, "https" if args.certificate else "http",
+                                                   server.server_address[1]))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
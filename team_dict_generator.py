@@ -1,44 +1,24 @@
-import urllib.request
-from bs4 import BeautifulSoup
+from constants import *
+import team_directory
 
-# There shouldn't be any schools in the database with a bigger id number than this
-MAX_TEAM_ID = 9826
-# this is the base for the url that leads to any given team's homepage
-TEAM_URL = "https://www.collegeswimming.com/team/{}"
 
-
-def create_team_dict():
-    team_dict = {}
-    team_id_counter = 1
-    while team_id_counter < MAX_TEAM_ID + 1:
-        # gets a list of (Name, swimmerId) tuples and the team name for a given teamId
-        url = TEAM_URL.format(team_id_counter)
-        try:  # open the url for a team's homepage
-            page = urllib.request.urlopen(url)
-            source = page.read()
-        except urllib.request.HTTPError as e:
-            # page doesn't exist or doesn't load, skip to next team's page
-            print(e)
-            team_id_counter = team_id_counter + 1
-            continue
-
-        soup = BeautifulSoup(source, 'html.parser')
-        # find team name in BeautifulSoup
-        team_name = soup.find("h1", class_="c-toolbar__title").text
-        team_dict[team_name] = team_id_counter
-        team_id_counter = team_id_counter + 1
-    print("Writing data to file.")
-    # write the dictionary variable into a .py file
-    dict_file = open("team_dict.py","w+")
-    dict_file.write("TEAM_DICT = " + str(team_dict))
-    dict_file.close()
+def build_team_directory():
+    """
+    Fills the TeamDirectory table (see team_directory.py) with every team id up to MAX_TEAM_ID. team_dict.py isn't
+    written anymore, teams are looked up from the table instead (see team_index.py)
+    """
+    # the directory does the downloading (concurrently, with retries). Ids it already checked are skipped, so running
+    # this again after it was interrupted picks up where it left off
+    team_directory.build_directory(range(1, MAX_TEAM_ID + 1))
 
 
 def confirm_that_you_want_to_run_this():
-    answer = input("Running this code takes approximately 1 hour, are you sure that you want to run this? Type YES "
-                   "if you are certain you wish to run this code. You may cancel this process part way through.")
+    answer = input("Running this code downloads the homepage of every team on collegeswimming.com to fill in the team "
+                   "directory ({}), are you sure that you want to run this? Type YES if you are certain you wish to "
+                   "run this code. You may cancel this process part way through and run it again later to finish."
+                   .format(TEAM_DIRECTORY_FILE_NAME))
     if answer == "YES":
-        create_team_dict()
+        build_team_directory()
     else:
         print("Cancelling")
 
@@ -0,0 +1,161 @@
+import argparse
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from constants import *
+from fetch import fetch_url, HTTPError
+from scheduler import RequestDeferred
+from extraction import make_soup
+from crawl_metrics import ProgressDisplay, timed_parser
+
+########################################################################################################################
+# Builds the TeamDirectory table of every team on collegeswimming.com (the team id and the name on its homepage). Team #
+# pages are downloaded TEAM_DIRECTORY_WORKERS at a time, pages that fail to load are tried again by the request        #
+# scheduler, and results are committed every TEAM_DIRECTORY_CHECKPOINT pages, so an interrupted build picks up where   #
+# it left off. Every id that was checked is recorded, including ones with no team, so they aren't downloaded again.    #
+#     python team_directory.py                       checks every id up to MAX_TEAM_ID that hasn't been checked yet    #
+#     python team_directory.py --first 1 --last 500 --refresh      checks ids 1 to 500 again                           #
+#     python team_directory.py --new 200             checks the 200 ids after the biggest team id found so far         #
+#     python team_directory.py --seed                fills the directory from team_dict.py without downloading         #
+########################################################################################################################
+
+CREATE_TEAM_DIRECTORY_TABLE = "CREATE TABLE IF NOT EXISTS TeamDirectory (team_id INTEGER PRIMARY KEY, name TEXT, " \
+                              "state TEXT NOT NULL, checked REAL);"
+# a failed download never overwrites what an earlier check found
+UPSERT_TEAM_COMMAND = "INSERT INTO TeamDirectory VALUES(?, ?, ?, ?) ON CONFLICT(team_id) DO UPDATE SET " \
+                      "name=excluded.name, state=excluded.state, checked=excluded.checked " \
+                      "WHERE excluded.state!='failed' OR TeamDirectory.state='failed';"
+
+# states of an id in the directory
+FOUND = "found"
+MISSING = "missing"
+FAILED = "failed"
+
+
+def open_directory(file_name=TEAM_DIRECTORY_FILE_NAME):
+    """
+    :return connection: open sqlite connection to the directory, with the TeamDirectory table created if need be
+    """
+    connection = sqlite3.connect(file_name)
+    connection.execute(CREATE_TEAM_DIRECTORY_TABLE)
+    connection.commit()
+    return connection
+
+
+@timed_parser("TEAM_URL")
+def parse_team_name(source):
+    """
+    :param source: body of a team's homepage (TEAM_URL)
+    :return: name of the team, or None if the page doesn't have one
+    """
+    title = make_soup(source, "TEAM_URL").find("h1", class_="c-toolbar__title")
+    return title.text.strip() if title is not None else None
+
+
+def fetch_team(team_id):
+    """
+    :param team_id: collegeswimming.com team id
+    :return: (team_id, name, state) where state is FOUND, MISSING (no team has that id), or FAILED. Pages that fail to
+    load are tried again by the request scheduler (see scheduler.py) before the id is recorded as failed
+    """
+    try:
+        source = fetch_url(TEAM_URL.format(team_id))
+    except HTTPError as e:
+        if e.code == 404:
+            return team_id, None, MISSING
+        error = e
+    except RequestDeferred as e:
+        error = e
+    else:
+        name = parse_team_name(source)
+        return team_id, name, FOUND if name else MISSING
+    print("team {} failed ({})".format(team_id, error))
+    return team_id, None, FAILED
+
+
+def build_directory(team_ids, file_name=TEAM_DIRECTORY_FILE_NAME, workers=TEAM_DIRECTORY_WORKERS, refresh=False):
+    """
+    Downloads the homepage of every team id given and records what was found in the directory
+    :param team_ids: iterable of integer team ids to check
+    :param file_name: sqlite file the directory is kept in
+    :param workers: number of pages downloaded at the same time
+    :param refresh: if False, ids that were already checked are skipped (ids that failed are always checked again)
+    :return: (found, missing, failed) counts for the ids that were checked
+    """
+    connection = open_directory(file_name)
+    team_ids = list(team_ids)
+    if not refresh:
+        checked = {row[0] for row in connection.execute("SELECT team_id FROM TeamDirectory WHERE state!=?;", (FAILED,))}
+        team_ids = [team_id for team_id in team_ids if team_id not in checked]
+    print("Checking {} team ids".format(len(team_ids)))
+    counts = {FOUND: 0, MISSING: 0, FAILED: 0}
+    executor = ThreadPoolExecutor(max_workers=workers)
+    progress = ProgressDisplay()
+    try:
+        futures = [executor.submit(fetch_team, team_id) for team_id in team_ids]
+        for done, future in enumerate(as_completed(futures), 1):
+            team_id, name, state = future.result()
+            connection.execute(UPSERT_TEAM_COMMAND, (team_id, name, state, time.time()))
+            counts[state] += 1
+            if done % TEAM_DIRECTORY_CHECKPOINT == 0:
+                connection.commit()
+            progress.update(done, len(futures))
+        progress.finish(len(futures), len(futures))
+    finally:
+        # on Ctrl-C the pages that haven't started are dropped, and everything finished so far is kept
+        executor.shutdown(cancel_futures=True)
+        connection.commit()
+        connection.close()
+    print("{} teams found, {} ids without a team, {} failed".format(counts[FOUND], counts[MISSING], counts[FAILED]))
+    return counts[FOUND], counts[MISSING], counts[FAILED]
+
+
+def new_team_ids(count, file_name=TEAM_DIRECTORY_FILE_NAME):
+    """
+    :param count: how many ids to return
+    :return: list of the count ids after the biggest team id found so far
+    """
+    connection = open_directory(file_name)
+    biggest = connection.execute("SELECT coalesce(max(team_id), 0) FROM TeamDirectory WHERE state=?;",
+                                 (FOUND,)).fetchone()[0]
+    connection.close()
+    return list(range(biggest + 1, biggest + count + 1))
+
+
+def seed_from_team_dict(file_name=TEAM_DIRECTORY_FILE_NAME):
+    """
+    Records every team in team_dict.py as found, without downloading anything. Teams already in the directory are left
+    alone
+    """
+    from team_dict import TEAM_DICT
+    connection = open_directory(file_name)
+    connection.executemany("INSERT INTO TeamDirectory VALUES(?, ?, ?, NULL) ON CONFLICT(team_id) DO NOTHING;",
+                           [(team_id, name, FOUND) for name, team_id in TEAM_DICT.items()])
+    connection.commit()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the directory of collegeswimming.com teams")
+    parser.add_argument("--file", default=TEAM_DIRECTORY_FILE_NAME, help="sqlite file the directory is kept in")
+    parser.add_argument("--first", type=int, default=1, help="first team id to check")
+    parser.add_argument("--last", type=int, default=MAX_TEAM_ID, help="last team id to check")
+    parser.add_argument("--new", type=int, metavar="COUNT",
+                        help="check COUNT ids after the biggest team id found so far instead of --first to --last")
+    parser.add_argument("--refresh", action="store_true", help="check ids again even if they were checked before")
+    parser.add_argument("--seed", action="store_true", help="fill the directory from team_dict.py and stop")
+    parser.add_argument("--workers", type=int, default=TEAM_DIRECTORY_WORKERS)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_from_team_dict(args.file)
+        return
+    if args.new is not None:
+        team_ids = new_team_ids(args.new, args.file)
+    else:
+        team_ids = range(args.first, args.last + 1)
+    build_directory(team_ids, args.file, args.workers, args.refresh)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import bisect
+import difflib
+import os
+import re
+from constants import *
+
+########################################################################################################################
+# Looks up collegeswimming.com teams by name or id without importing the whole of team_dict.py. Teams are read from    #
+# the TeamDirectory table (see team_directory.py) the first time they are needed, and kept as a list sorted by         #
+# normalized name (lower case, no punctuation, "&" spelled out) so exact and prefix lookups are a binary search. The   #
+# first lookup in a directory with no teams (like on a new checkout) fills it in from team_dict.py, which only has to  #
+# happen once. It can also be filled in with python team_directory.py --seed, or built with python team_directory.py.  #
+########################################################################################################################
+
+
+def normalize_team_name(name):
+    """
+    :param name: a team name, as typed or as it appears on collegeswimming.com
+    :return: the name in lower case with "&" spelled out, punctuation removed, and runs of spaces made single
+    """
+    name = name.lower().replace("&", " and ")
+    return " ".join(re.sub(r"[^\w\s]", " ", name).split())
+
+
+class TeamIndex:
+    def __init__(self, teams):
+        """
+        :param teams: iterable of (name, team_id) pairs
+        """
+        # {team_id: name}
+        self.names = {}
+        # {normalized name: team_id}. If two teams share a name the bigger id wins, like in team_dict.py
+        self.team_ids = {}
+        for name, team_id in sorted(teams, key=lambda team: team[1]):
+            self.names[team_id] = name
+            self.team_ids[normalize_team_name(name)] = team_id
+        self.sorted_names = sorted(self.team_ids)
+
+    def team_id(self, name):
+        """
+        :param name: name of a team. Case, punctuation, and spacing don't matter
+        :return: the team's integer id
+        raises KeyError, naming the closest matches, if no team has that name
+        """
+        normalized = normalize_team_name(name)
+        if normalized in self.team_ids:
+            return self.team_ids[normalized]
+        suggestions = self.teams_like(name, limit=3)
+        if suggestions:
+            raise KeyError("No team named {!r}. Did you mean {}?".format(
+                name, " or ".join(repr(suggestion) for suggestion, team_id in suggestions)))
+        raise KeyError("No team named {!r}".format(name))
+
+    def team_name(self, team_id):
+        """
+        :return: name of the team with the integer id team_id, or None if there isn't one
+        """
+        return self.names.get(team_id)
+
+    def teams_starting_with(self, prefix, limit=None):
+        """
+        :param prefix: start of a team name. Case, punctuation, and spacing don't matter
+        :param limit: most teams to return, None for all of them
+        :return: list of (name, team_id) for every team whose name starts with prefix, in alphabetical order
+        """
+        prefix = normalize_team_name(prefix)
+        start = bisect.bisect_left(self.sorted_names, prefix)
+        matches = []
+        for normalized in self.sorted_names[start:]:
+            if not normalized.startswith(prefix) or (limit is not None and len(matches) == limit):
+                break
+            matches.append((self.names[self.team_ids[normalized]], self.team_ids[normalized]))
+        return matches
+
+    def teams_like(self, name, limit=5, cutoff=0.6):
+        """
+        :param name: name of a team, possibly misspelled
+        :param limit: most teams to return
+        :param cutoff: how alike (0 to 1) a team's name has to be to name to be returned
+        :return: list of (name, team_id) for the teams with names most like name, the closest first
+        """
+        matches = difflib.get_close_matches(normalize_team_name(name), self.sorted_names, limit, cutoff)
+        return [(self.names[self.team_ids[normalized]], self.team_ids[normalized]) for normalized in matches]
+
+
+def read_team_directory(file_name=TEAM_DIRECTORY_FILE_NAME):
+    """
+    :return: list of (name, team_id) for every team found in the directory. A directory with no teams is filled in from
+    team_dict.py first
+    raises RuntimeError if the directory still doesn't have any teams, since every lookup would fail
+    """
+    from team_directory import open_directory, seed_from_team_dict, FOUND
+    for attempt in range(2):
+        connection = open_directory(file_name)
+        teams = connection.execute("SELECT name, team_id FROM TeamDirectory WHERE state=?;", (FOUND,)).fetchall()
+        connection.close()
+        if teams or attempt:
+            break
+        print("The team directory {} has no teams, filling it in from team_dict.py".format(os.path.abspath(file_name)))
+        seed_from_team_dict(file_name)
+    if not teams:
+        raise RuntimeError("The team directory {} has no teams. Build it with \"python team_directory.py\""
+                           .format(os.path.abspath(file_name)))
+    return teams
+
+
+# the TeamIndex used by the functions below. Made on first use
+team_index = None
+
+
+def get_team_index():
+    global team_index
+    if team_index is None:
+        team_index = TeamIndex(read_team_directory())
+    return team_index
+
+
+def find_team_id(name):
+    """
+    :param name: name of a team (e.g. "Bucknell University"). Case, punctuation, and spacing don't matter
+    :return: the team's integer id
+    raises KeyError, naming the closest matches, if no team has that name
+    """
+    return get_team_index().team_id(name)
+
+
+def find_team_name(team_id):
+    """
+    :return: name of the team with the integer id team_id, or None if there isn't one
+    """
+    return get_team_index().team_name(team_id)
+
+
+def teams_starting_with(prefix, limit=None):
+    """
+    :return: list of (name, team_id) for every team whose name starts with prefix, in alphabetical order
+    """
+    return get_team_index().teams_starting_with(prefix, limit)
+
+
+def teams_like(name, limit=5):
+    """
+    :return: list of (name, team_id) for the teams with names most like name, the closest first
+    """
+    return get_team_index().teams_like(name, limit)
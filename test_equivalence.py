@@ -0,0 +1,167 @@
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+import process_swim_data
+from constants import *
+from benchmark_migrations import legacy_database, hot_queries, same_result, time_queries
+from benchmark_process_swim_data import synthetic_data, random_lineups
+from benchmark_taper import synthetic_database, legacy_find_taper_swims
+from get_swim_data import find_taper_swims
+from ingest import BulkIngestor, number_occurrences
+from migrations import migrate, schema_version, SCHEMA_VERSION
+from scoring_engine import ScoringEngine, score_events, score_matrix
+
+########################################################################################################################
+# Checks that the rewritten parts of the pipeline give the same results as the code they replaced, on small synthetic  #
+# inputs built the same way as in the benchmark_*.py scripts, without timing anything. Run with                        #
+#     python -m pytest test_equivalence.py                                                                             #
+########################################################################################################################
+
+# (swimmer_id, team_id, time, scaled, meet_id, gender, event, date, taper, snapshot_id) as BulkIngestor.add_swim takes
+# them. The last two are a prelim and a final swum in the same time
+SWIMS = [(1, 184, 25.31, 0, 100, "F", "150Y", 1546300800, 0, 1),
+         (1, 184, 24.97, 0, 101, "F", "150Y", 1546905600, 0, 1),
+         (2, 184, 61.02, 0, 100, "F", "1100Y", 1546300800, 0, 1),
+         (2, 184, 60.55, 0, 102, "F", "1100Y", 1547510400, 0, 1),
+         (2, 184, 60.55, 0, 102, "F", "1100Y", 1547510400, 0, 1)]
+
+
+def ingest(database_file_name, swims, incremental=False):
+    """
+    :return: the BulkIngestor that wrote swims to the migrated database
+    """
+    connection = sqlite3.connect(database_file_name)
+    migrate(connection)
+    ingestor = BulkIngestor(connection, incremental=incremental)
+    for swim in number_occurrences(swims):
+        ingestor.add_swim(*swim)
+    ingestor.commit()
+    connection.close()
+    return ingestor
+
+
+def stored_swims(database_file_name, columns="swimmer, event, meet_id, date, time, occurrence"):
+    connection = sqlite3.connect(database_file_name)
+    rows = sorted(connection.execute("SELECT {} FROM Swims;".format(columns)))
+    connection.close()
+    return rows
+
+
+def test_bulk_ingest_is_idempotent(tmp_path):
+    database_file_name = str(tmp_path / "swims.db")
+    ingest(database_file_name, SWIMS)
+    first = stored_swims(database_file_name)
+    # the prelim and the final are both kept
+    assert len(first) == len(SWIMS)
+    ingest(database_file_name, SWIMS)
+    assert stored_swims(database_file_name) == first
+
+
+def test_incremental_ingest_skips_swims_before_the_latest_stored(tmp_path):
+    database_file_name = str(tmp_path / "swims.db")
+    ingest(database_file_name, SWIMS)
+    older = (1, 184, 26.0, 0, 99, "F", "150Y", 1545696000, 0, 2)
+    same_day = (1, 184, 25.5, 0, 101, "F", "150Y", 1546905600, 0, 2)
+    newer = (1, 184, 24.5, 0, 103, "F", "150Y", 1548115200, 0, 2)
+    ingestor = ingest(database_file_name, [older, same_day, newer], incremental=True)
+    assert ingestor.skipped_swims == 1
+    times = [row[0] for row in stored_swims(database_file_name, "time")]
+    assert 26.0 not in times and 25.5 in times and 24.5 in times
+    connection = sqlite3.connect(database_file_name)
+    last_date = connection.execute("SELECT last_date FROM SyncState WHERE swimmer=1 AND event='F150Y';").fetchone()
+    connection.close()
+    assert last_date == (1548115200,)
+
+
+def test_score_events_matches_score_event():
+    rng = np.random.default_rng(0)
+    places = INDIVIDUAL_POINTS["Six Lane"]
+    for trial in range(500):
+        # times rounded to a few values, so there are plenty of ties within and between the teams
+        results_a = list(rng.integers(50, 60, rng.integers(0, 6)).astype(float))
+        results_b = list(rng.integers(50, 60, rng.integers(0, 6)).astype(float))
+        expected = process_swim_data.score_event(list(results_a), list(results_b), places, SCORER_LIMIT["Six Lane"][0])
+        times = np.array([results_a + results_b + [np.inf]])
+        is_team_a = np.arange(times.shape[-1]) < len(results_a)
+        score_a, score_b = score_events(times, is_team_a[None], np.array([places]),
+                                        np.array([SCORER_LIMIT["Six Lane"][0]]))
+        np.testing.assert_allclose([score_a, score_b], expected, rtol=1e-12)
+
+
+def test_scoring_engine_matches_calculate_pred_score():
+    swims, swimmers, teams, event_list = synthetic_data(400, 4, 6)
+    team_data = process_swim_data.get_athlete_data(swims, swimmers, teams, event_list)
+    performances = process_swim_data.get_predicted_performance_matrix(team_data, "average_time").round(1)
+    team_performances = [process_swim_data.filter_by_team(performances, swimmers, team_id)
+                         for team_id in swimmers["team_id"].unique()[:3]]
+    rng = np.random.default_rng(0)
+    lineups = [random_lineups(team, 4, rng) for team in team_performances]
+    frames = [[pd.DataFrame(lineup.astype(int), index=team.index, columns=team.columns) for lineup in team_lineups]
+              for team, team_lineups in zip(team_performances, lineups)]
+    engine = ScoringEngine(performances.columns)
+    for lineup_a in range(4):
+        for lineup_b in range(4):
+            team_a = (team_performances[0], frames[0][lineup_a])
+            team_b = (team_performances[1], frames[1][lineup_b])
+            expected = process_swim_data.calculate_pred_score(*team_a, *team_b)
+            np.testing.assert_allclose(engine.score_meet(team_a, team_b), expected, rtol=1e-12)
+            # the second time the lineups are already lowered
+            np.testing.assert_allclose(engine.score_meet(team_a, team_b), expected, rtol=1e-12)
+    # every team's score in a three team meet is the sum of its dual meet scores against the other two
+    payoffs = score_matrix(team_performances, lineups)
+    for combination in rng.integers(4, size=(10, 3)):
+        expected = np.zeros(3)
+        for team_a, team_b in [(0, 1), (0, 2), (1, 2)]:
+            expected[[team_a, team_b]] += process_swim_data.calculate_pred_score(
+                team_performances[team_a], frames[team_a][combination[team_a]],
+                team_performances[team_b], frames[team_b][combination[team_b]])
+        np.testing.assert_allclose(payoffs[tuple(combination)], expected, rtol=1e-12)
+
+
+def test_find_taper_swims_matches_old_loop(tmp_path):
+    legacy_file = str(tmp_path / "legacy.db")
+    current_file = str(tmp_path / "current.db")
+    synthetic_database(legacy_file, 4, 2, 10, 40)
+    shutil.copy(legacy_file, current_file)
+    tapers = []
+    for database_file_name, classify in [(legacy_file, legacy_find_taper_swims), (current_file, find_taper_swims)]:
+        connection = sqlite3.connect(database_file_name)
+        classify(connection.cursor(), DEFAULT_YEAR_START, DEFAULT_YEAR_START + 2, [1, 2, 3, 4])
+        connection.commit()
+        tapers.append(connection.execute("SELECT taper FROM Swims ORDER BY rowid;").fetchall())
+        connection.close()
+    assert tapers[0] == tapers[1]
+
+
+def test_migrations_keep_every_query_the_same(tmp_path):
+    legacy_file = str(tmp_path / "legacy.db")
+    migrated_file = str(tmp_path / "migrated.db")
+    _, meet_ids, swimmer_events = legacy_database(legacy_file, 3, 2, 4, 5)
+    shutil.copy(legacy_file, migrated_file)
+    connection = sqlite3.connect(migrated_file)
+    assert migrate(connection) == 0
+    assert schema_version(connection) == SCHEMA_VERSION
+    # a database that is up to date is left alone
+    assert migrate(connection) == SCHEMA_VERSION
+    connection.close()
+    queries = hot_queries(DEFAULT_YEAR_START, DEFAULT_YEAR_START + 2, [1, 2, 3], meet_ids, swimmer_events[:50])
+    for (name, query), (_, before), (_, after) in zip(queries, time_queries(legacy_file, queries),
+                                                       time_queries(migrated_file, queries)):
+        assert same_result(before, after), name
+
+
+def test_migrations_back_up_swims_stored_again(tmp_path):
+    database_file_name = str(tmp_path / "legacy.db")
+    legacy_database(database_file_name, 2, 1, 2, 3)
+    connection = sqlite3.connect(database_file_name)
+    swim_count = connection.execute("SELECT count(*) FROM Swims;").fetchone()[0]
+    # the same swim twice in one pull (a prelim and a final), and once more from a later pull
+    connection.execute("INSERT INTO Swims SELECT * FROM Swims WHERE rowid=1;")
+    connection.execute("INSERT INTO Swims SELECT swimmer, team, time, scaled, meet_id, event, date, taper, 2 "
+                       "FROM Swims WHERE rowid=1;")
+    connection.commit()
+    migrate(connection)
+    assert connection.execute("SELECT count(*) FROM Swims;").fetchone()[0] == swim_count + 1
+    assert connection.execute("SELECT snapshot FROM DuplicateSwims;").fetchall() == [(2,)]
+    connection.close()